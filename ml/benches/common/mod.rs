@@ -0,0 +1,41 @@
+//! Deterministic fixtures shared by the benches, included with `mod common;`.
+
+#![allow(dead_code)]
+
+use oort_ml_rust::dimensionality::graph::{SimilarityGraph, TopKBuilder};
+
+/// Xorshift64 generator, so every bench input is reproducible without a
+/// dependency on `rand`.
+pub struct XorShift(u64);
+
+impl XorShift {
+    pub fn new(seed: u64) -> Self {
+        Self(seed.max(1))
+    }
+
+    /// Uniform in `[-0.5, 0.5)`.
+    pub fn next_f32(&mut self) -> f32 {
+        self.0 ^= self.0 << 13;
+        self.0 ^= self.0 >> 7;
+        self.0 ^= self.0 << 17;
+        (self.0 >> 40) as f32 / (1u64 << 24) as f32 - 0.5
+    }
+}
+
+/// Deterministic positions in the same [-5, 5] cube PCA initialization uses.
+pub fn synthetic_positions(n: usize) -> Vec<[f32; 3]> {
+    let mut rng = XorShift::new(0x9E3779B97F4A7C15);
+    let mut next = || rng.next_f32() * 10.0;
+    (0..n).map(|_| [next(), next(), next()]).collect()
+}
+
+/// Ring lattice with decaying weights, so every node has ~`neighbors` edges.
+pub fn synthetic_graph(n: usize, neighbors: usize) -> SimilarityGraph {
+    let mut builder = TopKBuilder::new(n, neighbors, 0.0);
+    for i in 0..n {
+        for offset in 1..=neighbors / 2 {
+            builder.offer(i, (i + offset) % n, 1.0 / (offset as f32 + 1.0));
+        }
+    }
+    builder.build()
+}
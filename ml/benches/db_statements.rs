@@ -0,0 +1,71 @@
+//! Unprepared against prepared statement throughput on a live Cassandra.
+//!
+//! Needs a node with the `db/data.cql` schema, e.g. the compose database:
+//!
+//! ```text
+//! docker compose up -d oort-db cassandra-init
+//! DB_BENCH_NODES=localhost:9042 cargo bench --bench db_statements
+//! ```
+//!
+//! Without a reachable node the benchmark is skipped.
+
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use oort_ml_rust::data::client::DatabaseClient;
+use tokio::runtime::Runtime;
+
+const BENCH_USER: &str = "6f1c2f0e-4b1a-4c3e-9a51-1b2c3d4e5f60";
+
+/// Rows written per iteration, one INSERT each.
+const ROWS: [usize; 2] = [16, 128];
+
+fn positions(n: usize) -> Vec<(String, [f32; 3])> {
+    (0..n)
+        .map(|i| (format!("bench concept {}", i), [i as f32, 0.5, -1.0]))
+        .collect()
+}
+
+fn bench_statements(c: &mut Criterion) {
+    let runtime = Runtime::new().unwrap();
+    let nodes = std::env::var("DB_BENCH_NODES").unwrap_or_else(|_| "localhost:9042".to_string());
+    let node_list: Vec<&str> = nodes.split(',').collect();
+
+    let connect = |prepared: bool| {
+        runtime
+            .block_on(DatabaseClient::new(&node_list))
+            .map(|client| client.with_prepared_statements(prepared))
+    };
+    let (unprepared, prepared) = match (connect(false), connect(true)) {
+        (Ok(unprepared), Ok(prepared)) => (unprepared, prepared),
+        (Err(e), _) | (_, Err(e)) => {
+            eprintln!("Skipping db_statements, no Cassandra at {}: {}", nodes, e);
+            return;
+        }
+    };
+
+    let mut group = c.benchmark_group("db_statements");
+    group.sample_size(20);
+
+    for &n in &ROWS {
+        let rows = positions(n);
+        group.throughput(Throughput::Elements(n as u64));
+
+        for (label, client) in [("unprepared", &unprepared), ("prepared", &prepared)] {
+            group.bench_function(BenchmarkId::new(format!("insert_{}", label), n), |b| {
+                b.iter(|| {
+                    runtime
+                        .block_on(client.save_concept_positions(BENCH_USER, &rows))
+                        .unwrap()
+                })
+            });
+            group.bench_function(BenchmarkId::new(format!("select_{}", label), n), |b| {
+                b.iter(|| runtime.block_on(client.get_concept_positions(BENCH_USER)).unwrap())
+            });
+        }
+    }
+
+    group.finish();
+    eprintln!("Prepared statement cache: {:?}", prepared.statement_stats());
+}
+
+criterion_group!(benches, bench_statements);
+criterion_main!(benches);
@@ -0,0 +1,270 @@
+//! Per-stage timings of the mind map pipeline on synthetic clustered
+//! embeddings: merge, similarity graph, PCA seeding and the physics step,
+//! plus end-to-end `process_concepts` against `ForceParams::iterations`.
+//!
+//! Each stage is run once per input before timing to report its peak heap
+//! growth, measured by a counting global allocator (OpenBLAS scratch buffers
+//! are allocated outside it and not included).
+//!
+//! Run with `cargo bench --bench dimensionality`. Sizes above 10k nodes are
+//! skipped unless `DIM_BENCH_MAX_NODES` is raised (e.g. to 50000).
+
+mod common;
+
+use common::XorShift;
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion};
+use ndarray::{Array1, Array2};
+use oort_ml_rust::dimensionality::graph::TopKBuilder;
+use oort_ml_rust::dimensionality::pca::randomized_pca;
+use oort_ml_rust::dimensionality::similarity::{for_each_pair, normalize_rows};
+use oort_ml_rust::dimensionality::{ForceParams, MindMapProcessor};
+use oort_ml_rust::models::concepts::Concept;
+use oort_ml_rust::models::embeddings::Embedding;
+use std::alloc::{GlobalAlloc, Layout, System};
+use std::sync::atomic::{AtomicUsize, Ordering};
+
+const NODE_COUNTS: [usize; 5] = [100, 1_000, 5_000, 10_000, 50_000];
+const DIMS: [usize; 2] = [384, 1024];
+const ITERATIONS: [usize; 2] = [50, 150];
+const END_TO_END_NODES: usize = 2_000;
+
+struct PeakAlloc;
+
+static CURRENT: AtomicUsize = AtomicUsize::new(0);
+static PEAK: AtomicUsize = AtomicUsize::new(0);
+
+fn record_growth(bytes: usize) {
+    let now = CURRENT.fetch_add(bytes, Ordering::Relaxed) + bytes;
+    PEAK.fetch_max(now, Ordering::Relaxed);
+}
+
+unsafe impl GlobalAlloc for PeakAlloc {
+    unsafe fn alloc(&self, layout: Layout) -> *mut u8 {
+        let ptr = System.alloc(layout);
+        if !ptr.is_null() {
+            record_growth(layout.size());
+        }
+        ptr
+    }
+
+    unsafe fn dealloc(&self, ptr: *mut u8, layout: Layout) {
+        System.dealloc(ptr, layout);
+        CURRENT.fetch_sub(layout.size(), Ordering::Relaxed);
+    }
+
+    unsafe fn realloc(&self, ptr: *mut u8, layout: Layout, new_size: usize) -> *mut u8 {
+        let new_ptr = System.realloc(ptr, layout, new_size);
+        if !new_ptr.is_null() {
+            if new_size > layout.size() {
+                record_growth(new_size - layout.size());
+            } else {
+                CURRENT.fetch_sub(layout.size() - new_size, Ordering::Relaxed);
+            }
+        }
+        new_ptr
+    }
+}
+
+#[global_allocator]
+static ALLOCATOR: PeakAlloc = PeakAlloc;
+
+/// Runs `f` once and prints how far the heap grew above its starting size.
+fn report_peak<T>(stage: &str, n: usize, dim: usize, f: impl FnOnce() -> T) -> T {
+    let baseline = CURRENT.load(Ordering::Relaxed);
+    PEAK.store(baseline, Ordering::Relaxed);
+    let result = f();
+    let peak = PEAK.load(Ordering::Relaxed).saturating_sub(baseline);
+    eprintln!(
+        "{} n = {} dim = {}: peak heap +{:.1} MiB",
+        stage,
+        n,
+        dim,
+        peak as f64 / (1024.0 * 1024.0)
+    );
+    result
+}
+
+fn max_nodes() -> usize {
+    std::env::var("DIM_BENCH_MAX_NODES")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(10_000)
+}
+
+fn node_counts() -> impl Iterator<Item = usize> {
+    let max = max_nodes();
+    NODE_COUNTS.into_iter().filter(move |&n| n <= max)
+}
+
+/// Concepts drawn around `n / 20` cluster centres; every tenth concept is a
+/// near-duplicate of its predecessor so the merge stage has work to do.
+fn synthetic_concepts(n: usize, dim: usize) -> (Vec<Concept>, Vec<Embedding>) {
+    let mut rng = XorShift::new(0x853C49E6748FEA9Bu64 ^ (n as u64) ^ ((dim as u64) << 32));
+    let mut next = move || rng.next_f32();
+
+    let clusters = (n / 20).max(1);
+    let centres = Array2::from_shape_fn((clusters, dim), |_| next());
+
+    let mut concepts = Vec::with_capacity(n);
+    let mut embeddings: Vec<Embedding> = Vec::with_capacity(n);
+    for i in 0..n {
+        let embedding = if i % 10 == 9 {
+            embeddings[i - 1].mapv(|v| v + 0.01 * next())
+        } else {
+            let mut e: Array1<f32> = centres.row(i % clusters).to_owned();
+            e.mapv_inplace(|v| v + 0.6 * next());
+            e
+        };
+        concepts.push(Concept {
+            concept: format!("concept {}", i),
+            importance: 0.5 + 0.5 * next(),
+        });
+        embeddings.push(embedding);
+    }
+
+    (concepts, embeddings)
+}
+
+fn bench_merge(c: &mut Criterion) {
+    let mut group = c.benchmark_group("merge");
+    group.sample_size(10);
+
+    for dim in DIMS {
+        for n in node_counts() {
+            let (concepts, embeddings) = synthetic_concepts(n, dim);
+            let processor = MindMapProcessor::new(None);
+            report_peak("merge", n, dim, || {
+                processor.merge_similar_concepts(&concepts, &embeddings).unwrap()
+            });
+
+            group.bench_function(BenchmarkId::new(format!("{}d", dim), n), |b| {
+                b.iter(|| processor.merge_similar_concepts(&concepts, &embeddings).unwrap())
+            });
+        }
+    }
+
+    group.finish();
+}
+
+fn bench_similarity(c: &mut Criterion) {
+    let mut group = c.benchmark_group("similarity_graph");
+    group.sample_size(10);
+    let params = ForceParams::default();
+
+    let build = |normalized: &Array2<f32>| {
+        let mut builder =
+            TopKBuilder::new(normalized.nrows(), params.max_neighbors, params.similarity_floor);
+        for_each_pair(normalized, |i, j, sim| builder.offer(i, j, sim));
+        builder.build()
+    };
+
+    for dim in DIMS {
+        for n in node_counts() {
+            let (_, embeddings) = synthetic_concepts(n, dim);
+            let normalized = normalize_rows(embeddings.iter().map(|e| e.view())).unwrap();
+            report_peak("similarity_graph", n, dim, || build(&normalized));
+
+            group.bench_function(BenchmarkId::new(format!("{}d", dim), n), |b| {
+                b.iter(|| build(&normalized))
+            });
+        }
+    }
+
+    group.finish();
+}
+
+fn bench_pca(c: &mut Criterion) {
+    let mut group = c.benchmark_group("pca_seed");
+    group.sample_size(10);
+
+    for dim in DIMS {
+        for n in node_counts() {
+            let (_, embeddings) = synthetic_concepts(n, dim);
+            let normalized = normalize_rows(embeddings.iter().map(|e| e.view())).unwrap();
+            report_peak("pca_seed", n, dim, || randomized_pca(&normalized, 3).unwrap());
+
+            group.bench_function(BenchmarkId::new(format!("{}d", dim), n), |b| {
+                b.iter(|| randomized_pca(&normalized, 3).unwrap())
+            });
+        }
+    }
+
+    group.finish();
+}
+
+fn bench_physics(c: &mut Criterion) {
+    let mut group = c.benchmark_group("physics_step");
+    group.sample_size(10);
+    let params = ForceParams::default();
+
+    // Positions and graph depend only on n; one embedding width is enough
+    let dim = DIMS[0];
+    for n in node_counts() {
+        let (_, embeddings) = synthetic_concepts(n, dim);
+        let normalized = normalize_rows(embeddings.iter().map(|e| e.view())).unwrap();
+        let mut builder =
+            TopKBuilder::new(n, params.max_neighbors, params.similarity_floor);
+        for_each_pair(&normalized, |i, j, sim| builder.offer(i, j, sim));
+        let graph = builder.build();
+
+        let positions: Vec<[f32; 3]> = randomized_pca(&normalized, 3)
+            .unwrap()
+            .rows()
+            .into_iter()
+            .map(|r| [r[0] * 5.0, r[1] * 5.0, r[2] * 5.0])
+            .collect();
+
+        let mut processor = MindMapProcessor::new(None);
+        report_peak("physics_step", n, dim, || processor.relax(&positions, &graph, 1));
+
+        group.bench_function(BenchmarkId::from_parameter(n), |b| {
+            b.iter(|| processor.relax(&positions, &graph, 1))
+        });
+    }
+
+    group.finish();
+}
+
+fn bench_end_to_end(c: &mut Criterion) {
+    let mut group = c.benchmark_group("process_concepts");
+    group.sample_size(10);
+
+    for dim in DIMS {
+        let (concepts, embeddings) = synthetic_concepts(END_TO_END_NODES, dim);
+
+        for iterations in ITERATIONS {
+            let params = ForceParams {
+                iterations,
+                ..ForceParams::default()
+            };
+            report_peak("process_concepts", END_TO_END_NODES, dim, || {
+                MindMapProcessor::new(Some(params.clone()))
+                    .process_concepts(&concepts, &embeddings)
+                    .unwrap()
+            });
+
+            group.bench_function(
+                BenchmarkId::new(format!("{}d_{}_nodes", dim, END_TO_END_NODES), iterations),
+                |b| {
+                    b.iter(|| {
+                        MindMapProcessor::new(Some(params.clone()))
+                            .process_concepts(&concepts, &embeddings)
+                            .unwrap()
+                    })
+                },
+            );
+        }
+    }
+
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    bench_merge,
+    bench_similarity,
+    bench_pca,
+    bench_physics,
+    bench_end_to_end
+);
+criterion_main!(benches);
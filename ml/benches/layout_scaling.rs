@@ -0,0 +1,50 @@
+//! Scaling of one force-directed physics step from 1 to N layout threads.
+//!
+//! Run with `cargo bench --bench layout_scaling`.
+
+mod common;
+
+use common::{synthetic_graph, synthetic_positions};
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion};
+use oort_ml_rust::dimensionality::executor::physics_thread_pool;
+use oort_ml_rust::dimensionality::MindMapProcessor;
+
+const NODE_COUNTS: [usize; 3] = [1_000, 5_000, 20_000];
+const NEIGHBORS: usize = 16;
+
+fn thread_counts() -> Vec<usize> {
+    let max = std::thread::available_parallelism().map_or(1, |n| n.get());
+    let mut counts: Vec<usize> = std::iter::successors(Some(1), |&t| Some(t * 2))
+        .take_while(|&t| t < max)
+        .collect();
+    counts.push(max);
+    counts
+}
+
+fn bench_physics_step(c: &mut Criterion) {
+    let mut group = c.benchmark_group("physics_step");
+    group.sample_size(10);
+
+    for &n in &NODE_COUNTS {
+        let positions = synthetic_positions(n);
+        let graph = synthetic_graph(n, NEIGHBORS);
+
+        for threads in thread_counts() {
+            let mut processor = MindMapProcessor::new(None);
+            if let Some(pool) = physics_thread_pool(threads) {
+                processor = processor.with_thread_pool(pool);
+            }
+
+            group.bench_with_input(
+                BenchmarkId::new(format!("{}_nodes", n), threads),
+                &threads,
+                |b, _| b.iter(|| processor.relax(&positions, &graph, 1)),
+            );
+        }
+    }
+
+    group.finish();
+}
+
+criterion_group!(benches, bench_physics_step);
+criterion_main!(benches);
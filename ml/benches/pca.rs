@@ -0,0 +1,67 @@
+//! Randomized truncated PCA against the full linfa fit on normalized
+//! embedding blocks, reporting speed and per-component projection agreement.
+//!
+//! Run with `cargo bench --bench pca`.
+
+mod common;
+
+use common::XorShift;
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion};
+use ndarray::{Array2, ArrayView1};
+use oort_ml_rust::dimensionality::pca::{linfa_pca, randomized_pca};
+use oort_ml_rust::dimensionality::similarity::normalize_rows;
+
+const SIZES: [usize; 3] = [500, 2_000, 5_000];
+const EMBEDDING_DIM: usize = 1024;
+
+/// Embedding-like block: a handful of latent topics mixed with noise,
+/// normalized the same way the layout normalizes embeddings.
+fn synthetic_block(n: usize) -> Array2<f32> {
+    let mut rng = XorShift::new(0x2545F4914F6CDD1D);
+    let mut next = move || rng.next_f32();
+
+    let topics = Array2::from_shape_fn((8, EMBEDDING_DIM), |_| next());
+    let rows: Vec<ndarray::Array1<f32>> = (0..n)
+        .map(|i| {
+            let mut row = topics.row(i % 8).to_owned() * (1.0 + (i % 5) as f32);
+            row += &topics.row((i * 3 + 1) % 8);
+            row.mapv_inplace(|v| v + 0.2 * next());
+            row
+        })
+        .collect();
+    normalize_rows(rows.iter().map(|r| r.view())).unwrap()
+}
+
+fn abs_correlation(a: ArrayView1<f32>, b: ArrayView1<f32>) -> f32 {
+    let a = &a - a.mean().unwrap();
+    let b = &b - b.mean().unwrap();
+    (a.dot(&b) / (a.dot(&a).sqrt() * b.dot(&b).sqrt())).abs()
+}
+
+fn bench_pca(c: &mut Criterion) {
+    let mut group = c.benchmark_group("pca_3_components");
+    group.sample_size(10);
+
+    for &n in &SIZES {
+        let block = synthetic_block(n);
+
+        let fast = randomized_pca(&block, 3).unwrap();
+        let reference = linfa_pca(&block, 3).unwrap();
+        let agreement: Vec<String> = (0..3)
+            .map(|c| format!("{:.4}", abs_correlation(fast.column(c), reference.column(c))))
+            .collect();
+        eprintln!("n = {}: |corr| per component (randomized vs linfa) = [{}]", n, agreement.join(", "));
+
+        group.bench_with_input(BenchmarkId::new("randomized", n), &block, |b, block| {
+            b.iter(|| randomized_pca(block, 3).unwrap())
+        });
+        group.bench_with_input(BenchmarkId::new("linfa", n), &block, |b, block| {
+            b.iter(|| linfa_pca(block, 3).unwrap())
+        });
+    }
+
+    group.finish();
+}
+
+criterion_group!(benches, bench_pca);
+criterion_main!(benches);
@@ -0,0 +1,49 @@
+//! Structure-of-arrays physics kernel against the original array-of-structs
+//! path, single-threaded so the difference is the memory layout and
+//! vectorization rather than parallelism.
+//!
+//! Run with `cargo bench --bench physics_kernel`.
+
+mod common;
+
+use common::{synthetic_graph, synthetic_positions};
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion};
+use oort_ml_rust::dimensionality::{ForceParams, MindMapProcessor, PhysicsKernel, RepulsionMode};
+
+const NEIGHBORS: usize = 16;
+
+/// (repulsion mode, node counts) pairs; exact repulsion is O(n²) per step.
+const CASES: [(RepulsionMode, &[usize]); 2] = [
+    (RepulsionMode::Exact, &[500, 2_000, 5_000]),
+    (RepulsionMode::BarnesHut, &[5_000, 20_000]),
+];
+
+fn bench_kernels(c: &mut Criterion) {
+    let mut group = c.benchmark_group("physics_kernel");
+    group.sample_size(10);
+
+    for (mode, sizes) in CASES {
+        for &n in sizes {
+            let positions = synthetic_positions(n);
+            let graph = synthetic_graph(n, NEIGHBORS);
+
+            for kernel in [PhysicsKernel::Aos, PhysicsKernel::Soa] {
+                let mut processor = MindMapProcessor::new(Some(ForceParams {
+                    repulsion_mode: mode,
+                    physics_kernel: kernel,
+                    ..ForceParams::default()
+                }));
+
+                group.bench_function(
+                    BenchmarkId::new(format!("{:?}_{:?}", mode, kernel), n),
+                    |b| b.iter(|| processor.relax(&positions, &graph, 1)),
+                );
+            }
+        }
+    }
+
+    group.finish();
+}
+
+criterion_group!(benches, bench_kernels);
+criterion_main!(benches);
@@ -0,0 +1,96 @@
+//! Binary scene encoding against the JSON it replaces, on the frontend's
+//! mock scene scaled up to shareable-map sizes. Reports encoded sizes next
+//! to the encode/decode timings.
+//!
+//! Run with `cargo bench --bench scene_codec`.
+
+use criterion::{criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use oort_ml_rust::data::scene::{decode_scene, encode_scene};
+use oort_ml_rust::dimensionality::ConceptGroup;
+
+const SIZES: [usize; 3] = [100, 1_000, 10_000];
+
+/// Neighbours per planet, about what the layout keeps.
+const CONNECTIONS: usize = 8;
+
+fn mock_scene() -> Vec<ConceptGroup> {
+    let path = concat!(env!("CARGO_MANIFEST_DIR"), "/../apps/frontend/src/mocks/simulation.json");
+    let json = std::fs::read_to_string(path).expect("frontend mock scene");
+    let planets: Vec<serde_json::Value> = serde_json::from_str(&json).unwrap();
+
+    planets
+        .iter()
+        .enumerate()
+        .map(|(i, planet)| ConceptGroup {
+            concepts: serde_json::from_value(planet["concepts"].clone()).unwrap(),
+            reduced_embedding: serde_json::from_value(planet["reduced_embedding"].clone()).unwrap(),
+            connections: Vec::new(),
+            connection_weights: Vec::new(),
+            importance_score: 0.5,
+            group_id: planet["cluster"].as_u64().unwrap_or(i as u64) as usize,
+        })
+        .collect()
+}
+
+/// `n` planets cycling through the mock ones, spread out and renamed per
+/// copy, each linked to nearby indices as the layout's connections are.
+fn scaled_scene(mock: &[ConceptGroup], n: usize) -> Vec<ConceptGroup> {
+    (0..n)
+        .map(|i| {
+            let base = &mock[i % mock.len()];
+            let copy = i / mock.len();
+            let offset = copy as f32 * 0.37;
+            let connections: Vec<usize> = (1..=CONNECTIONS)
+                .map(|k| (i + k * k) % n)
+                .filter(|&j| j != i)
+                .collect::<std::collections::BTreeSet<_>>()
+                .into_iter()
+                .collect();
+            ConceptGroup {
+                concepts: base.concepts.iter().map(|c| format!("{} {}", c, copy)).collect(),
+                reduced_embedding: base.reduced_embedding.iter().map(|v| v + offset).collect(),
+                connection_weights: connections.iter().map(|&j| 0.5 + (j % 50) as f32 / 100.0).collect(),
+                connections,
+                importance_score: 0.2 + (i % 7) as f32 / 10.0,
+                group_id: i,
+            }
+        })
+        .collect()
+}
+
+fn bench_scene_codec(c: &mut Criterion) {
+    let mock = mock_scene();
+    let mut group = c.benchmark_group("scene_codec");
+
+    for &n in &SIZES {
+        let scene = scaled_scene(&mock, n);
+        let json = serde_json::to_vec(&scene).unwrap();
+        let binary = encode_scene(&scene).unwrap();
+        eprintln!(
+            "{} planets: JSON {} bytes, binary {} bytes ({:.1}x smaller)",
+            n,
+            json.len(),
+            binary.len(),
+            json.len() as f64 / binary.len() as f64
+        );
+
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_function(BenchmarkId::new("encode_json", n), |b| {
+            b.iter(|| serde_json::to_vec(&scene).unwrap())
+        });
+        group.bench_function(BenchmarkId::new("encode_binary", n), |b| {
+            b.iter(|| encode_scene(&scene).unwrap())
+        });
+        group.bench_function(BenchmarkId::new("decode_json", n), |b| {
+            b.iter(|| serde_json::from_slice::<Vec<ConceptGroup>>(&json).unwrap())
+        });
+        group.bench_function(BenchmarkId::new("decode_binary", n), |b| {
+            b.iter(|| decode_scene(&binary).unwrap())
+        });
+    }
+
+    group.finish();
+}
+
+criterion_group!(benches, bench_scene_codec);
+criterion_main!(benches);
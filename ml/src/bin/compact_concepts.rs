@@ -0,0 +1,63 @@
+//! One-off job collapsing duplicate `store.user_concepts` rows, left from
+//! before concept ids were derived from the concept text.
+//!
+//! ```text
+//! DB_NODES=localhost:9042 cargo run --release --bin compact_concepts [USER_ID...]
+//! ```
+//!
+//! Without user ids every user with stored concepts is compacted.
+
+use log::{error, info};
+use oort_ml_rust::data::client::{CompactionReport, DatabaseClient};
+
+#[tokio::main]
+async fn main() {
+    env_logger::init_from_env(env_logger::Env::new().default_filter_or("info"));
+
+    let db_nodes_str = std::env::var("DB_NODES").unwrap_or_else(|_| "oort-db:9042".to_string());
+    let db_nodes: Vec<&str> = db_nodes_str.split(',').collect();
+    let db_client = match DatabaseClient::new(&db_nodes).await {
+        Ok(client) => client,
+        Err(e) => {
+            eprintln!("Failed to connect to database: {:?}", e);
+            std::process::exit(1);
+        }
+    };
+
+    let mut user_ids: Vec<String> = std::env::args().skip(1).collect();
+    if user_ids.is_empty() {
+        match db_client.concept_user_ids().await {
+            Ok(ids) => user_ids = ids.iter().map(|id| id.to_string()).collect(),
+            Err(e) => {
+                eprintln!("Failed to list users: {:?}", e);
+                std::process::exit(1);
+            }
+        }
+    }
+    info!("Compacting concepts of {} users", user_ids.len());
+
+    let mut total = CompactionReport::default();
+    let mut failed = 0;
+    for user_id in &user_ids {
+        match db_client.compact_user_concepts(user_id).await {
+            Ok(report) => {
+                total.rows += report.rows;
+                total.distinct += report.distinct;
+                total.collapsed += report.collapsed;
+                total.removed += report.removed;
+            }
+            Err(e) => {
+                error!("Failed to compact concepts of user {}: {:?}", user_id, e);
+                failed += 1;
+            }
+        }
+    }
+
+    info!(
+        "Done: {} rows, {} distinct concepts, {} collapsed, {} rows removed, {} users failed",
+        total.rows, total.distinct, total.collapsed, total.removed, failed
+    );
+    if failed > 0 {
+        std::process::exit(1);
+    }
+}
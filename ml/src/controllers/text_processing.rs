@@ -1,14 +1,25 @@
-use actix_web::{web, HttpResponse, Responder};
+use actix_web::http::header::{CacheControl, CacheDirective, ContentType, ETag, EntityTag, Header, IfNoneMatch};
+use actix_web::{web, HttpRequest, HttpResponse, Responder};
 use log::{error, info};
 use serde::{Deserialize, Serialize};
 use std::sync::Arc;
 use uuid::Uuid;
-use crate::data::cdn::github::GitHubCDN;
-use crate::data::client::{DatabaseClient, TextReference};
+use crate::data::client::{DatabaseClient, TextReference, UserConcepts};
+use crate::data::concept_cache::{ConceptCacheStats, UserConceptCache};
+use crate::data::nodes::NodeStats;
+use crate::data::scene_cache::{CachedScene, SceneCache, SceneCacheStats};
+use crate::data::statements::StatementCacheStats;
+use crate::data::write_behind::{WriteBehind, WriteBehindStats, WriteJob};
 use crate::data::scraper::{ArticleScraper, derive_filename};
-use crate::dimensionality::{self, ConceptGroup};
+use crate::dimensionality::cache::{LayoutCache, LayoutCacheStats};
+use crate::dimensionality::executor::{LayoutPool, LayoutPoolStats};
+use crate::dimensionality::hnsw::IndexRegistry;
+use crate::dimensionality::edges::CompactEdges;
+use crate::dimensionality::regroup::RegroupStore;
+use crate::dimensionality::{self, ConceptGroup, ForceParams, PreviousPositions};
 use crate::error::ApiError;
-use crate::models::concepts::KeywordExtractor;
+use crate::models::concepts::{Concept, KeywordExtractor};
+use crate::models::embeddings::Embedding;
 
 #[derive(Debug, Deserialize)]
 pub struct TextInput {
@@ -16,6 +27,35 @@ pub struct TextInput {
     pub url: Option<String>,
     pub user_id: Option<String>,
     pub filename: Option<String>,
+    /// Similarity above which concepts are merged into one group.
+    pub merge_threshold: Option<f32>,
+    #[serde(default)]
+    pub edge_format: EdgeFormat,
+}
+
+#[derive(Debug, Deserialize)]
+pub struct RegroupInput {
+    pub user_id: String,
+    pub merge_threshold: f32,
+    #[serde(default)]
+    pub edge_format: EdgeFormat,
+}
+
+/// How connections between groups are returned in layout responses.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Deserialize)]
+#[serde(rename_all = "lowercase")]
+pub enum EdgeFormat {
+    /// A `connections` index list on every group.
+    #[default]
+    Lists,
+    /// One delta-encoded edge list with quantized weights for the whole layout.
+    Compact,
+}
+
+#[derive(Debug, Serialize)]
+pub struct CompactLayout {
+    pub groups: Vec<ConceptGroup>,
+    pub edges: CompactEdges,
 }
 
 #[derive(Debug, Deserialize)]
@@ -35,6 +75,220 @@ pub struct AppState {
     pub embedding_model: Arc<crate::models::embeddings::EmbeddingModel>,
     pub db_client: Arc<DatabaseClient>,
     pub scraper: Arc<ArticleScraper>,
+    /// Per-user HNSW indexes for concept merging, extended as concepts are saved.
+    pub concept_indexes: Arc<IndexRegistry>,
+    /// Bounded pool that runs layouts off the HTTP worker threads.
+    pub layout_pool: Arc<LayoutPool>,
+    /// Finished layouts keyed by concept set, embedding model and parameters.
+    pub layout_cache: Arc<LayoutCache>,
+    /// Dendrogram of each user's last layout, for re-grouping without a new layout.
+    pub regroupings: Arc<RegroupStore>,
+    /// Decoded concepts and embeddings of recently active users.
+    pub concept_cache: Arc<UserConceptCache>,
+    /// Serialized responses of recently requested scenes.
+    pub scene_cache: Arc<SceneCache>,
+    /// Bounded, spooled queue for writes made after the response is sent.
+    pub write_behind: Arc<WriteBehind>,
+}
+
+#[derive(Debug, Serialize)]
+pub struct LayoutMetrics {
+    pub pool: LayoutPoolStats,
+    pub cache: LayoutCacheStats,
+}
+
+#[derive(Debug, Serialize)]
+pub struct DatabaseMetrics {
+    pub nodes: Vec<NodeStats>,
+    pub statements: StatementCacheStats,
+    pub concept_cache: ConceptCacheStats,
+    pub scene_cache: SceneCacheStats,
+    pub write_behind: WriteBehindStats,
+}
+
+/// Loads a user's stored concepts and their last layout positions concurrently.
+/// Missing positions only cost a full layout, so their errors are not fatal.
+async fn load_user_concepts_and_positions(
+    state: &AppState,
+    user_id: &str,
+) -> Result<(Arc<UserConcepts>, PreviousPositions), ApiError> {
+    let (user_concepts, positions) = tokio::join!(
+        load_user_concepts(state, user_id),
+        state.db_client.get_concept_positions(user_id),
+    );
+
+    let positions = positions.unwrap_or_else(|e| {
+        error!("Failed to load concept positions, running full layout: {:?}", e);
+        PreviousPositions::new()
+    });
+
+    Ok((user_concepts?, positions))
+}
+
+/// A user's concepts from the concept cache, reading Cassandra only on a miss
+/// or when the cached version is out of date. Embeddings still in the legacy
+/// list column are migrated in the background.
+async fn load_user_concepts(state: &AppState, user_id: &str) -> Result<Arc<UserConcepts>, ApiError> {
+    let cached = state.concept_cache.get(user_id);
+    if let Some(cached) = &cached {
+        if cached.fresh {
+            return Ok(Arc::clone(&cached.concepts));
+        }
+    }
+
+    let version = match state.db_client.get_concept_version(user_id).await {
+        Ok(version) => Some(version),
+        Err(e) => {
+            error!("Failed to read concept version, bypassing the concept cache: {:?}", e);
+            None
+        }
+    };
+    if let (Some(cached), Some(version)) = (cached, version) {
+        if state.concept_cache.confirm(user_id, version) {
+            return Ok(cached.concepts);
+        }
+    }
+
+    let user_concepts = Arc::new(state.db_client.get_user_concepts(user_id).await?);
+    if user_concepts.legacy_rows > 0 {
+        let db_client = Arc::clone(&state.db_client);
+        let user_id = user_id.to_string();
+        tokio::spawn(async move {
+            if let Err(e) = db_client.migrate_embedding_blobs(&user_id).await {
+                error!("Failed to migrate embeddings to blobs: {:?}", e);
+            }
+        });
+    }
+    if let Some(version) = version {
+        state.concept_cache.put(user_id, Arc::clone(&user_concepts), version);
+    }
+    Ok(user_concepts)
+}
+
+/// Adds new concepts to the user's cached set and HNSW index right away and
+/// queues them for saving. A save given up on drops the cached set, so the
+/// next request reads what actually reached Cassandra.
+async fn save_new_concepts(state: &AppState, user_id: &str, concepts: &[Concept], embeddings: &[Embedding]) {
+    state.concept_cache.append(user_id, concepts, embeddings);
+    state.concept_indexes.update(
+        user_id,
+        concepts
+            .iter()
+            .zip(embeddings)
+            .filter_map(|(c, e)| Some((c.concept.as_str(), e.as_slice()?))),
+    );
+    state
+        .write_behind
+        .enqueue(WriteJob::save_concepts(user_id, concepts, embeddings))
+        .await;
+}
+
+/// Persists positions that changed in this layout so the next one can warm-start.
+async fn save_moved_positions(state: &AppState, user_id: Option<&str>, moved: Vec<(String, [f32; 3])>) {
+    let Some(user_id) = user_id else {
+        return;
+    };
+    if moved.is_empty() {
+        return;
+    }
+
+    let job = WriteJob::SavePositions {
+        user_id: user_id.to_string(),
+        positions: moved,
+    };
+    state.write_behind.enqueue(job).await;
+}
+
+fn check_merge_threshold(threshold: f32) -> Result<f32, ApiError> {
+    if (0.0..=1.0).contains(&threshold) {
+        Ok(threshold)
+    } else {
+        Err(ApiError::BadRequest(format!(
+            "merge_threshold must be between 0 and 1, got {}",
+            threshold
+        )))
+    }
+}
+
+/// Layout parameters for a requested merge threshold, if any.
+fn layout_params(merge_threshold: Option<f32>) -> Result<Option<ForceParams>, ApiError> {
+    let Some(threshold) = merge_threshold else {
+        return Ok(None);
+    };
+    Ok(Some(ForceParams {
+        similarity_threshold: check_merge_threshold(threshold)?,
+        ..ForceParams::default()
+    }))
+}
+
+/// Serializes a layout with its connections in the requested format.
+fn layout_response(mut groups: Vec<ConceptGroup>, edge_format: EdgeFormat) -> HttpResponse {
+    match edge_format {
+        EdgeFormat::Lists => {
+            for group in &mut groups {
+                group.connection_weights.clear();
+            }
+            HttpResponse::Ok().json(ApiResponse {
+                success: true,
+                data: groups,
+            })
+        }
+        EdgeFormat::Compact => {
+            let edges = CompactEdges::from_groups(&groups);
+            for group in &mut groups {
+                group.connections.clear();
+                group.connection_weights.clear();
+            }
+            HttpResponse::Ok().json(ApiResponse {
+                success: true,
+                data: CompactLayout { groups, edges },
+            })
+        }
+    }
+}
+
+/// Merges and lays out concepts on the layout pool, then persists moved
+/// positions and keeps the merge dendrogram for re-grouping. Dropping the
+/// returned future cancels the layout.
+async fn run_layout(
+    state: &web::Data<AppState>,
+    user_id: Option<&str>,
+    force_params: Option<ForceParams>,
+    previous_positions: PreviousPositions,
+    concepts: Vec<Concept>,
+    embeddings: Vec<Embedding>,
+) -> Result<Vec<ConceptGroup>, ApiError> {
+    let concept_index = user_id.map(|user_id| state.concept_indexes.get(user_id));
+    let layout_cache = Arc::clone(&state.layout_cache);
+    let model_id = state.embedding_model.model_id().to_string();
+    let physics_pool = state.layout_pool.physics_pool();
+
+    let (groups, moved, regrouping) = state
+        .layout_pool
+        .run(move |cancel| {
+            let mut mind_map = dimensionality::MindMapProcessor::new(force_params)
+                .with_previous_positions(previous_positions)
+                .with_cancellation(cancel)
+                .with_layout_cache(layout_cache, &model_id);
+            if let Some(index) = concept_index {
+                mind_map = mind_map.with_concept_index(index);
+            }
+            if let Some(pool) = physics_pool {
+                mind_map = mind_map.with_thread_pool(pool);
+            }
+            let groups = mind_map.process_concepts(&concepts, &embeddings)?;
+            Ok((groups, mind_map.moved_concepts(), mind_map.take_regrouping()))
+        })
+        .await?;
+
+    save_moved_positions(state, user_id, moved).await;
+    if let Some(user_id) = user_id {
+        match regrouping {
+            Some(regrouping) => state.regroupings.put(user_id, regrouping),
+            None => state.regroupings.remove(user_id),
+        }
+    }
+    Ok(groups)
 }
 
 pub async fn process_concepts_and_embeddings(
@@ -58,25 +312,22 @@ pub async fn process_concepts_and_embeddings(
     let db_future = async {
         if let Some(ref uuid_str) = uuid_str {
             info!("Loading existing concepts for user: {}", uuid_str);
-            state.db_client.get_user_concepts(uuid_str).await
+            load_user_concepts_and_positions(state, uuid_str).await
         } else {
-            Ok(Vec::new())
+            Ok((Arc::new(UserConcepts::empty()), PreviousPositions::new()))
         }
     };
 
-    let (new_concepts, user_concepts) = tokio::try_join!(concepts_future, db_future)?;
+    let (new_concepts, (user_concepts, previous_positions)) =
+        tokio::try_join!(concepts_future, db_future)?;
 
     if new_concepts.is_empty() {
         return Err(ApiError::NoConceptsExtracted);
     }
 
+    let (existing_concepts, existing_embeddings) = user_concepts.to_pairs();
     let mut all_concepts = new_concepts.clone();
-    let mut existing_embeddings = Vec::new();
-
-    for (concept, embedding) in user_concepts {
-        all_concepts.push(concept);
-        existing_embeddings.push(embedding);
-    }
+    all_concepts.extend(existing_concepts);
 
     let new_concept_strings: Vec<String> = new_concepts.iter().map(|c| c.concept.clone()).collect();
 
@@ -89,36 +340,24 @@ pub async fn process_concepts_and_embeddings(
         return Err(ApiError::EmbeddingGenerationError);
     }
 
-    if let Some(uuid_str) = uuid_str {
-        let db_client = Arc::clone(&state.db_client);
-        let user_id_owned = uuid_str;
-        let new_concepts_clone = new_concepts.clone();
-        let new_embeddings_clone = new_embeddings.clone();
-
-        tokio::spawn(async move {
-            for (concept, embedding) in new_concepts_clone.iter().zip(new_embeddings_clone.iter()) {
-                if let Err(e) = db_client
-                    .save_concept(&user_id_owned, concept, embedding)
-                    .await
-                {
-                    error!("Failed to save concept: {:?}", e);
-                }
-            }
-        });
+    if let Some(uuid_str) = &uuid_str {
+        save_new_concepts(state, uuid_str, &new_concepts, &new_embeddings).await;
     }
 
     let mut all_embeddings = new_embeddings;
     all_embeddings.extend(existing_embeddings);
 
-    let mut mind_map = dimensionality::MindMapProcessor::new(None);
-    let clustered_results = mind_map.process_concepts(&all_concepts, &all_embeddings)?;
-
-    let response = ApiResponse {
-        success: true,
-        data: clustered_results,
-    };
-
-    Ok(HttpResponse::Ok().json(response))
+    let clustered_results = run_layout(
+        state,
+        uuid_str.as_deref(),
+        None,
+        previous_positions,
+        all_concepts,
+        all_embeddings,
+    )
+    .await?;
+
+    Ok(layout_response(clustered_results, EdgeFormat::Lists))
 }
 
 pub async fn process_text(
@@ -152,6 +391,8 @@ pub async fn process_text(
         }
     };
 
+    let force_params = layout_params(data.merge_threshold)?;
+
     let extractor = KeywordExtractor::new();
     let nlp_candidates = extractor.extract_candidates(&text, 20);
 
@@ -169,25 +410,22 @@ pub async fn process_text(
     let db_future = async {
         if let Some(ref uuid_str) = uuid_str {
             info!("Loading existing concepts for user: {}", uuid_str);
-            state.db_client.get_user_concepts(uuid_str).await
+            load_user_concepts_and_positions(state, uuid_str).await
         } else {
-            Ok(Vec::new())
+            Ok((Arc::new(UserConcepts::empty()), PreviousPositions::new()))
         }
     };
 
-    let (new_concepts, user_concepts) = tokio::try_join!(concepts_future, db_future)?;
+    let (new_concepts, (user_concepts, previous_positions)) =
+        tokio::try_join!(concepts_future, db_future)?;
 
     if new_concepts.is_empty() {
         return Err(ApiError::NoConceptsExtracted);
     }
 
+    let (existing_concepts, existing_embeddings) = user_concepts.to_pairs();
     let mut all_concepts = new_concepts.clone();
-    let mut existing_embeddings = Vec::new();
-
-    for (concept, embedding) in user_concepts {
-        all_concepts.push(concept);
-        existing_embeddings.push(embedding);
-    }
+    all_concepts.extend(existing_concepts);
 
     let new_concept_strings: Vec<String> = new_concepts.iter().map(|c| c.concept.clone()).collect();
 
@@ -201,89 +439,95 @@ pub async fn process_text(
     }
 
     if let Some(uuid_str) = &uuid_str {
-        let db_client = Arc::clone(&state.db_client);
-        let user_id_owned = uuid_str.clone();
-        let new_concepts_clone = new_concepts.clone();
-        let new_embeddings_clone = new_embeddings.clone();
-
-        tokio::spawn(async move {
-            for (concept, embedding) in new_concepts_clone.iter().zip(new_embeddings_clone.iter()) {
-                if let Err(e) = db_client
-                    .save_concept(&user_id_owned, concept, embedding)
-                    .await
-                {
-                    error!("Failed to save concept: {:?}", e);
-                }
-            }
-        });
+        save_new_concepts(state, uuid_str, &new_concepts, &new_embeddings).await;
     }
 
     let mut all_embeddings = new_embeddings;
     all_embeddings.extend(existing_embeddings);
 
-    let mut mind_map = dimensionality::MindMapProcessor::new(None);
-    let clustered_results = mind_map.process_concepts(&all_concepts, &all_embeddings)?;
-
-    // Spawn text reference saving + CDN upload as background task
-    let is_uploaded_text = source_url.is_none();
-    let text_for_cdn = text.clone();
-    let filename_for_cdn = filename.clone();
-    let user_id_for_cdn = data.user_id.clone();
-    let source_url_for_cdn = source_url.unwrap_or_default();
     let all_concept_strings: Vec<String> = all_concepts.iter().map(|c| c.concept.clone()).collect();
-    let db_client_cdn = Arc::clone(&state.db_client);
-
-    tokio::spawn(async move {
-        // Save text reference immediately (with empty URL) so it's available for queries
-        let saved = if let Some(user_id) = &user_id_for_cdn {
-            let normalized_user_id = if user_id == "default" {
-                "550e8400-e29b-41d4-a716-446655440000".to_string()
-            } else {
-                user_id.clone()
-            };
-            let file_size = text_for_cdn.len() as i32;
-            match db_client_cdn.save_text_reference(
-                &normalized_user_id,
-                &filename_for_cdn,
-                "",
-                &source_url_for_cdn,
-                &all_concept_strings,
-                Some(file_size),
-            ).await {
-                Ok(text_id) => Some((text_id, normalized_user_id)),
-                Err(e) => { error!("Failed to save text reference: {:?}", e); None }
-            }
-        } else {
-            None
+    let clustered_results = run_layout(
+        &state,
+        uuid_str.as_deref(),
+        force_params,
+        previous_positions,
+        all_concepts,
+        all_embeddings,
+    )
+    .await?;
+
+    // Save the text reference (with an empty URL until the upload is done) and
+    // upload user-provided texts to the CDN; URL-sourced texts keep their URL
+    let is_uploaded_text = source_url.is_none();
+    if uuid_str.is_some() || is_uploaded_text {
+        let job = WriteJob::SaveText {
+            text_id: Uuid::new_v4(),
+            user_id: uuid_str,
+            filename,
+            source_url: source_url.unwrap_or_default(),
+            concepts: all_concept_strings,
+            file_size: Some(text.len() as i32),
+            upload: is_uploaded_text.then_some(text),
         };
+        state.write_behind.enqueue(job).await;
+    }
 
-        // CDN upload only for user-uploaded texts (URL-sourced texts already have their original URL)
-        if is_uploaded_text {
-            match GitHubCDN::new().upload_text(&text_for_cdn, &filename_for_cdn).await {
-                Ok(cdn_url) => {
-                    info!("CDN upload succeeded: {}", cdn_url);
-                    // Update the URL in DB now that we have it
-                    if let Some((text_id, ref user_id)) = saved {
-                        if let Err(e) = db_client_cdn.update_text_url(
-                            text_id, user_id, &cdn_url, &all_concept_strings,
-                        ).await {
-                            error!("Failed to update CDN URL in DB: {:?}", e);
-                        }
-                    }
-                }
-                Err(e) => {
-                    error!("CDN upload failed (non-fatal): {:?}", e);
-                }
-            }
-        }
-    });
+    Ok(layout_response(clustered_results, data.edge_format))
+}
 
-    let response = ApiResponse {
-        success: true,
-        data: clustered_results,
+/// Re-groups the user's last layout at a new merge threshold by cutting its
+/// stored dendrogram; no embedding or layout work is done.
+pub async fn regroup(
+    data: web::Json<RegroupInput>,
+    state: web::Data<AppState>,
+) -> Result<impl Responder, ApiError> {
+    let threshold = check_merge_threshold(data.merge_threshold)?;
+
+    // Convert "default" to a proper UUID format
+    let normalized_user_id = if data.user_id == "default" {
+        "550e8400-e29b-41d4-a716-446655440000"
+    } else {
+        &data.user_id
     };
 
-    Ok(HttpResponse::Ok().json(response))
+    let regrouping = state
+        .regroupings
+        .get(normalized_user_id)
+        .ok_or_else(|| ApiError::LayoutNotFound(normalized_user_id.to_string()))?;
+    let groups = regrouping.cut(threshold);
+    info!(
+        "Re-grouped layout for user {} at {} into {} groups",
+        normalized_user_id,
+        threshold,
+        groups.len()
+    );
+
+    Ok(layout_response(groups, data.edge_format))
+}
+
+/// Layout pool occupancy, for sizing layout workers apart from HTTP workers,
+/// and layout cache hit/miss counters.
+pub async fn get_layout_metrics(state: web::Data<AppState>) -> impl Responder {
+    HttpResponse::Ok().json(ApiResponse {
+        success: true,
+        data: LayoutMetrics {
+            pool: state.layout_pool.stats(),
+            cache: state.layout_cache.stats(),
+        },
+    })
+}
+
+pub async fn get_db_metrics(state: web::Data<AppState>) -> impl Responder {
+    HttpResponse::Ok().json(ApiResponse {
+        success: true,
+        data: DatabaseMetrics {
+            nodes: state.db_client.node_stats(),
+            statements: state.db_client.statement_stats(),
+            concept_cache: state.concept_cache.stats(),
+            scene_cache: state.scene_cache.stats(),
+            write_behind: state.write_behind.stats(),
+        },
+    })
 }
 
 pub async fn get_texts_by_concept(
@@ -327,17 +571,15 @@ pub async fn save_scene(
     data: web::Json<SaveSceneInput>,
     state: web::Data<AppState>,
 ) -> Result<impl Responder, ApiError> {
-    let scene_data_json = serde_json::to_string(&data.scene_data)
-        .map_err(|e| ApiError::InternalError(format!("JSON serialization error: {}", e)))?;
-
     let scene_id = if let Some(existing_id) = &data.scene_id {
         info!("Updating existing scene: {}", existing_id);
-        state.db_client.update_scene(existing_id, &scene_data_json).await?;
+        state.db_client.update_scene(existing_id, &data.scene_data).await?;
+        state.scene_cache.invalidate(existing_id);
         existing_id.clone()
     } else {
         let new_id = nanoid::nanoid!(10);
         info!("Creating new scene: {}", new_id);
-        state.db_client.save_scene(&new_id, &scene_data_json).await?;
+        state.db_client.save_scene(&new_id, &data.scene_data).await?;
         new_id
     };
 
@@ -350,23 +592,58 @@ pub async fn save_scene(
 }
 
 pub async fn get_scene(
+    req: HttpRequest,
     path: web::Path<String>,
     state: web::Data<AppState>,
-) -> Result<impl Responder, ApiError> {
+) -> Result<HttpResponse, ApiError> {
     let scene_id = path.into_inner();
-    info!("Loading scene: {}", scene_id);
 
-    let scene_data_json = state.db_client.get_scene(&scene_id).await?;
+    let scene = match state.scene_cache.get(&scene_id) {
+        Some(scene) => scene,
+        None => {
+            info!("Loading scene: {}", scene_id);
+            let scene_data = state.db_client.get_scene(&scene_id).await?;
+            let body = serde_json::to_vec(&ApiResponse {
+                success: true,
+                data: scene_data,
+            })
+            .map_err(|e| ApiError::InternalError(format!("JSON serialization error: {}", e)))?;
+            let scene = CachedScene::new(body);
+            state.scene_cache.put(&scene_id, scene.clone());
+            scene
+        }
+    };
 
-    let scene_data: Vec<ConceptGroup> = serde_json::from_str(&scene_data_json)
-        .map_err(|e| ApiError::InternalError(format!("JSON deserialization error: {}", e)))?;
+    Ok(scene_response(&req, &scene, state.scene_cache.max_age()))
+}
 
-    let response = ApiResponse {
-        success: true,
-        data: scene_data,
+/// The scene, or 304 Not Modified if the request's `If-None-Match` already
+/// names its ETag.
+fn scene_response(req: &HttpRequest, scene: &CachedScene, max_age: u32) -> HttpResponse {
+    let etag = EntityTag::new_strong(scene.etag.clone());
+    let cache_control = CacheControl(vec![
+        CacheDirective::Public,
+        CacheDirective::MaxAge(max_age),
+        CacheDirective::MustRevalidate,
+    ]);
+
+    let not_modified = match IfNoneMatch::parse(req) {
+        Ok(IfNoneMatch::Any) => true,
+        Ok(IfNoneMatch::Items(tags)) => tags.iter().any(|tag| tag.weak_eq(&etag)),
+        Err(_) => false,
     };
+    if not_modified {
+        return HttpResponse::NotModified()
+            .insert_header(ETag(etag))
+            .insert_header(cache_control)
+            .finish();
+    }
 
-    Ok(HttpResponse::Ok().json(response))
+    HttpResponse::Ok()
+        .content_type(ContentType::json())
+        .insert_header(ETag(etag))
+        .insert_header(cache_control)
+        .body(scene.body.clone())
 }
 
 #[cfg(test)]
@@ -393,6 +670,23 @@ mod tests {
             assert!(input.url.is_none());
         }
 
+        #[test]
+        fn test_regroup_input_and_merge_threshold_deserialization() {
+            let json = r#"{"user_id": "default", "merge_threshold": 0.8}"#;
+            let input: RegroupInput = serde_json::from_str(json).unwrap();
+            assert_eq!(input.merge_threshold, 0.8);
+
+            let json = r#"{"text": "Hello", "merge_threshold": 0.6}"#;
+            let input: TextInput = serde_json::from_str(json).unwrap();
+            assert_eq!(input.merge_threshold, Some(0.6));
+            assert_eq!(input.edge_format, EdgeFormat::Lists);
+
+            let json = r#"{"text": "Hello", "edge_format": "compact"}"#;
+            let input: TextInput = serde_json::from_str(json).unwrap();
+            assert_eq!(input.edge_format, EdgeFormat::Compact);
+            assert!(matches!(check_merge_threshold(1.5), Err(ApiError::BadRequest(_))));
+        }
+
         #[test]
         fn test_text_input_deserialization_minimal() {
             let json = r#"{"text": "Just text"}"#;
@@ -454,6 +748,7 @@ mod tests {
                 concepts: vec!["concept1".to_string(), "concept2".to_string()],
                 reduced_embedding: vec![1.0, 2.0, 3.0],
                 connections: vec![1, 2],
+                connection_weights: vec![],
                 importance_score: 0.85,
                 group_id: 0,
             };
@@ -511,6 +806,7 @@ mod tests {
                     concepts: vec!["artificial intelligence".to_string(), "AI".to_string()],
                     reduced_embedding: vec![0.5, -0.3, 0.8],
                     connections: vec![1],
+                    connection_weights: vec![],
                     importance_score: 1.5,
                     group_id: 0,
                 },
@@ -518,6 +814,7 @@ mod tests {
                     concepts: vec!["machine learning".to_string()],
                     reduced_embedding: vec![-0.2, 0.7, 0.1],
                     connections: vec![0],
+                    connection_weights: vec![],
                     importance_score: 1.2,
                     group_id: 1,
                 },
@@ -573,6 +870,7 @@ mod tests {
                     concepts: vec!["artificial intelligence".to_string()],
                     reduced_embedding: vec![0.5, -0.3, 0.8],
                     connections: vec![1],
+                    connection_weights: vec![],
                     importance_score: 1.5,
                     group_id: 0,
                 },
@@ -580,6 +878,7 @@ mod tests {
                     concepts: vec!["machine learning".to_string()],
                     reduced_embedding: vec![-0.2, 0.7, 0.1],
                     connections: vec![0],
+                    connection_weights: vec![],
                     importance_score: 1.2,
                     group_id: 0,
                 },
@@ -661,6 +960,47 @@ mod tests {
             assert!(first_group["importance_score"].is_number());
         }
 
+        #[actix_web::test]
+        async fn test_compact_layout_response_moves_connections_to_edges() {
+            let groups = vec![
+                ConceptGroup {
+                    concepts: vec!["ai".to_string()],
+                    reduced_embedding: vec![0.0, 0.0, 0.0],
+                    connections: vec![1],
+                    connection_weights: vec![0.8],
+                    importance_score: 1.0,
+                    group_id: 0,
+                },
+                ConceptGroup {
+                    concepts: vec!["ml".to_string()],
+                    reduced_embedding: vec![1.0, 0.0, 0.0],
+                    connections: vec![0],
+                    connection_weights: vec![0.8],
+                    importance_score: 1.0,
+                    group_id: 1,
+                },
+            ];
+
+            let body = actix_web::body::to_bytes(
+                layout_response(groups.clone(), EdgeFormat::Lists).into_body(),
+            )
+            .await
+            .unwrap();
+            let lists: serde_json::Value = serde_json::from_slice(&body).unwrap();
+            assert_eq!(lists["data"][0]["connections"], serde_json::json!([1]));
+            assert!(lists["data"][0].get("connection_weights").is_none());
+
+            let body = actix_web::body::to_bytes(
+                layout_response(groups, EdgeFormat::Compact).into_body(),
+            )
+            .await
+            .unwrap();
+            let compact: serde_json::Value = serde_json::from_slice(&body).unwrap();
+            assert_eq!(compact["data"]["groups"][1]["connections"], serde_json::json!([]));
+            assert_eq!(compact["data"]["edges"]["deltas"], serde_json::json!([0, 1]));
+            assert_eq!(compact["data"]["edges"]["weights"], serde_json::json!([204]));
+        }
+
         #[actix_web::test]
         async fn test_vectorize_content_type() {
             let app = test::init_service(
@@ -729,6 +1069,7 @@ mod tests {
                     concepts: vec!["artificial intelligence".to_string()],
                     reduced_embedding: vec![0.5, -0.3, 0.8],
                     connections: vec![1],
+                    connection_weights: vec![],
                     importance_score: 1.5,
                     group_id: 0,
                 },
@@ -862,6 +1203,29 @@ mod tests {
             assert!(body["data"].is_array());
             assert!(body["data"].as_array().unwrap().is_empty());
         }
+
+        #[actix_web::test]
+        async fn test_scene_revalidation_with_etag() {
+            let scene = CachedScene::new(br#"{"success":true,"data":[]}"#.to_vec());
+
+            let req = test::TestRequest::get().to_http_request();
+            let resp = scene_response(&req, &scene, 60);
+            assert_eq!(resp.status(), 200);
+            let etag = resp.headers().get("etag").unwrap().to_str().unwrap().to_string();
+            assert_eq!(etag, format!("\"{}\"", scene.etag));
+            let cache_control = resp.headers().get("cache-control").unwrap().to_str().unwrap();
+            assert!(cache_control.contains("max-age=60"));
+
+            let req = test::TestRequest::get()
+                .insert_header(("If-None-Match", format!("\"other\", {}", etag)))
+                .to_http_request();
+            assert_eq!(scene_response(&req, &scene, 60).status(), 304);
+
+            let req = test::TestRequest::get()
+                .insert_header(("If-None-Match", "\"stale\""))
+                .to_http_request();
+            assert_eq!(scene_response(&req, &scene, 60).status(), 200);
+        }
     }
 }
 
@@ -1,23 +1,39 @@
+use crate::dimensionality::{ConceptGroup, PreviousPositions};
 use crate::models::concepts::Concept;
 use crate::models::embeddings::Embedding;
 use crate::error::ApiError;
+use super::nodes::{NodeHealth, NodeStats};
+use super::scene::{decode_scene, encode_scene};
+use super::statements::{StatementCache, StatementCacheStats};
+use cdrs_tokio::cluster::connection_pool::ConnectionPoolConfigBuilder;
 use cdrs_tokio::cluster::session::SessionBuilder;
 use cdrs_tokio::cluster::session::{Session, TcpSessionBuilder};
-use cdrs_tokio::cluster::{NodeTcpConfigBuilder, TcpConnectionManager};
-use cdrs_tokio::load_balancing::RoundRobinLoadBalancingStrategy;
+use cdrs_tokio::cluster::{NodeAddress, NodeTcpConfigBuilder, TcpConnectionManager};
+use cdrs_tokio::load_balancing::TopologyAwareLoadBalancingStrategy;
+use cdrs_tokio::frame::Envelope;
+use cdrs_tokio::query::{BatchQueryBuilder, QueryValues, StatementParamsBuilder};
 use cdrs_tokio::query_values;
 use cdrs_tokio::transport::TransportTcp;
-use cdrs_tokio::types::IntoRustByName;
+use cdrs_tokio::types::blob::Blob;
+use cdrs_tokio::types::list::List;
+use cdrs_tokio::types::rows::Row;
+use cdrs_tokio::types::CBytes;
+use cdrs_tokio::types::{AsRustType, IntoRustByName};
 use chrono::{DateTime, Utc};
-use log::{error, info};
-use ndarray::{Array1, ArrayBase, Dim, OwnedRepr};
+use futures::stream::{self, Stream, StreamExt, TryStreamExt};
+use log::{error, info, warn};
+use ndarray::Array2;
 use serde::{Deserialize, Serialize};
+use std::collections::HashMap;
+use std::net::{IpAddr, SocketAddr};
+use std::pin::pin;
+use std::time::Duration;
 use uuid::Uuid;
 
-type CurrentSession = Session<
+pub(crate) type CurrentSession = Session<
     TransportTcp,
     TcpConnectionManager,
-    RoundRobinLoadBalancingStrategy<TransportTcp, TcpConnectionManager>,
+    TopologyAwareLoadBalancingStrategy<TransportTcp, TcpConnectionManager>,
 >;
 
 #[derive(Debug, Serialize, Deserialize)]
@@ -32,40 +48,645 @@ pub struct TextReference {
     pub file_size: Option<i32>,
 }
 
+const DEFAULT_WRITE_CONCURRENCY: usize = 32;
+
+const DEFAULT_CONNECTIONS_PER_NODE: usize = 2;
+
+const DEFAULT_PAGE_SIZE: usize = 1000;
+
+const DEFAULT_NATIVE_PORT: u16 = 9042;
+
+const OCCURRENCES_QUERY: &str = "UPDATE store.concept_occurrences SET occurrences = occurrences + ? \
+                                 WHERE user_id = ? AND concept_id = ?";
+
+const USER_CONCEPTS_QUERY: &str = "SELECT concept_id, concept_text, embedding_blob, embedding_vector \
+                                   FROM store.user_concepts WHERE user_id = ?";
+
+/// One row of a bulk write, labelled for error reporting.
+struct Write<K = String> {
+    key: K,
+    query: &'static str,
+    values: QueryValues,
+}
+
+impl Write {
+    fn new(key: &str, query: &'static str, values: QueryValues) -> Self {
+        Self::keyed(key.to_string(), query, values)
+    }
+}
+
+impl<K> Write<K> {
+    fn keyed(key: K, query: &'static str, values: QueryValues) -> Self {
+        Self { key, query, values }
+    }
+}
+
+/// Outcome of a bulk write: rows written and `(row, error)` for the rest.
+#[derive(Debug)]
+pub struct WriteReport<K = String> {
+    pub written: usize,
+    pub failures: Vec<(K, String)>,
+}
+
+impl<K> Default for WriteReport<K> {
+    fn default() -> Self {
+        Self {
+            written: 0,
+            failures: Vec::new(),
+        }
+    }
+}
+
+impl<K> WriteReport<K> {
+    pub fn is_complete(&self) -> bool {
+        self.failures.is_empty()
+    }
+}
+
+impl WriteReport {
+    /// Logs every failed row and fails if there were any.
+    pub fn into_result(self, context: &str) -> Result<(), ApiError> {
+        if self.is_complete() {
+            return Ok(());
+        }
+        for (row, message) in &self.failures {
+            error!("{} for '{}': {}", context, row, message);
+        }
+        Err(ApiError::InternalError(format!(
+            "{}: {} of {} rows failed",
+            context,
+            self.failures.len(),
+            self.failures.len() + self.written
+        )))
+    }
+}
+
+/// One of the statements `save_concepts` writes for a concept.
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+pub enum ConceptStatement {
+    /// The `user_concepts` upsert.
+    Row,
+    /// The `concept_sources` upsert.
+    Source,
+    /// The `concept_occurrences` counter increment, the one write that is
+    /// not safe to repeat.
+    Occurrences,
+}
+
+/// Which statements `save_concepts` still has to write for a concept.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub struct ConceptStatements {
+    pub row: bool,
+    pub source: bool,
+    pub occurrences: bool,
+}
+
+impl ConceptStatements {
+    pub const ALL: Self = Self {
+        row: true,
+        source: true,
+        occurrences: true,
+    };
+
+    pub const NONE: Self = Self {
+        row: false,
+        source: false,
+        occurrences: false,
+    };
+
+    pub fn contains(&self, statement: ConceptStatement) -> bool {
+        match statement {
+            ConceptStatement::Row => self.row,
+            ConceptStatement::Source => self.source,
+            ConceptStatement::Occurrences => self.occurrences,
+        }
+    }
+
+    pub fn insert(&mut self, statement: ConceptStatement) {
+        match statement {
+            ConceptStatement::Row => self.row = true,
+            ConceptStatement::Source => self.source = true,
+            ConceptStatement::Occurrences => self.occurrences = true,
+        }
+    }
+
+    pub fn is_empty(&self) -> bool {
+        *self == Self::NONE
+    }
+}
+
+/// Outcome of `save_concepts`, with failures per statement so a retry can
+/// send again just the statements that failed.
+#[derive(Debug, Default)]
+pub struct ConceptSaveReport {
+    /// Statements written.
+    pub written: usize,
+    /// `((concept id, statement), error)` of the statements that failed.
+    pub failures: Vec<((Uuid, ConceptStatement), String)>,
+    /// `(concept, error)` of concepts that cannot be saved at all, such as
+    /// those with an empty embedding.
+    pub rejected: Vec<(String, String)>,
+    /// Error bumping the concept version, if that failed.
+    pub version_error: Option<String>,
+}
+
+impl ConceptSaveReport {
+    pub fn is_complete(&self) -> bool {
+        self.failures.is_empty() && self.rejected.is_empty() && self.version_error.is_none()
+    }
+}
+
+/// Outcome of `compact_user_concepts`.
+#[derive(Debug, Default, Clone, Serialize)]
+pub struct CompactionReport {
+    /// Rows read from the user's partition.
+    pub rows: usize,
+    /// Distinct normalized concepts among them.
+    pub distinct: usize,
+    /// Concepts that had more than one row.
+    pub collapsed: usize,
+    /// Net rows removed from the partition.
+    pub removed: usize,
+}
+
+/// Rows of one normalized concept found during compaction.
+#[derive(Default)]
+struct DuplicateGroup {
+    /// Whether a row already has the derived concept id.
+    has_canonical: bool,
+    /// Ids of the other rows.
+    strays: Vec<Uuid>,
+    /// Text, embedding blob and timestamp of the newest row.
+    text: String,
+    embedding: Vec<u8>,
+    created_at: Option<DateTime<Utc>>,
+}
+
+/// A user's stored concepts; row `i` of `embeddings` belongs to `concepts[i]`.
+#[derive(Debug)]
+pub struct UserConcepts {
+    pub concepts: Vec<Concept>,
+    pub embeddings: Array2<f32>,
+    /// Rows read from the legacy `embedding_vector` list column.
+    pub legacy_rows: usize,
+}
+
+impl UserConcepts {
+    pub fn empty() -> Self {
+        Self {
+            concepts: Vec::new(),
+            embeddings: Array2::zeros((0, 0)),
+            legacy_rows: 0,
+        }
+    }
+
+    /// Concepts paired with owned copies of their embedding rows.
+    pub fn to_pairs(&self) -> (Vec<Concept>, Vec<Embedding>) {
+        let embeddings = self.embeddings.rows().into_iter().map(|row| row.to_owned()).collect();
+        (self.concepts.clone(), embeddings)
+    }
+
+    /// A copy with `concepts` saved into it as `save_concepts` does: empty
+    /// embeddings are skipped and a concept already present is replaced.
+    /// `None` if an embedding has another width.
+    pub fn with_appended(&self, concepts: &[Concept], embeddings: &[Embedding]) -> Option<Self> {
+        let mut latest: HashMap<Uuid, (&Concept, &Embedding)> = HashMap::new();
+        let mut added = Vec::new();
+        for (concept, embedding) in concepts.iter().zip(embeddings) {
+            if embedding.is_empty() {
+                continue;
+            }
+            let id = concept_id(&concept.concept);
+            if latest.insert(id, (concept, embedding)).is_none() {
+                added.push(id);
+            }
+        }
+
+        let mut rows = EmbeddingRows::with_capacity(self.concepts.len() + added.len());
+        let mut all = Vec::with_capacity(self.concepts.len() + added.len());
+        for (concept, row) in self.concepts.iter().zip(self.embeddings.rows()) {
+            let id = concept_id(&concept.concept);
+            let pushed = match latest.remove(&id) {
+                Some((concept, embedding)) => {
+                    all.push(concept.clone());
+                    rows.push(embedding.iter().copied())
+                }
+                None => {
+                    all.push(concept.clone());
+                    rows.push(row.iter().copied())
+                }
+            };
+            if !pushed {
+                return None;
+            }
+        }
+        for id in added {
+            if let Some((concept, embedding)) = latest.remove(&id) {
+                all.push(concept.clone());
+                if !rows.push(embedding.iter().copied()) {
+                    return None;
+                }
+            }
+        }
+
+        Some(Self {
+            concepts: all,
+            embeddings: rows.into_array(),
+            legacy_rows: 0,
+        })
+    }
+}
+
+/// Namespace of the v5 UUIDs that identify concepts.
+const CONCEPT_NAMESPACE: Uuid = Uuid::from_u128(0x6f6f7274_636f_6e63_6570_745f69647300);
+
+/// Concept text with case and runs of whitespace folded, so "Happy  Prince"
+/// and "happy prince" are one concept.
+pub fn normalize_concept_text(text: &str) -> String {
+    text.split_whitespace()
+        .map(str::to_lowercase)
+        .collect::<Vec<_>>()
+        .join(" ")
+}
+
+/// Stable id of a concept: a v5 UUID of its normalized text. Saving a
+/// concept again upserts the same `user_concepts` row.
+pub fn concept_id(text: &str) -> Uuid {
+    Uuid::new_v5(&CONCEPT_NAMESPACE, normalize_concept_text(text).as_bytes())
+}
+
+/// Little-endian f32 bytes, the `embedding_blob` encoding.
+pub fn encode_embedding(values: impl IntoIterator<Item = f32>) -> Vec<u8> {
+    values.into_iter().flat_map(f32::to_le_bytes).collect()
+}
+
+/// Row-major buffer that embeddings are decoded into one at a time. The
+/// buffer is sized once the first row fixes the width, and becomes the
+/// `Array2` without copying.
+struct EmbeddingRows {
+    data: Vec<f32>,
+    dim: usize,
+    capacity: usize,
+}
+
+impl EmbeddingRows {
+    fn with_capacity(rows: usize) -> Self {
+        Self {
+            data: Vec::new(),
+            dim: 0,
+            capacity: rows,
+        }
+    }
+
+    /// Makes room for `rows` more rows, e.g. one page of a paged read, so the
+    /// matrix grows once per page rather than as rows arrive.
+    fn reserve(&mut self, rows: usize) {
+        if self.dim == 0 {
+            self.capacity += rows;
+        } else {
+            self.data.reserve(rows * self.dim);
+        }
+    }
+
+    /// Appends one row; rejects empty rows and rows of another width.
+    fn push(&mut self, values: impl ExactSizeIterator<Item = f32>) -> bool {
+        let len = values.len();
+        if len == 0 || (self.dim != 0 && len != self.dim) {
+            return false;
+        }
+        if self.dim == 0 {
+            self.dim = len;
+            self.data.reserve_exact(self.capacity * len);
+        }
+        self.data.extend(values);
+        true
+    }
+
+    fn push_le_bytes(&mut self, bytes: &[u8]) -> bool {
+        if bytes.len() % 4 != 0 {
+            return false;
+        }
+        self.push(
+            bytes
+                .chunks_exact(4)
+                .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]])),
+        )
+    }
+
+    fn push_f64(&mut self, values: &[f64]) -> bool {
+        self.push(values.iter().map(|&x| x as f32))
+    }
+
+    fn into_array(self) -> Array2<f32> {
+        let rows = if self.dim == 0 { 0 } else { self.data.len() / self.dim };
+        Array2::from_shape_vec((rows, self.dim), self.data)
+            .unwrap_or_else(|_| Array2::zeros((0, 0)))
+    }
+}
+
+/// Appends the concepts of `rows` and their embeddings, skipping rows whose
+/// embedding cannot be decoded. Returns how many came from the legacy list.
+fn decode_concept_rows(
+    rows: &[Row],
+    concepts: &mut Vec<Concept>,
+    embeddings: &mut EmbeddingRows,
+) -> Result<usize, ApiError> {
+    let mut legacy_rows = 0;
+    for (row_index, row) in rows.iter().enumerate() {
+        let concept_text: String = row.get_r_by_name("concept_text").map_err(|e| {
+            ApiError::InternalError(format!("Concept text extraction error for row {}: {}", row_index, e))
+        })?;
+
+        let blob: Option<Blob> = row.get_by_name("embedding_blob").unwrap_or(None);
+        let decoded = match blob {
+            Some(blob) => embeddings.push_le_bytes(blob.as_slice()),
+            None => {
+                let list: Option<List> = row.get_by_name("embedding_vector").unwrap_or(None);
+                match list.map(|list| list.as_r_type::<Vec<f64>>()) {
+                    Some(Ok(values)) => {
+                        legacy_rows += 1;
+                        embeddings.push_f64(&values)
+                    }
+                    _ => false,
+                }
+            }
+        };
+
+        if !decoded {
+            log::error!("Corrupted embedding data for concept '{}' (row {}), skipping this concept",
+                       concept_text, row_index);
+            continue;
+        }
+
+        concepts.push(Concept {
+            concept: concept_text,
+            importance: 0.5,
+        });
+    }
+    Ok(legacy_rows)
+}
+
 pub struct DatabaseClient {
     session: CurrentSession,
+    statements: StatementCache,
+    prepare_statements: bool,
+    /// Writes in flight at once for bulk saves, from `DB_WRITE_CONCURRENCY`.
+    write_concurrency: usize,
+    /// Rows per page for partition reads, from `DB_PAGE_SIZE`.
+    page_size: usize,
+    health: NodeHealth,
+    /// Native port of the first contact point, assumed for discovered peers.
+    peer_port: u16,
+}
+
+/// Port of a `host:port` contact point, the default native port without one.
+fn native_port(node: &str) -> u16 {
+    if let Ok(addr) = node.parse::<SocketAddr>() {
+        return addr.port();
+    }
+    match node.split_once(':') {
+        Some((_, port)) if !port.contains(':') => port.parse().unwrap_or(DEFAULT_NATIVE_PORT),
+        _ => DEFAULT_NATIVE_PORT,
+    }
 }
 
 impl DatabaseClient {
+    /// Connects through every contact point in `nodes`. The driver discovers
+    /// the rest of the cluster from them and sends each prepared statement to
+    /// a replica of its partition key.
+    ///
+    /// `DB_CONNECTIONS_PER_NODE` sets the pool size per node and
+    /// `DB_LOCAL_DC` keeps routing in one datacenter.
     pub async fn new(nodes: &[&str]) -> Result<Self, ApiError> {
-        let node = nodes[0]; // For simplicity, use first node
+        let nodes: Vec<&str> = nodes.iter().map(|n| n.trim()).filter(|n| !n.is_empty()).collect();
+        if nodes.is_empty() {
+            return Err(ApiError::InternalError("No database contact points given".to_string()));
+        }
 
         let config = NodeTcpConfigBuilder::new()
-            .with_contact_point(cdrs_tokio::cluster::NodeAddress::Hostname(node.to_string()))
+            .with_contact_points(
+                nodes
+                    .iter()
+                    .map(|node| NodeAddress::Hostname(node.to_string()))
+                    .collect(),
+            )
             .build()
             .await
             .map_err(|e| ApiError::InternalError(format!("DB connection error: {}", e)))?;
 
-        let session = TcpSessionBuilder::new(RoundRobinLoadBalancingStrategy::new(), config)
+        let connections_per_node = std::env::var("DB_CONNECTIONS_PER_NODE")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_CONNECTIONS_PER_NODE);
+        let pool = ConnectionPoolConfigBuilder::new()
+            .with_local_size(connections_per_node)
+            .with_remote_size(connections_per_node)
+            .build();
+        let local_dc = std::env::var("DB_LOCAL_DC").ok();
+
+        let session = TcpSessionBuilder::new(TopologyAwareLoadBalancingStrategy::new(local_dc, true), config)
+            .with_connection_pool_config(pool)
             .build()
             .await
             .map_err(|e| ApiError::InternalError(format!("Session build error: {}", e)))?;
 
-        Ok(Self { session })
+        info!(
+            "Connected to Cassandra through {} contact points, {} connections per node",
+            nodes.len(),
+            connections_per_node
+        );
+
+        Ok(Self {
+            session,
+            health: NodeHealth::new(nodes.iter().copied()),
+            peer_port: native_port(nodes[0]),
+            statements: StatementCache::new(),
+            prepare_statements: true,
+            write_concurrency: std::env::var("DB_WRITE_CONCURRENCY")
+                .ok()
+                .and_then(|v| v.parse().ok())
+                .unwrap_or(DEFAULT_WRITE_CONCURRENCY),
+            page_size: std::env::var("DB_PAGE_SIZE")
+                .ok()
+                .and_then(|v| v.parse().ok())
+                .filter(|&size| size > 0)
+                .unwrap_or(DEFAULT_PAGE_SIZE),
+        })
+    }
+
+    /// Sends queries as plain CQL strings when disabled, e.g. to benchmark
+    /// against prepared execution. Enabled by default.
+    pub fn with_prepared_statements(mut self, enabled: bool) -> Self {
+        self.prepare_statements = enabled;
+        self
+    }
+
+    pub fn with_page_size(mut self, page_size: usize) -> Self {
+        self.page_size = page_size.max(1);
+        self
+    }
+
+    pub fn statement_stats(&self) -> StatementCacheStats {
+        self.statements.stats()
+    }
+
+    pub fn node_stats(&self) -> Vec<NodeStats> {
+        self.health.snapshot()
     }
 
-    pub async fn get_user_concepts(
+    /// Adds peers listed in `system.peers` to the tracked nodes and probes
+    /// them all. Peers use the native port of the first contact point.
+    pub async fn probe_nodes(&self, timeout: Duration) {
+        match self.discover_peers().await {
+            Ok(peers) => {
+                for peer in peers {
+                    self.health.track(&SocketAddr::new(peer, self.peer_port).to_string());
+                }
+            }
+            Err(e) => warn!("Could not list Cassandra peers: {:?}", e),
+        }
+        self.health.probe_all(timeout).await;
+    }
+
+    async fn discover_peers(&self) -> Result<Vec<IpAddr>, ApiError> {
+        let rows = self
+            .execute("SELECT rpc_address FROM system.peers", query_values!())
+            .await
+            .map_err(|e| ApiError::InternalError(format!("Query error: {}", e)))?
+            .response_body()
+            .map_err(|e| ApiError::InternalError(format!("Response error: {}", e)))?
+            .into_rows()
+            .unwrap_or_default();
+
+        Ok(rows
+            .iter()
+            .filter_map(|row| row.get_r_by_name::<IpAddr>("rpc_address").ok())
+            .collect())
+    }
+
+    /// Runs `query` as a cached prepared statement.
+    async fn execute(
         &self,
-        user_id: &str,
-    ) -> Result<Vec<(Concept, Embedding)>, ApiError> {
-        let query = "SELECT concept_id, concept_text, embedding_vector FROM store.user_concepts WHERE user_id = ?";
+        query: &'static str,
+        values: QueryValues,
+    ) -> cdrs_tokio::error::Result<Envelope> {
+        if self.prepare_statements {
+            self.statements.execute(&self.session, query, values).await
+        } else {
+            self.session.query_with_values(query, values).await
+        }
+    }
 
+    /// Rows of `query` fetched `page_size` at a time; the next page is only
+    /// requested once the previous one has been consumed.
+    fn paged(
+        &self,
+        query: &'static str,
+        values: QueryValues,
+    ) -> impl Stream<Item = Result<Vec<Row>, ApiError>> + '_ {
+        // `None` once the last page has been read
+        let start: Option<Option<CBytes>> = Some(None);
+        stream::try_unfold(start, move |cursor| {
+            let values = values.clone();
+            async move {
+                let Some(paging_state) = cursor else {
+                    return Ok(None);
+                };
+
+                let mut params = StatementParamsBuilder::new()
+                    .with_values(values)
+                    .with_page_size(self.page_size as i32);
+                if let Some(paging_state) = paging_state {
+                    params = params.with_paging_state(paging_state);
+                }
+                let params = params.build();
+
+                let envelope = if self.prepare_statements {
+                    self.statements.execute_with_params(&self.session, query, &params).await
+                } else {
+                    self.session.query_with_params(query, params).await
+                }
+                .map_err(|e| ApiError::InternalError(format!("Query error: {}", e)))?;
+
+                let body = envelope
+                    .response_body()
+                    .map_err(|e| ApiError::InternalError(format!("Response error: {}", e)))?;
+                let next = body.as_rows_metadata().and_then(|m| m.paging_state.clone());
+                let rows = body.into_rows().unwrap_or_default();
+                Ok(Some((rows, next.map(Some))))
+            }
+        })
+    }
+
+    /// Runs independent writes with at most `write_concurrency` in flight,
+    /// so a batch costs a few round trips instead of one per row.
+    async fn write_all<K: Send>(&self, writes: Vec<Write<K>>) -> WriteReport<K> {
+        let results: Vec<(K, cdrs_tokio::error::Result<Envelope>)> = stream::iter(writes)
+            .map(|write| async move {
+                let result = self.execute(write.query, write.values).await;
+                (write.key, result)
+            })
+            .buffer_unordered(self.write_concurrency.max(1))
+            .collect()
+            .await;
+
+        let mut report = WriteReport::default();
+        for (key, result) in results {
+            match result {
+                Ok(_) => report.written += 1,
+                Err(e) => report.failures.push((key, e.to_string())),
+            }
+        }
+        report
+    }
+
+    /// All of a user's concepts with their embeddings decoded into one
+    /// contiguous matrix, one row per concept. Pages of `page_size` rows are
+    /// decoded as they arrive, so only one page is held besides the matrix,
+    /// which grows once per page.
+    ///
+    /// Rows stored before `embedding_blob` existed are read from the legacy
+    /// `embedding_vector` list and counted in `legacy_rows`; see
+    /// `migrate_embedding_blobs`.
+    pub async fn get_user_concepts(&self, user_id: &str) -> Result<UserConcepts, ApiError> {
+        let uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
+
+        let mut concepts = Vec::new();
+        let mut embeddings = EmbeddingRows::with_capacity(0);
+        let mut legacy_rows = 0;
+
+        let mut pages = pin!(self.paged(USER_CONCEPTS_QUERY, query_values!(uuid)));
+        while let Some(rows) = pages.try_next().await? {
+            concepts.reserve(rows.len());
+            embeddings.reserve(rows.len());
+            legacy_rows += decode_concept_rows(&rows, &mut concepts, &mut embeddings)?;
+        }
+
+        let embeddings = embeddings.into_array();
+        info!(
+            "Retrieved {} concepts ({} dimensions, {} legacy rows) for user {}",
+            concepts.len(),
+            embeddings.ncols(),
+            legacy_rows,
+            user_id
+        );
+        Ok(UserConcepts {
+            concepts,
+            embeddings,
+            legacy_rows,
+        })
+    }
+
+    /// Version of a user's concept set, bumped by every `save_concepts`;
+    /// 0 for a user that has never saved any.
+    pub async fn get_concept_version(&self, user_id: &str) -> Result<i64, ApiError> {
+        let query = "SELECT version FROM store.user_concept_versions WHERE user_id = ?";
         let uuid = Uuid::parse_str(user_id)
             .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
 
         let rows = self
-            .session
-            .query_with_values(query, query_values!(uuid))
+            .execute(query, query_values!(uuid))
             .await
             .map_err(|e| ApiError::InternalError(format!("Query error: {}", e)))?
             .response_body()
@@ -73,80 +694,210 @@ impl DatabaseClient {
             .into_rows()
             .unwrap_or_default();
 
-        let mut results = Vec::new();
+        Ok(rows
+            .first()
+            .and_then(|row| row.get_by_name::<i64>("version").ok().flatten())
+            .unwrap_or(0))
+    }
 
-        info!("Processing {} rows from database", rows.len());
+    /// A user's concepts one page at a time, for consumers that can work on
+    /// part of the set while the rest is still being read.
+    pub fn user_concept_pages(
+        &self,
+        user_id: &str,
+    ) -> Result<impl Stream<Item = Result<UserConcepts, ApiError>> + '_, ApiError> {
+        let uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
 
-        for (row_index, row) in rows.iter().enumerate() {
-            // Extract concept text (works with get_r_by_name)
-            let concept_text: String = row.get_r_by_name("concept_text").map_err(|e| {
-                ApiError::InternalError(format!("Concept text extraction error for row {}: {}", row_index, e))
-            })?;
+        Ok(self
+            .paged(USER_CONCEPTS_QUERY, query_values!(uuid))
+            .and_then(|rows| async move {
+                let mut concepts = Vec::with_capacity(rows.len());
+                let mut embeddings = EmbeddingRows::with_capacity(rows.len());
+                let legacy_rows = decode_concept_rows(&rows, &mut concepts, &mut embeddings)?;
+                Ok(UserConcepts {
+                    concepts,
+                    embeddings: embeddings.into_array(),
+                    legacy_rows,
+                })
+            }))
+    }
 
-            info!("Processing concept {} (row {}): '{}'", row_index, row_index, concept_text);
-
-            // For the embedding vector, we need to use a different strategy
-            // Let's try to deserialize it manually using the serde functionality
-
-            // First, get the raw bytes from the column - using CQL binary protocol
-            let result: Result<String, _> = row.get_r_by_name("embedding_vector");
-
-            // If this works, try to parse it as a comma-separated string of floats
-            let embedding_vec: Vec<f32> = match result {
-                Ok(string_vec) => {
-                    // Parse as comma-separated values
-                    let parsed_vec: Vec<f32> = string_vec
-                        .split(',')
-                        .filter_map(|s| s.trim().parse::<f32>().ok())
-                        .collect();
-                    
-                    // Check if parsing resulted in empty vector
-                    if parsed_vec.is_empty() {
-                        log::error!("Embedding parsing resulted in empty vector for concept '{}', skipping", concept_text);
-                        continue;
-                    }
-                    parsed_vec
+    /// Rewrites a user's legacy `embedding_vector` rows as `embedding_blob`
+    /// and clears the list. Returns the number of rows migrated.
+    pub async fn migrate_embedding_blobs(&self, user_id: &str) -> Result<usize, ApiError> {
+        let user_uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
+
+        let query = "SELECT concept_id, embedding_blob, embedding_vector \
+                    FROM store.user_concepts WHERE user_id = ?";
+        let update = "UPDATE store.user_concepts SET embedding_blob = ?, embedding_vector = null \
+                     WHERE user_id = ? AND concept_id = ?";
+        let mut migrated = 0;
+
+        let mut pages = pin!(self.paged(query, query_values!(user_uuid)));
+        while let Some(rows) = pages.try_next().await? {
+            for row in rows.iter() {
+                let blob: Option<Blob> = row.get_by_name("embedding_blob").unwrap_or(None);
+                if blob.is_some() {
+                    continue;
                 }
-                Err(_) => {
-                    // If string doesn't work, try to parse it as a JSON array
-                    let result: Result<String, _> = row.get_r_by_name("embedding_vector");
-                    match result {
-                        Ok(json_str) => {
-                            // Parse JSON array
-                            serde_json::from_str::<Vec<f32>>(&json_str).map_err(|e| {
-                                ApiError::InternalError(format!("JSON parsing error: {}", e))
-                            })?
-                        }
-                        Err(_) => {
-                            let concept_id: Uuid =
-                                row.get_r_by_name("concept_id").map_err(|e| {
-                                    ApiError::InternalError(format!(
-                                        "Concept ID extraction error: {}",
-                                        e
-                                    ))
-                                })?;
-
-                            log::error!("Corrupted embedding data for concept '{}' (ID: {}), skipping this concept", 
-                                       concept_text, concept_id);
-                            
-                            // Skip this concept rather than failing the entire request
-                            continue;
+                let list: Option<List> = row.get_by_name("embedding_vector").unwrap_or(None);
+                let Some(Ok(values)) = list.map(|list| list.as_r_type::<Vec<f64>>()) else {
+                    continue;
+                };
+                let concept_id: Uuid = row.get_r_by_name("concept_id").map_err(|e| {
+                    ApiError::InternalError(format!("Concept ID extraction error: {}", e))
+                })?;
+
+                let blob = Blob::new(encode_embedding(values.iter().map(|&x| x as f32)));
+                self.execute(update, query_values!(blob, user_uuid, concept_id))
+                    .await
+                    .map_err(|e| ApiError::InternalError(format!("Migrate embedding error: {}", e)))?;
+                migrated += 1;
+            }
+        }
+
+        info!("Migrated {} embeddings to blobs for user {}", migrated, user_id);
+        Ok(migrated)
+    }
+
+    /// Collapses a user's `user_concepts` rows that share a normalized text,
+    /// written before concept ids were derived from the text, into one row
+    /// under `concept_id`. The newest row's text and embedding are kept and
+    /// each collapsed row adds one occurrence.
+    ///
+    /// Each group's occurrences are added first, then the canonical row is
+    /// written and the collapsed rows deleted in one logged batch, so a group
+    /// is either left as it was or fully collapsed. Counters cannot share a
+    /// batch with other writes and cannot be set, only incremented, so the
+    /// count is not idempotent: a run that fails after the increment but
+    /// before the batch finds the same duplicates again and counts them
+    /// twice. Rows are never duplicated, and no occurrence is ever lost.
+    pub async fn compact_user_concepts(&self, user_id: &str) -> Result<CompactionReport, ApiError> {
+        let user_uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
+
+        let query = "SELECT concept_id, concept_text, embedding_blob, embedding_vector, created_at \
+                    FROM store.user_concepts WHERE user_id = ?";
+        let mut groups: HashMap<Uuid, DuplicateGroup> = HashMap::new();
+        let mut rows_read = 0;
+
+        let mut pages = pin!(self.paged(query, query_values!(user_uuid)));
+        while let Some(rows) = pages.try_next().await? {
+            for row in rows.iter() {
+                let (Ok(id), Ok(text)) = (
+                    row.get_r_by_name::<Uuid>("concept_id"),
+                    row.get_r_by_name::<String>("concept_text"),
+                ) else {
+                    continue;
+                };
+                rows_read += 1;
+                let created_at: Option<DateTime<Utc>> = row.get_by_name("created_at").unwrap_or(None);
+                let embedding = match row.get_by_name::<Blob>("embedding_blob").unwrap_or(None) {
+                    Some(blob) => blob.into_vec(),
+                    None => {
+                        let list: Option<List> = row.get_by_name("embedding_vector").unwrap_or(None);
+                        match list.map(|list| list.as_r_type::<Vec<f64>>()) {
+                            Some(Ok(values)) => encode_embedding(values.iter().map(|&x| x as f32)),
+                            _ => Vec::new(),
                         }
                     }
+                };
+
+                let canonical = concept_id(&text);
+                let group = groups.entry(canonical).or_default();
+                if id == canonical {
+                    group.has_canonical = true;
+                } else {
+                    group.strays.push(id);
                 }
-            };
+                if !embedding.is_empty() && (group.embedding.is_empty() || created_at > group.created_at) {
+                    group.text = text;
+                    group.embedding = embedding;
+                    group.created_at = created_at;
+                }
+            }
+        }
 
-            let concept = Concept {
-                concept: concept_text,
-                importance: 0.5,
-            };
-            let embedding: ArrayBase<OwnedRepr<f32>, Dim<[usize; 1]>> = Array1::from(embedding_vec);
+        let upsert = "INSERT INTO store.user_concepts \
+                     (user_id, concept_id, concept_text, embedding_blob, created_at) \
+                     VALUES (?, ?, ?, ?, ?)";
+        let upsert_source = "INSERT INTO store.concept_sources \
+                            (concept_id, user_id, source_type, source_text, created_at) \
+                            VALUES (?, ?, ?, ?, ?)";
+        let delete = "DELETE FROM store.user_concepts WHERE user_id = ? AND concept_id = ?";
+        let delete_source = "DELETE FROM store.concept_sources WHERE concept_id = ? AND user_id = ?";
+
+        let mut report = CompactionReport {
+            rows: rows_read,
+            distinct: groups.len(),
+            ..CompactionReport::default()
+        };
+        for (canonical, group) in groups {
+            if group.strays.is_empty() || group.embedding.is_empty() {
+                continue;
+            }
+            let created_at = group.created_at.unwrap_or_else(Utc::now);
+
+            let mut batch = BatchQueryBuilder::new()
+                .add_query(
+                    upsert,
+                    query_values!(user_uuid, canonical, group.text.clone(), Blob::new(group.embedding), created_at),
+                )
+                .add_query(
+                    upsert_source,
+                    query_values!(canonical, user_uuid, "text_upload", "User uploaded text", created_at),
+                );
+            for &stray in &group.strays {
+                batch = batch
+                    .add_query(delete, query_values!(user_uuid, stray))
+                    .add_query(delete_source, query_values!(stray, user_uuid));
+            }
+            let batch = batch
+                .build()
+                .map_err(|e| ApiError::InternalError(format!("Compact concept error: {}", e)))?;
+
+            // Counted before the strays go, so a failure can only over-count
+            self.execute(
+                OCCURRENCES_QUERY,
+                query_values!(group.strays.len() as i64, user_uuid, canonical),
+            )
+            .await
+            .map_err(|e| ApiError::InternalError(format!("Compact concept error: {}", e)))?;
 
-            results.push((concept, embedding));
+            self.session
+                .batch(batch)
+                .await
+                .map_err(|e| ApiError::InternalError(format!("Compact concept error: {}", e)))?;
+
+            report.removed += group.strays.len() - usize::from(!group.has_canonical);
+            report.collapsed += 1;
         }
 
-        info!("Retrieved {} concepts for user {}", results.len(), user_id);
-        Ok(results)
+        if report.collapsed > 0 {
+            let bump = "UPDATE store.user_concept_versions SET version = version + 1 WHERE user_id = ?";
+            self.execute(bump, query_values!(user_uuid))
+                .await
+                .map_err(|e| ApiError::InternalError(format!("Compact concept error: {}", e)))?;
+        }
+
+        info!(
+            "Compacted concepts of user {}: {} rows, {} distinct, {} duplicates removed",
+            user_id, report.rows, report.distinct, report.removed
+        );
+        Ok(report)
+    }
+
+    /// Every user id with stored concepts.
+    pub async fn concept_user_ids(&self) -> Result<Vec<Uuid>, ApiError> {
+        let query = "SELECT DISTINCT user_id FROM store.user_concepts";
+        let mut user_ids = Vec::new();
+        let mut pages = pin!(self.paged(query, query_values!()));
+        while let Some(rows) = pages.try_next().await? {
+            user_ids.extend(rows.iter().filter_map(|row| row.get_r_by_name::<Uuid>("user_id").ok()));
+        }
+        Ok(user_ids)
     }
 
     pub async fn save_concept(
@@ -155,73 +906,210 @@ impl DatabaseClient {
         concept: &Concept,
         embedding: &Embedding,
     ) -> Result<(), ApiError> {
-        // Validate embedding is not empty
-        if embedding.is_empty() {
-            return Err(ApiError::InternalError(format!(
-                "Cannot save concept '{}' with zero-dimensional embedding", 
-                concept.concept
-            )));
+        let report = self
+            .save_concepts(user_id, std::slice::from_ref(concept), std::slice::from_ref(embedding), &[], 1)
+            .await?;
+        let error = report
+            .rejected
+            .into_iter()
+            .map(|(_, message)| message)
+            .chain(report.failures.into_iter().map(|(_, message)| message))
+            .chain(report.version_error)
+            .next();
+        match error {
+            Some(message) => Err(ApiError::InternalError(message)),
+            None => Ok(()),
         }
+    }
 
-        let concept_id = Uuid::new_v4();
+    /// Saves concepts with their embeddings and source rows, pipelined.
+    /// Rows are upserted under `concept_id`, so a concept saved again replaces
+    /// its embedding and adds to its occurrence count. Statements that fail,
+    /// and concepts rejected for empty embeddings, are listed in the report
+    /// instead of aborting the rest.
+    ///
+    /// `statements` limits what is written for each of `concepts`, all of it
+    /// when empty, so a retry can send just the statements that failed. The
+    /// upserts are safe to repeat, the occurrence increment is not: it must
+    /// only be retried when it failed itself. A caller that cannot tell
+    /// whether an increment landed, such as a replay after a crash, may still
+    /// count occurrences twice.
+    ///
+    /// `saves` is the number of saves this call stands for, e.g. several
+    /// queued saves merged into one; the concept version moves by that much
+    /// once any row is written, in step with cached concept sets.
+    pub async fn save_concepts(
+        &self,
+        user_id: &str,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+        statements: &[ConceptStatements],
+        saves: i64,
+    ) -> Result<ConceptSaveReport, ApiError> {
         let user_uuid = Uuid::parse_str(user_id)
             .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
         let now = Utc::now();
 
-        // Convert embedding to Vec<f64> for Cassandra compatibility
-        let embedding_vec: Vec<f64> = embedding.iter().map(|&x| x as f64).collect();
-
-        // Insert into user_concepts table
         let query = "INSERT INTO store.user_concepts \
-                    (user_id, concept_id, concept_text, embedding_vector, created_at) \
+                    (user_id, concept_id, concept_text, embedding_blob, created_at) \
                     VALUES (?, ?, ?, ?, ?)";
-
-        self.session
-            .query_with_values(
-                query,
-                query_values!(
-                    user_uuid,
-                    concept_id,
-                    concept.concept.clone(),
-                    embedding_vec,
-                    now
-                ),
-            )
-            .await
-            .map_err(|e| ApiError::InternalError(format!("Save concept error: {}", e)))?;
-
-        // Insert source information
         let source_query = "INSERT INTO store.concept_sources \
                            (concept_id, user_id, source_type, source_text, created_at) \
                            VALUES (?, ?, ?, ?, ?)";
 
-        self.session
-            .query_with_values(
-                source_query,
-                query_values!(
-                    concept_id,
-                    user_uuid,
-                    "text_upload",
-                    "User uploaded text",
-                    now
-                ),
-            )
-            .await
-            .map_err(|e| ApiError::InternalError(format!("Save source error: {}", e)))?;
+        // The last of several spellings of one concept wins, all are counted
+        let mut rejected = Vec::new();
+        let mut unique: HashMap<Uuid, (&Concept, &Embedding, ConceptStatements, i64)> = HashMap::new();
+        let mut order = Vec::new();
+        for (i, (concept, embedding)) in concepts.iter().zip(embeddings).enumerate() {
+            let wanted = statements.get(i).copied().unwrap_or(ConceptStatements::ALL);
+            if wanted.is_empty() {
+                continue;
+            }
+            if embedding.is_empty() {
+                rejected.push((
+                    concept.concept.clone(),
+                    format!("Cannot save concept '{}' with zero-dimensional embedding", concept.concept),
+                ));
+                continue;
+            }
+            let id = concept_id(&concept.concept);
+            let occurrences = i64::from(wanted.occurrences);
+            match unique.get_mut(&id) {
+                Some(entry) => {
+                    if wanted.row || wanted.source {
+                        entry.0 = concept;
+                        entry.1 = embedding;
+                    }
+                    entry.2.row |= wanted.row;
+                    entry.2.source |= wanted.source;
+                    entry.2.occurrences |= wanted.occurrences;
+                    entry.3 += occurrences;
+                }
+                None => {
+                    unique.insert(id, (concept, embedding, wanted, occurrences));
+                    order.push(id);
+                }
+            }
+        }
 
-        Ok(())
+        let mut writes = Vec::with_capacity(order.len() * 3);
+        for concept_id in order {
+            let (concept, embedding, wanted, occurrences) = unique[&concept_id];
+            if wanted.row {
+                let embedding_blob = Blob::new(encode_embedding(embedding.iter().copied()));
+                writes.push(Write::keyed(
+                    (concept_id, ConceptStatement::Row),
+                    query,
+                    query_values!(user_uuid, concept_id, concept.concept.clone(), embedding_blob, now),
+                ));
+            }
+            if wanted.source {
+                writes.push(Write::keyed(
+                    (concept_id, ConceptStatement::Source),
+                    source_query,
+                    query_values!(concept_id, user_uuid, "text_upload", "User uploaded text", now),
+                ));
+            }
+            if wanted.occurrences {
+                writes.push(Write::keyed(
+                    (concept_id, ConceptStatement::Occurrences),
+                    OCCURRENCES_QUERY,
+                    query_values!(occurrences, user_uuid, concept_id),
+                ));
+            }
+        }
+
+        let written = self.write_all(writes).await;
+        let mut report = ConceptSaveReport {
+            written: written.written,
+            failures: written.failures,
+            rejected,
+            version_error: None,
+        };
+
+        if report.written > 0 && saves > 0 {
+            let bump = "UPDATE store.user_concept_versions SET version = version + ? WHERE user_id = ?";
+            if let Err(e) = self.execute(bump, query_values!(saves, user_uuid)).await {
+                report.version_error = Some(e.to_string());
+            }
+        }
+        Ok(report)
+    }
+
+    /// A user's saved concept positions, read `page_size` rows at a time.
+    pub async fn get_concept_positions(&self, user_id: &str) -> Result<PreviousPositions, ApiError> {
+        let query = "SELECT concept_text, x, y, z FROM store.concept_positions WHERE user_id = ?";
+
+        let uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
+
+        let mut positions = PreviousPositions::new();
+        let mut pages = pin!(self.paged(query, query_values!(uuid)));
+        while let Some(rows) = pages.try_next().await? {
+            positions.reserve(rows.len());
+            for row in rows.iter() {
+                let concept_text: String = row.get_r_by_name("concept_text").map_err(|e| {
+                    ApiError::InternalError(format!("Concept text extraction error: {}", e))
+                })?;
+                let x: f32 = row.get_r_by_name("x").map_err(|e| {
+                    ApiError::InternalError(format!("Position extraction error: {}", e))
+                })?;
+                let y: f32 = row.get_r_by_name("y").map_err(|e| {
+                    ApiError::InternalError(format!("Position extraction error: {}", e))
+                })?;
+                let z: f32 = row.get_r_by_name("z").map_err(|e| {
+                    ApiError::InternalError(format!("Position extraction error: {}", e))
+                })?;
+                positions.insert(concept_text, [x, y, z]);
+            }
+        }
+
+        info!("Retrieved {} concept positions for user {}", positions.len(), user_id);
+        Ok(positions)
+    }
+
+    pub async fn save_concept_positions(
+        &self,
+        user_id: &str,
+        positions: &[(String, [f32; 3])],
+    ) -> Result<(), ApiError> {
+        let user_uuid = Uuid::parse_str(user_id)
+            .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
+        let now = Utc::now();
+
+        let query = "INSERT INTO store.concept_positions \
+                    (user_id, concept_text, x, y, z, updated_at) \
+                    VALUES (?, ?, ?, ?, ?, ?)";
+
+        let writes = positions
+            .iter()
+            .map(|(concept_text, [x, y, z])| {
+                Write::new(
+                    concept_text,
+                    query,
+                    query_values!(user_uuid, concept_text.clone(), *x, *y, *z, now),
+                )
+            })
+            .collect();
+
+        self.write_all(writes)
+            .await
+            .into_result("Save concept position error")
     }
 
+    /// Saves a text reference under a caller-chosen `text_id`, so saving it
+    /// again overwrites the same rows.
     pub async fn save_text_reference(
         &self,
+        text_id: Uuid,
         user_id: &str,
         filename: &str,
         url: &str,
         source_url: &str,
         concepts: &[String],
         file_size: Option<i32>,
-    ) -> Result<Uuid, ApiError> {
-        let text_id = Uuid::new_v4();
+    ) -> Result<(), ApiError> {
         let user_uuid = Uuid::parse_str(user_id)
             .map_err(|e| ApiError::InternalError(format!("Invalid UUID: {}", e)))?;
         let now = Utc::now();
@@ -233,47 +1121,40 @@ impl DatabaseClient {
                     (text_id, user_id, filename, url, source_url, concepts, upload_timestamp, file_size) \
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)";
 
-        self.session
-            .query_with_values(
-                query,
-                query_values!(
-                    text_id,
-                    user_uuid,
-                    filename,
-                    url,
-                    source_url,
-                    concepts_vec,
-                    now,
-                    file_size
-                ),
-            )
-            .await
-            .map_err(|e| ApiError::InternalError(format!("Save text reference error: {}", e)))?;
+        self.execute(
+            query,
+            query_values!(
+                text_id,
+                user_uuid,
+                filename,
+                url,
+                source_url,
+                concepts_vec,
+                now,
+                file_size
+            ),
+        )
+        .await
+        .map_err(|e| ApiError::InternalError(format!("Save text reference error: {}", e)))?;
 
         // Insert into concept_text_mapping table for each concept
-        for concept in concepts {
-            let mapping_query = "INSERT INTO store.concept_text_mapping \
-                               (concept_text, user_id, text_id, filename, url, source_url, upload_timestamp) \
-                               VALUES (?, ?, ?, ?, ?, ?, ?)";
-
-            self.session
-                .query_with_values(
+        let mapping_query = "INSERT INTO store.concept_text_mapping \
+                           (concept_text, user_id, text_id, filename, url, source_url, upload_timestamp) \
+                           VALUES (?, ?, ?, ?, ?, ?, ?)";
+        let writes = concepts
+            .iter()
+            .map(|concept| {
+                Write::new(
+                    concept,
                     mapping_query,
-                    query_values!(
-                        concept.clone(),
-                        user_uuid,
-                        text_id,
-                        filename,
-                        url,
-                        source_url,
-                        now
-                    ),
+                    query_values!(concept.clone(), user_uuid, text_id, filename, url, source_url, now),
                 )
-                .await
-                .map_err(|e| ApiError::InternalError(format!("Save concept mapping error: {}", e)))?;
-        }
+            })
+            .collect();
 
-        Ok(text_id)
+        self.write_all(writes)
+            .await
+            .into_result("Save concept mapping error")
     }
 
     pub async fn update_text_url(
@@ -288,60 +1169,63 @@ impl DatabaseClient {
 
         // Update text_references table
         let query = "UPDATE store.text_references SET url = ? WHERE text_id = ?";
-        self.session
-            .query_with_values(query, query_values!(url, text_id))
+        self.execute(query, query_values!(url, text_id))
             .await
             .map_err(|e| ApiError::InternalError(format!("Update text reference url error: {}", e)))?;
 
         // Update concept_text_mapping for each concept
-        for concept in concepts {
-            let mapping_query = "UPDATE store.concept_text_mapping SET url = ? \
-                                WHERE concept_text = ? AND user_id = ? AND text_id = ?";
-            self.session
-                .query_with_values(
+        let mapping_query = "UPDATE store.concept_text_mapping SET url = ? \
+                            WHERE concept_text = ? AND user_id = ? AND text_id = ?";
+        let writes = concepts
+            .iter()
+            .map(|concept| {
+                Write::new(
+                    concept,
                     mapping_query,
                     query_values!(url, concept.clone(), user_uuid, text_id),
                 )
-                .await
-                .map_err(|e| ApiError::InternalError(format!("Update concept mapping url error: {}", e)))?;
-        }
+            })
+            .collect();
 
-        Ok(())
+        self.write_all(writes)
+            .await
+            .into_result("Update concept mapping url error")
     }
 
     pub async fn save_scene(
         &self,
         scene_id: &str,
-        scene_data_json: &str,
+        groups: &[ConceptGroup],
     ) -> Result<(), ApiError> {
         let now = Utc::now();
+        let scene_blob = Blob::new(encode_scene(groups)?);
 
         let query = "INSERT INTO store.scenes \
-                    (scene_id, scene_data, created_at, updated_at) \
+                    (scene_id, scene_blob, created_at, updated_at) \
                     VALUES (?, ?, ?, ?)";
 
-        self.session
-            .query_with_values(
-                query,
-                query_values!(
-                    scene_id.to_string(),
-                    scene_data_json.to_string(),
-                    now,
-                    now
-                ),
-            )
-            .await
-            .map_err(|e| ApiError::InternalError(format!("Save scene error: {}", e)))?;
+        self.execute(
+            query,
+            query_values!(
+                scene_id.to_string(),
+                scene_blob,
+                now,
+                now
+            ),
+        )
+        .await
+        .map_err(|e| ApiError::InternalError(format!("Save scene error: {}", e)))?;
 
         Ok(())
     }
 
-    pub async fn get_scene(&self, scene_id: &str) -> Result<String, ApiError> {
-        let query = "SELECT scene_data FROM store.scenes WHERE scene_id = ?";
+    /// A saved scene, from its binary encoding or, for scenes saved before
+    /// it existed, from the JSON `scene_data` column.
+    pub async fn get_scene(&self, scene_id: &str) -> Result<Vec<ConceptGroup>, ApiError> {
+        let query = "SELECT scene_data, scene_blob FROM store.scenes WHERE scene_id = ?";
 
         let rows = self
-            .session
-            .query_with_values(query, query_values!(scene_id.to_string()))
+            .execute(query, query_values!(scene_id.to_string()))
             .await
             .map_err(|e| ApiError::InternalError(format!("Query error: {}", e)))?
             .response_body()
@@ -353,33 +1237,40 @@ impl DatabaseClient {
             ApiError::SceneNotFound(scene_id.to_string())
         })?;
 
+        if let Some(blob) = row.get_by_name::<Blob>("scene_blob").unwrap_or(None) {
+            return decode_scene(blob.as_slice());
+        }
+
         let scene_data: String = row.get_r_by_name("scene_data").map_err(|e| {
             ApiError::InternalError(format!("Scene data extraction error: {}", e))
         })?;
 
-        Ok(scene_data)
+        serde_json::from_str(&scene_data)
+            .map_err(|e| ApiError::InternalError(format!("JSON deserialization error: {}", e)))
     }
 
+    /// Replaces a scene's data, clearing the legacy JSON column.
     pub async fn update_scene(
         &self,
         scene_id: &str,
-        scene_data_json: &str,
+        groups: &[ConceptGroup],
     ) -> Result<(), ApiError> {
         let now = Utc::now();
-
-        let query = "UPDATE store.scenes SET scene_data = ?, updated_at = ? WHERE scene_id = ?";
-
-        self.session
-            .query_with_values(
-                query,
-                query_values!(
-                    scene_data_json.to_string(),
-                    now,
-                    scene_id.to_string()
-                ),
-            )
-            .await
-            .map_err(|e| ApiError::InternalError(format!("Update scene error: {}", e)))?;
+        let scene_blob = Blob::new(encode_scene(groups)?);
+
+        let query = "UPDATE store.scenes SET scene_blob = ?, scene_data = null, updated_at = ? \
+                    WHERE scene_id = ?";
+
+        self.execute(
+            query,
+            query_values!(
+                scene_blob,
+                now,
+                scene_id.to_string()
+            ),
+        )
+        .await
+        .map_err(|e| ApiError::InternalError(format!("Update scene error: {}", e)))?;
 
         Ok(())
     }
@@ -397,8 +1288,7 @@ impl DatabaseClient {
                     WHERE concept_text = ? AND user_id = ?";
 
         let rows = self
-            .session
-            .query_with_values(query, query_values!(concept, user_uuid))
+            .execute(query, query_values!(concept, user_uuid))
             .await
             .map_err(|e| ApiError::InternalError(format!("Query error: {}", e)))?
             .response_body()
@@ -445,3 +1335,108 @@ impl DatabaseClient {
     }
 
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::arr1;
+
+    #[test]
+    fn test_blob_round_trip_into_one_matrix() {
+        let mut rows = EmbeddingRows::with_capacity(3);
+        assert!(rows.push_le_bytes(&encode_embedding([1.0, -2.5, 0.125])));
+        assert!(rows.push_f64(&[4.0, 5.0, 6.0]));
+        let capacity = rows.data.capacity();
+        assert!(rows.push_le_bytes(&encode_embedding([7.0, 8.0, 9.0])));
+        // Sized once by the first row
+        assert_eq!(rows.data.capacity(), capacity);
+
+        let matrix = rows.into_array();
+        assert_eq!(matrix.dim(), (3, 3));
+        assert_eq!(matrix.row(0).to_vec(), vec![1.0, -2.5, 0.125]);
+        assert_eq!(matrix.row(2).to_vec(), vec![7.0, 8.0, 9.0]);
+    }
+
+    #[test]
+    fn test_reserving_pages_keeps_one_matrix() {
+        let mut rows = EmbeddingRows::with_capacity(0);
+        rows.reserve(2);
+        assert!(rows.push_f64(&[1.0, 2.0]));
+        assert_eq!(rows.data.capacity(), 4);
+        assert!(rows.push_f64(&[3.0, 4.0]));
+
+        rows.reserve(1);
+        assert!(rows.data.capacity() >= 6);
+        assert!(rows.push_f64(&[5.0, 6.0]));
+        assert_eq!(rows.into_array().row(2).to_vec(), vec![5.0, 6.0]);
+    }
+
+    #[test]
+    fn test_native_port_of_contact_points() {
+        assert_eq!(native_port("cassandra:9142"), 9142);
+        assert_eq!(native_port("10.0.0.1:9043"), 9043);
+        assert_eq!(native_port("[::1]:9044"), 9044);
+        assert_eq!(native_port("cassandra"), DEFAULT_NATIVE_PORT);
+        assert_eq!(native_port("::1"), DEFAULT_NATIVE_PORT);
+    }
+
+    #[test]
+    fn test_malformed_rows_are_rejected() {
+        let mut rows = EmbeddingRows::with_capacity(4);
+        assert!(!rows.push_le_bytes(&[]));
+        assert!(!rows.push_le_bytes(&[0, 0, 128]));
+        assert!(rows.push_le_bytes(&encode_embedding([1.0, 2.0])));
+        assert!(!rows.push_f64(&[1.0, 2.0, 3.0]));
+        assert_eq!(rows.into_array().dim(), (1, 2));
+    }
+
+    #[test]
+    fn test_write_report_lists_failed_rows() {
+        let complete = WriteReport {
+            written: 3,
+            failures: vec![],
+        };
+        assert!(complete.into_result("Save").is_ok());
+
+        let partial = WriteReport {
+            written: 2,
+            failures: vec![("ai".to_string(), "timeout".to_string())],
+        };
+        let error = partial.into_result("Save concept mapping error").unwrap_err();
+        assert!(error.to_string().contains("1 of 3 rows failed"));
+    }
+
+    #[test]
+    fn test_concept_ids_ignore_case_and_spacing() {
+        assert_eq!(normalize_concept_text("  Happy\tPrince "), "happy prince");
+        assert_eq!(concept_id("Happy  Prince"), concept_id("happy prince"));
+        assert_ne!(concept_id("happy prince"), concept_id("happy princess"));
+        assert_eq!(concept_id("swallow").get_version_num(), 5);
+    }
+
+    #[test]
+    fn test_appending_a_saved_concept_replaces_it() {
+        let concept = |name: &str| Concept {
+            concept: name.to_string(),
+            importance: 0.5,
+        };
+        let stored = UserConcepts::empty()
+            .with_appended(&[concept("Happy Prince"), concept("swallow")], &[arr1(&[1.0, 1.0]), arr1(&[2.0, 2.0])])
+            .unwrap();
+
+        let updated = stored
+            .with_appended(&[concept("happy prince"), concept("reed")], &[arr1(&[3.0, 3.0]), arr1(&[4.0, 4.0])])
+            .unwrap();
+        let names: Vec<&str> = updated.concepts.iter().map(|c| c.concept.as_str()).collect();
+        assert_eq!(names, vec!["happy prince", "swallow", "reed"]);
+        assert_eq!(updated.embeddings.row(0).to_vec(), vec![3.0, 3.0]);
+        assert_eq!(updated.embeddings.dim(), (3, 2));
+    }
+
+    #[test]
+    fn test_empty_user_has_empty_matrix() {
+        let (concepts, embeddings) = UserConcepts::empty().to_pairs();
+        assert!(concepts.is_empty() && embeddings.is_empty());
+        assert_eq!(EmbeddingRows::with_capacity(0).into_array().dim(), (0, 0));
+    }
+}
@@ -0,0 +1,274 @@
+//! In-process cache of each user's decoded concepts and embeddings.
+//!
+//! Entries are bounded by a byte budget with LRU eviction and updated
+//! write-through as concepts are saved. Every entry carries the version of
+//! the user's concept set in `store.user_concept_versions`; an entry checked
+//! within the last `ttl` is served without touching the database, an older
+//! one only after its version is confirmed, so writes from other replicas
+//! are picked up within `ttl`.
+
+use super::client::UserConcepts;
+use super::lru::ByteLru;
+use crate::models::concepts::Concept;
+use crate::models::embeddings::Embedding;
+use serde::Serialize;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+const DEFAULT_BYTE_BUDGET: usize = 256 * 1024 * 1024;
+
+const DEFAULT_TTL: Duration = Duration::from_secs(60);
+
+/// Approximate heap footprint of a user's concepts.
+fn estimated_bytes(concepts: &UserConcepts) -> usize {
+    std::mem::size_of::<UserConcepts>()
+        + concepts
+            .concepts
+            .iter()
+            .map(|c| std::mem::size_of::<Concept>() + c.concept.len())
+            .sum::<usize>()
+        + concepts.embeddings.len() * std::mem::size_of::<f32>()
+}
+
+/// A cache hit. `fresh` entries were checked within the TTL and can be used
+/// as is; others should be confirmed against the stored version first.
+#[derive(Debug, Clone)]
+pub struct CachedConcepts {
+    pub concepts: Arc<UserConcepts>,
+    pub version: i64,
+    pub fresh: bool,
+}
+
+struct Entry {
+    concepts: Arc<UserConcepts>,
+    version: i64,
+    verified_at: Instant,
+}
+
+#[derive(Debug, Clone, Serialize)]
+pub struct ConceptCacheStats {
+    pub entries: usize,
+    pub bytes: usize,
+    pub byte_budget: usize,
+    pub hits: u64,
+    pub confirmed: u64,
+    pub stale: u64,
+    pub misses: u64,
+}
+
+pub struct UserConceptCache {
+    entries: Mutex<ByteLru<Entry>>,
+    ttl: Duration,
+    hits: AtomicU64,
+    confirmed: AtomicU64,
+    stale: AtomicU64,
+    misses: AtomicU64,
+}
+
+impl UserConceptCache {
+    pub fn new(byte_budget: usize, ttl: Duration) -> Self {
+        Self {
+            entries: Mutex::new(ByteLru::new(byte_budget)),
+            ttl,
+            hits: AtomicU64::new(0),
+            confirmed: AtomicU64::new(0),
+            stale: AtomicU64::new(0),
+            misses: AtomicU64::new(0),
+        }
+    }
+
+    /// Budget from `CONCEPT_CACHE_BYTES` (default 256 MiB, 0 disables) and
+    /// TTL from `CONCEPT_CACHE_TTL_SECS` (default 60).
+    pub fn from_env() -> Self {
+        let byte_budget = std::env::var("CONCEPT_CACHE_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_BYTE_BUDGET);
+        let ttl = std::env::var("CONCEPT_CACHE_TTL_SECS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .map(Duration::from_secs)
+            .unwrap_or(DEFAULT_TTL);
+        Self::new(byte_budget, ttl)
+    }
+
+    pub fn get(&self, user_id: &str) -> Option<CachedConcepts> {
+        let mut entries = self.lock();
+        let Some(entry) = entries.get(user_id) else {
+            self.misses.fetch_add(1, Ordering::Relaxed);
+            return None;
+        };
+        let fresh = entry.verified_at.elapsed() < self.ttl;
+        if fresh {
+            self.hits.fetch_add(1, Ordering::Relaxed);
+        }
+        Some(CachedConcepts {
+            concepts: Arc::clone(&entry.concepts),
+            version: entry.version,
+            fresh,
+        })
+    }
+
+    /// Records that `version` is still current for `user_id`. Returns false,
+    /// dropping the entry, if the cached version differs.
+    pub fn confirm(&self, user_id: &str, version: i64) -> bool {
+        let mut entries = self.lock();
+        match entries.peek_mut(user_id) {
+            Some(entry) if entry.version == version => {
+                entry.verified_at = Instant::now();
+                self.confirmed.fetch_add(1, Ordering::Relaxed);
+                true
+            }
+            Some(_) => {
+                entries.remove(user_id);
+                self.stale.fetch_add(1, Ordering::Relaxed);
+                false
+            }
+            None => false,
+        }
+    }
+
+    /// Caches concepts read from the database at `version`.
+    pub fn put(&self, user_id: &str, concepts: Arc<UserConcepts>, version: i64) {
+        let bytes = estimated_bytes(&concepts);
+        let entry = Entry {
+            concepts,
+            version,
+            verified_at: Instant::now(),
+        };
+        self.lock().insert(user_id, entry, bytes);
+    }
+
+    /// Write-through for newly saved concepts: a cached entry gains the new
+    /// rows and the version the save moves the user to. Users not cached are
+    /// left to the next read. Like `save_concepts`, a save without a single
+    /// non-empty embedding writes nothing and leaves the version alone.
+    pub fn append(&self, user_id: &str, concepts: &[Concept], embeddings: &[Embedding]) {
+        if !concepts.iter().zip(embeddings).any(|(_, e)| !e.is_empty()) {
+            return;
+        }
+        let mut entries = self.lock();
+        let Some(entry) = entries.remove(user_id) else {
+            return;
+        };
+        match entry.concepts.with_appended(concepts, embeddings) {
+            Some(appended) => {
+                let bytes = estimated_bytes(&appended);
+                let appended = Entry {
+                    concepts: Arc::new(appended),
+                    version: entry.version + 1,
+                    ..entry
+                };
+                entries.insert(user_id, appended, bytes);
+            }
+            None => log::warn!("Dropping cached concepts of {}: embedding width changed", user_id),
+        }
+    }
+
+    /// Drops a user's entry, e.g. after a save failed part way.
+    pub fn invalidate(&self, user_id: &str) {
+        self.lock().remove(user_id);
+    }
+
+    pub fn stats(&self) -> ConceptCacheStats {
+        let entries = self.lock();
+        ConceptCacheStats {
+            entries: entries.len(),
+            bytes: entries.bytes(),
+            byte_budget: entries.budget(),
+            hits: self.hits.load(Ordering::Relaxed),
+            confirmed: self.confirmed.load(Ordering::Relaxed),
+            stale: self.stale.load(Ordering::Relaxed),
+            misses: self.misses.load(Ordering::Relaxed),
+        }
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, ByteLru<Entry>> {
+        self.entries.lock().unwrap_or_else(|e| e.into_inner())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::{arr1, Array2};
+
+    fn concept(name: &str) -> Concept {
+        Concept {
+            concept: name.to_string(),
+            importance: 0.5,
+        }
+    }
+
+    fn user_concepts(n: usize) -> Arc<UserConcepts> {
+        Arc::new(UserConcepts {
+            concepts: (0..n).map(|i| concept(&format!("c{}", i))).collect(),
+            embeddings: Array2::from_elem((n, 4), 1.0),
+            legacy_rows: 0,
+        })
+    }
+
+    #[test]
+    fn test_fresh_until_ttl_then_needs_confirmation() {
+        let cache = UserConceptCache::new(DEFAULT_BYTE_BUDGET, Duration::from_secs(60));
+        assert!(cache.get("u").is_none());
+        cache.put("u", user_concepts(2), 7);
+        let hit = cache.get("u").unwrap();
+        assert!(hit.fresh);
+        assert_eq!((hit.version, hit.concepts.concepts.len()), (7, 2));
+
+        let expired = UserConceptCache::new(DEFAULT_BYTE_BUDGET, Duration::ZERO);
+        expired.put("u", user_concepts(2), 7);
+        assert!(!expired.get("u").unwrap().fresh);
+        assert!(expired.confirm("u", 7));
+        // Another replica saved concepts in the meantime
+        assert!(!expired.confirm("u", 8));
+        assert!(expired.get("u").is_none());
+        assert_eq!(expired.stats().stale, 1);
+    }
+
+    #[test]
+    fn test_append_writes_through_and_bumps_version() {
+        let cache = UserConceptCache::new(DEFAULT_BYTE_BUDGET, Duration::from_secs(60));
+        cache.put("u", user_concepts(2), 3);
+        cache.append("u", &[concept("new")], &[arr1(&[0.0, 1.0, 2.0, 3.0])]);
+
+        let hit = cache.get("u").unwrap();
+        assert_eq!(hit.version, 4);
+        assert_eq!(hit.concepts.concepts[2].concept, "new");
+        assert_eq!(hit.concepts.embeddings.row(2).to_vec(), vec![0.0, 1.0, 2.0, 3.0]);
+
+        // A mismatched width cannot be appended, the entry is dropped
+        cache.append("u", &[concept("odd")], &[arr1(&[1.0])]);
+        assert!(cache.get("u").is_none());
+
+        // Nothing to write, nothing to bump
+        cache.put("u", user_concepts(2), 3);
+        cache.append("u", &[concept("empty")], &[arr1(&[])]);
+        let hit = cache.get("u").unwrap();
+        assert_eq!((hit.version, hit.concepts.concepts.len()), (3, 2));
+
+        // Users not cached stay uncached
+        cache.append("v", &[concept("new")], &[arr1(&[0.0, 1.0, 2.0, 3.0])]);
+        assert!(cache.get("v").is_none());
+    }
+
+    #[test]
+    fn test_byte_budget_evicts_least_recently_used() {
+        let entry_bytes = estimated_bytes(&user_concepts(8));
+        let cache = UserConceptCache::new(entry_bytes * 2, Duration::from_secs(60));
+        cache.put("a", user_concepts(8), 0);
+        cache.put("b", user_concepts(8), 0);
+        assert!(cache.get("a").is_some());
+
+        cache.put("c", user_concepts(8), 0);
+        assert!(cache.get("b").is_none());
+        assert!(cache.get("a").is_some());
+        assert!(cache.stats().bytes <= entry_bytes * 2);
+
+        let tiny = UserConceptCache::new(16, Duration::from_secs(60));
+        tiny.put("a", user_concepts(8), 0);
+        assert_eq!(tiny.stats().entries, 0);
+    }
+}
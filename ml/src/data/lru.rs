@@ -0,0 +1,136 @@
+//! Least-recently-used map bounded by the byte size of its values, behind
+//! the in-process caches of concepts and scenes.
+
+use std::collections::{BTreeMap, HashMap};
+
+struct Slot<V> {
+    value: V,
+    bytes: usize,
+    tick: u64,
+}
+
+pub struct ByteLru<V> {
+    slots: HashMap<String, Slot<V>>,
+    /// Last-use tick of every entry, oldest first.
+    recency: BTreeMap<u64, String>,
+    tick: u64,
+    bytes: usize,
+    budget: usize,
+}
+
+impl<V> ByteLru<V> {
+    pub fn new(budget: usize) -> Self {
+        Self {
+            slots: HashMap::new(),
+            recency: BTreeMap::new(),
+            tick: 0,
+            bytes: 0,
+            budget,
+        }
+    }
+
+    /// The value for `key`, marked as most recently used.
+    pub fn get(&mut self, key: &str) -> Option<&mut V> {
+        self.tick += 1;
+        let slot = self.slots.get_mut(key)?;
+        self.recency.remove(&slot.tick);
+        slot.tick = self.tick;
+        self.recency.insert(self.tick, key.to_string());
+        Some(&mut slot.value)
+    }
+
+    /// The value for `key` without changing its recency.
+    pub fn peek_mut(&mut self, key: &str) -> Option<&mut V> {
+        self.slots.get_mut(key).map(|slot| &mut slot.value)
+    }
+
+    /// Inserts `value`, evicting the least recently used entries until it
+    /// fits. Values larger than the whole budget are not kept.
+    pub fn insert(&mut self, key: &str, value: V, bytes: usize) {
+        self.remove(key);
+        if bytes > self.budget {
+            return;
+        }
+        while self.bytes + bytes > self.budget {
+            match self.recency.pop_first() {
+                Some((_, oldest)) => {
+                    if let Some(evicted) = self.slots.remove(&oldest) {
+                        self.bytes -= evicted.bytes;
+                    }
+                }
+                None => break,
+            }
+        }
+
+        self.tick += 1;
+        self.recency.insert(self.tick, key.to_string());
+        self.bytes += bytes;
+        self.slots.insert(
+            key.to_string(),
+            Slot {
+                value,
+                bytes,
+                tick: self.tick,
+            },
+        );
+    }
+
+    pub fn remove(&mut self, key: &str) -> Option<V> {
+        let slot = self.slots.remove(key)?;
+        self.recency.remove(&slot.tick);
+        self.bytes -= slot.bytes;
+        Some(slot.value)
+    }
+
+    pub fn len(&self) -> usize {
+        self.slots.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.slots.is_empty()
+    }
+
+    pub fn bytes(&self) -> usize {
+        self.bytes
+    }
+
+    pub fn budget(&self) -> usize {
+        self.budget
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_evicts_least_recently_used_to_fit() {
+        let mut lru = ByteLru::new(10);
+        lru.insert("a", 1, 4);
+        lru.insert("b", 2, 4);
+        assert_eq!(lru.get("a"), Some(&mut 1));
+
+        lru.insert("c", 3, 4);
+        assert!(lru.get("b").is_none());
+        assert_eq!((lru.len(), lru.bytes()), (2, 8));
+
+        // Peeking does not protect "a" from eviction
+        lru.peek_mut("a");
+        lru.insert("d", 4, 4);
+        assert!(lru.get("a").is_none());
+        assert!(lru.get("c").is_some());
+    }
+
+    #[test]
+    fn test_replacing_and_oversized_values() {
+        let mut lru = ByteLru::new(10);
+        lru.insert("a", 1, 6);
+        lru.insert("a", 2, 3);
+        assert_eq!((lru.len(), lru.bytes()), (1, 3));
+
+        lru.insert("big", 3, 11);
+        assert!(lru.get("big").is_none());
+        assert_eq!(lru.remove("a"), Some(2));
+        assert!(lru.is_empty() && lru.bytes() == 0);
+    }
+}
@@ -1,4 +1,11 @@
 pub mod client;
 pub mod cdn;
+pub mod concept_cache;
+pub mod lru;
+pub mod nodes;
+pub mod scene;
+pub mod scene_cache;
 pub mod scraper;
+pub mod statements;
+pub mod write_behind;
 pub use client::*;
\ No newline at end of file
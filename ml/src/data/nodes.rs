@@ -0,0 +1,165 @@
+//! Health and latency of the Cassandra nodes behind `DatabaseClient`.
+//!
+//! The driver routes each request to a replica itself, so per-request
+//! latency is not attributed to a node. Instead every known node (the
+//! contact points plus peers discovered from `system.peers`) is probed with a
+//! TCP connect on its native port, and the results are kept here.
+
+use serde::Serialize;
+use std::collections::BTreeMap;
+use std::sync::Mutex;
+use std::time::{Duration, Instant};
+use tokio::net::TcpStream;
+
+/// Weight of the newest probe in the moving latency average.
+const LATENCY_SMOOTHING: f64 = 0.2;
+
+/// Consecutive failed probes before a node is reported down.
+const DOWN_AFTER_FAILURES: u32 = 2;
+
+#[derive(Debug, Clone, Default, Serialize)]
+pub struct NodeStats {
+    pub address: String,
+    pub up: bool,
+    pub probes: u64,
+    pub failures: u64,
+    pub consecutive_failures: u32,
+    pub last_latency_ms: Option<f64>,
+    pub avg_latency_ms: Option<f64>,
+    pub last_error: Option<String>,
+}
+
+impl NodeStats {
+    fn record(&mut self, result: Result<Duration, String>) {
+        self.probes += 1;
+        match result {
+            Ok(latency) => {
+                let ms = latency.as_secs_f64() * 1000.0;
+                self.last_latency_ms = Some(ms);
+                self.avg_latency_ms = Some(match self.avg_latency_ms {
+                    Some(avg) => avg + LATENCY_SMOOTHING * (ms - avg),
+                    None => ms,
+                });
+                self.consecutive_failures = 0;
+                self.up = true;
+            }
+            Err(e) => {
+                self.failures += 1;
+                self.consecutive_failures += 1;
+                self.last_error = Some(e);
+                if self.consecutive_failures >= DOWN_AFTER_FAILURES {
+                    self.up = false;
+                }
+            }
+        }
+    }
+}
+
+/// Probe results by node address.
+#[derive(Default)]
+pub struct NodeHealth {
+    nodes: Mutex<BTreeMap<String, NodeStats>>,
+}
+
+impl NodeHealth {
+    /// Tracks `addresses`, assumed up until probed.
+    pub fn new<'a>(addresses: impl IntoIterator<Item = &'a str>) -> Self {
+        let health = Self::default();
+        for address in addresses {
+            health.track(address);
+        }
+        health
+    }
+
+    /// Starts tracking `address` if it is not known yet.
+    pub fn track(&self, address: &str) {
+        self.lock()
+            .entry(address.to_string())
+            .or_insert_with(|| NodeStats {
+                address: address.to_string(),
+                up: true,
+                ..NodeStats::default()
+            });
+    }
+
+    pub fn addresses(&self) -> Vec<String> {
+        self.lock().keys().cloned().collect()
+    }
+
+    pub fn record(&self, address: &str, result: Result<Duration, String>) {
+        self.track(address);
+        if let Some(stats) = self.lock().get_mut(address) {
+            stats.record(result);
+        }
+    }
+
+    /// Probes every tracked node concurrently.
+    pub async fn probe_all(&self, timeout: Duration) {
+        let addresses = self.addresses();
+        let results = futures::future::join_all(addresses.iter().map(|a| probe(a, timeout))).await;
+        for (address, result) in addresses.iter().zip(results) {
+            self.record(address, result);
+        }
+    }
+
+    pub fn snapshot(&self) -> Vec<NodeStats> {
+        self.lock().values().cloned().collect()
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, BTreeMap<String, NodeStats>> {
+        self.nodes.lock().unwrap_or_else(|e| e.into_inner())
+    }
+}
+
+/// Time to open a TCP connection to `address`.
+async fn probe(address: &str, timeout: Duration) -> Result<Duration, String> {
+    let started = Instant::now();
+    match tokio::time::timeout(timeout, TcpStream::connect(address)).await {
+        Ok(Ok(_)) => Ok(started.elapsed()),
+        Ok(Err(e)) => Err(e.to_string()),
+        Err(_) => Err(format!("no answer within {:?}", timeout)),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_latency_average_and_down_after_repeated_failures() {
+        let health = NodeHealth::new(["db1:9042"]);
+        health.record("db1:9042", Ok(Duration::from_millis(10)));
+        health.record("db1:9042", Ok(Duration::from_millis(20)));
+
+        let stats = &health.snapshot()[0];
+        assert_eq!(stats.last_latency_ms, Some(20.0));
+        assert!((stats.avg_latency_ms.unwrap() - 12.0).abs() < 1e-9);
+
+        health.record("db1:9042", Err("refused".to_string()));
+        assert!(health.snapshot()[0].up);
+        health.record("db1:9042", Err("refused".to_string()));
+        let stats = &health.snapshot()[0];
+        assert!(!stats.up);
+        assert_eq!((stats.probes, stats.failures), (4, 2));
+
+        health.record("db1:9042", Ok(Duration::from_millis(5)));
+        assert!(health.snapshot()[0].up);
+    }
+
+    #[test]
+    fn test_discovered_nodes_are_tracked_once() {
+        let health = NodeHealth::new(["db1:9042", "db2:9042"]);
+        health.track("db2:9042");
+        health.track("db3:9042");
+        assert_eq!(health.addresses(), vec!["db1:9042", "db2:9042", "db3:9042"]);
+    }
+
+    #[tokio::test]
+    async fn test_unreachable_node_fails_probe() {
+        let health = NodeHealth::new(["127.0.0.1:1"]);
+        health.probe_all(Duration::from_millis(200)).await;
+        let stats = &health.snapshot()[0];
+        assert_eq!(stats.failures, 1);
+        assert!(stats.last_error.is_some());
+    }
+}
@@ -0,0 +1,343 @@
+//! Binary encoding of saved scenes.
+//!
+//! A scene is stored as a 4-byte magic, a format version and a zstd frame.
+//! The frame holds the groups column by column, so similar values sit next
+//! to each other for the compressor:
+//!
+//! - concept strings, each distinct string once, referenced by index
+//! - per group: concept count, then all concept indices
+//! - per group: position length, then all positions as f32 (triples in practice)
+//! - importance scores as f32
+//! - group ids, zigzag deltas from the previous id
+//! - per group: connection count, then connections as zigzag deltas from the
+//!   previous neighbour, starting at the group's own index
+//! - per group: weight count, then all weights as f32
+//!
+//! Counts and indices are LEB128 varints. Values round-trip exactly.
+
+use crate::dimensionality::ConceptGroup;
+use crate::error::ApiError;
+use std::collections::HashMap;
+
+const MAGIC: &[u8; 4] = b"OSCN";
+
+pub const SCENE_FORMAT_VERSION: u8 = 1;
+
+const ZSTD_LEVEL: i32 = 3;
+
+/// Whether `bytes` start like an encoded scene, as opposed to legacy JSON.
+pub fn is_encoded_scene(bytes: &[u8]) -> bool {
+    bytes.starts_with(MAGIC)
+}
+
+pub fn encode_scene(groups: &[ConceptGroup]) -> Result<Vec<u8>, ApiError> {
+    let mut body = Writer::default();
+    body.varint(groups.len() as u64);
+
+    let mut interned: HashMap<&str, usize> = HashMap::new();
+    let mut strings: Vec<&str> = Vec::new();
+    let indices: Vec<Vec<usize>> = groups
+        .iter()
+        .map(|g| {
+            g.concepts
+                .iter()
+                .map(|c| {
+                    *interned.entry(c.as_str()).or_insert_with(|| {
+                        strings.push(c.as_str());
+                        strings.len() - 1
+                    })
+                })
+                .collect()
+        })
+        .collect();
+
+    body.varint(strings.len() as u64);
+    for s in &strings {
+        body.varint(s.len() as u64);
+        body.bytes.extend_from_slice(s.as_bytes());
+    }
+    for group in &indices {
+        body.varint(group.len() as u64);
+    }
+    for &index in indices.iter().flatten() {
+        body.varint(index as u64);
+    }
+
+    for g in groups {
+        body.varint(g.reduced_embedding.len() as u64);
+    }
+    for g in groups {
+        g.reduced_embedding.iter().for_each(|&v| body.f32(v));
+    }
+    for g in groups {
+        body.f32(g.importance_score);
+    }
+
+    let mut previous = 0i64;
+    for g in groups {
+        body.zigzag(g.group_id as i64 - previous);
+        previous = g.group_id as i64;
+    }
+
+    for g in groups {
+        body.varint(g.connections.len() as u64);
+    }
+    for (i, g) in groups.iter().enumerate() {
+        let mut previous = i as i64;
+        for &j in &g.connections {
+            body.zigzag(j as i64 - previous);
+            previous = j as i64;
+        }
+    }
+
+    for g in groups {
+        body.varint(g.connection_weights.len() as u64);
+    }
+    for g in groups {
+        g.connection_weights.iter().for_each(|&w| body.f32(w));
+    }
+
+    let compressed = zstd::encode_all(body.bytes.as_slice(), ZSTD_LEVEL)
+        .map_err(|e| ApiError::InternalError(format!("Scene compression error: {}", e)))?;
+
+    let mut encoded = Vec::with_capacity(MAGIC.len() + 1 + compressed.len());
+    encoded.extend_from_slice(MAGIC);
+    encoded.push(SCENE_FORMAT_VERSION);
+    encoded.extend_from_slice(&compressed);
+    Ok(encoded)
+}
+
+pub fn decode_scene(bytes: &[u8]) -> Result<Vec<ConceptGroup>, ApiError> {
+    if !is_encoded_scene(bytes) || bytes.len() <= MAGIC.len() {
+        return Err(corrupt("missing header"));
+    }
+    let version = bytes[MAGIC.len()];
+    if version != SCENE_FORMAT_VERSION {
+        return Err(ApiError::InternalError(format!("Unsupported scene format version {}", version)));
+    }
+
+    let body = zstd::decode_all(&bytes[MAGIC.len() + 1..])
+        .map_err(|e| ApiError::InternalError(format!("Scene decompression error: {}", e)))?;
+    let mut r = Reader { bytes: &body, pos: 0 };
+
+    let n = r.count()?;
+    let string_count = r.count()?;
+    let mut strings = Vec::with_capacity(string_count);
+    for _ in 0..string_count {
+        let len = r.count()?;
+        let s = std::str::from_utf8(r.take(len)?).map_err(|_| corrupt("invalid concept text"))?;
+        strings.push(s.to_string());
+    }
+
+    let concept_counts = r.counts(n)?;
+    let mut concepts = Vec::with_capacity(n);
+    for &count in &concept_counts {
+        let mut group = Vec::with_capacity(count);
+        for _ in 0..count {
+            let index = r.count()?;
+            group.push(strings.get(index).ok_or_else(|| corrupt("concept index"))?.clone());
+        }
+        concepts.push(group);
+    }
+
+    let embedding_lens = r.counts(n)?;
+    let mut embeddings = Vec::with_capacity(n);
+    for &len in &embedding_lens {
+        embeddings.push(r.f32s(len)?);
+    }
+    let importances = r.f32s(n)?;
+
+    let mut group_ids = Vec::with_capacity(n);
+    let mut previous = 0i64;
+    for _ in 0..n {
+        previous += r.zigzag()?;
+        group_ids.push(usize::try_from(previous).map_err(|_| corrupt("group id"))?);
+    }
+
+    let connection_counts = r.counts(n)?;
+    let mut connections = Vec::with_capacity(n);
+    for (i, &count) in connection_counts.iter().enumerate() {
+        let mut previous = i as i64;
+        let mut group = Vec::with_capacity(count);
+        for _ in 0..count {
+            previous += r.zigzag()?;
+            group.push(usize::try_from(previous).map_err(|_| corrupt("connection"))?);
+        }
+        connections.push(group);
+    }
+
+    let weight_counts = r.counts(n)?;
+    let mut weights = Vec::with_capacity(n);
+    for &count in &weight_counts {
+        weights.push(r.f32s(count)?);
+    }
+
+    Ok(concepts
+        .into_iter()
+        .zip(embeddings)
+        .zip(importances)
+        .zip(group_ids)
+        .zip(connections.into_iter().zip(weights))
+        .map(
+            |((((concepts, reduced_embedding), importance_score), group_id), (connections, connection_weights))| {
+                ConceptGroup {
+                    concepts,
+                    reduced_embedding,
+                    connections,
+                    connection_weights,
+                    importance_score,
+                    group_id,
+                }
+            },
+        )
+        .collect())
+}
+
+fn corrupt(what: &str) -> ApiError {
+    ApiError::InternalError(format!("Corrupt scene data: {}", what))
+}
+
+#[derive(Default)]
+struct Writer {
+    bytes: Vec<u8>,
+}
+
+impl Writer {
+    fn varint(&mut self, mut v: u64) {
+        while v >= 0x80 {
+            self.bytes.push(v as u8 | 0x80);
+            v >>= 7;
+        }
+        self.bytes.push(v as u8);
+    }
+
+    fn zigzag(&mut self, v: i64) {
+        self.varint(((v << 1) ^ (v >> 63)) as u64);
+    }
+
+    fn f32(&mut self, v: f32) {
+        self.bytes.extend_from_slice(&v.to_le_bytes());
+    }
+}
+
+struct Reader<'a> {
+    bytes: &'a [u8],
+    pos: usize,
+}
+
+impl<'a> Reader<'a> {
+    fn take(&mut self, len: usize) -> Result<&'a [u8], ApiError> {
+        let end = self.pos.checked_add(len).filter(|&end| end <= self.bytes.len());
+        let end = end.ok_or_else(|| corrupt("truncated"))?;
+        let slice = &self.bytes[self.pos..end];
+        self.pos = end;
+        Ok(slice)
+    }
+
+    fn varint(&mut self) -> Result<u64, ApiError> {
+        let mut value = 0u64;
+        for shift in (0..64).step_by(7) {
+            let byte = self.take(1)?[0];
+            value |= ((byte & 0x7f) as u64) << shift;
+            if byte & 0x80 == 0 {
+                return Ok(value);
+            }
+        }
+        Err(corrupt("varint too long"))
+    }
+
+    /// A length, which can never exceed the bytes left.
+    fn count(&mut self) -> Result<usize, ApiError> {
+        let v = self.varint()?;
+        if v > (self.bytes.len() - self.pos) as u64 * 8 + 8 {
+            return Err(corrupt("length out of range"));
+        }
+        Ok(v as usize)
+    }
+
+    fn counts(&mut self, n: usize) -> Result<Vec<usize>, ApiError> {
+        (0..n).map(|_| self.count()).collect()
+    }
+
+    fn zigzag(&mut self) -> Result<i64, ApiError> {
+        let v = self.varint()?;
+        Ok((v >> 1) as i64 ^ -((v & 1) as i64))
+    }
+
+    fn f32s(&mut self, n: usize) -> Result<Vec<f32>, ApiError> {
+        let bytes = self.take(n.checked_mul(4).ok_or_else(|| corrupt("length out of range"))?)?;
+        Ok(bytes
+            .chunks_exact(4)
+            .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]))
+            .collect())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn group(concepts: &[&str], position: [f32; 3], connections: Vec<usize>, weights: Vec<f32>, id: usize) -> ConceptGroup {
+        ConceptGroup {
+            concepts: concepts.iter().map(|c| c.to_string()).collect(),
+            reduced_embedding: position.to_vec(),
+            connections,
+            connection_weights: weights,
+            importance_score: 0.25 * id as f32,
+            group_id: id,
+        }
+    }
+
+    fn scene() -> Vec<ConceptGroup> {
+        vec![
+            group(&["Happy Prince", "golden statue"], [0.754, 3.418, -7.5], vec![1, 2], vec![0.9, 0.4], 0),
+            group(&["swallow"], [5.7, -0.47, -1.16], vec![0], vec![], 1),
+            // Strings shared with other groups are interned once
+            group(&["Happy Prince", "reed"], [f32::MIN_POSITIVE, 1e9, -0.0], vec![], vec![], 7),
+        ]
+    }
+
+    #[test]
+    fn test_round_trip_is_exact() {
+        let groups = scene();
+        let encoded = encode_scene(&groups).unwrap();
+        assert!(is_encoded_scene(&encoded));
+        assert_eq!(encoded[4], SCENE_FORMAT_VERSION);
+
+        let decoded = decode_scene(&encoded).unwrap();
+        assert_eq!(decoded.len(), groups.len());
+        for (a, b) in groups.iter().zip(&decoded) {
+            assert_eq!(a.concepts, b.concepts);
+            assert_eq!(a.reduced_embedding, b.reduced_embedding);
+            assert_eq!(a.connections, b.connections);
+            assert_eq!(a.connection_weights, b.connection_weights);
+            assert_eq!(a.importance_score, b.importance_score);
+            assert_eq!(a.group_id, b.group_id);
+        }
+        assert!(decode_scene(&encode_scene(&[]).unwrap()).unwrap().is_empty());
+    }
+
+    #[test]
+    fn test_smaller_than_json_for_large_scenes() {
+        let groups: Vec<ConceptGroup> = (0..2_000)
+            .map(|i| {
+                let name = format!("concept {}", i);
+                group(&[&name], [i as f32 * 0.01, 1.5, -2.0], vec![(i + 1) % 2_000], vec![0.5], i)
+            })
+            .collect();
+        let json = serde_json::to_vec(&groups).unwrap();
+        let encoded = encode_scene(&groups).unwrap();
+        assert!(encoded.len() * 3 < json.len(), "{} vs {} bytes", encoded.len(), json.len());
+    }
+
+    #[test]
+    fn test_rejects_json_and_unknown_versions() {
+        assert!(!is_encoded_scene(br#"[{"concepts": []}]"#));
+        assert!(decode_scene(br#"[{"concepts": []}]"#).is_err());
+
+        let mut encoded = encode_scene(&scene()).unwrap();
+        encoded[4] = SCENE_FORMAT_VERSION + 1;
+        assert!(decode_scene(&encoded).is_err());
+        assert!(decode_scene(&encoded[..5]).is_err());
+    }
+}
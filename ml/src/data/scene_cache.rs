@@ -0,0 +1,168 @@
+//! Hot-scene cache in front of `DatabaseClient::get_scene`.
+//!
+//! Keeps the serialized response body of recently requested scenes with a
+//! strong ETag of that body, so a popular shared link is answered, or
+//! revalidated with a 304, without reading or re-encoding the scene. Saving
+//! a scene drops its entry; entries also expire after `ttl` so updates made
+//! through another replica are seen.
+
+use super::lru::ByteLru;
+use crate::dimensionality::cache::fnv1a_128;
+use bytes::Bytes;
+use serde::Serialize;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::Mutex;
+use std::time::{Duration, Instant};
+
+const DEFAULT_BYTE_BUDGET: usize = 64 * 1024 * 1024;
+
+const DEFAULT_TTL: Duration = Duration::from_secs(300);
+
+/// A scene response ready to send.
+#[derive(Debug, Clone)]
+pub struct CachedScene {
+    pub body: Bytes,
+    /// Opaque tag, without quotes, that changes whenever `body` does.
+    pub etag: String,
+}
+
+impl CachedScene {
+    pub fn new(body: Vec<u8>) -> Self {
+        let etag = format!("{:032x}", fnv1a_128(&[&body]));
+        Self {
+            body: Bytes::from(body),
+            etag,
+        }
+    }
+}
+
+struct Entry {
+    scene: CachedScene,
+    cached_at: Instant,
+}
+
+#[derive(Debug, Clone, Serialize)]
+pub struct SceneCacheStats {
+    pub entries: usize,
+    pub bytes: usize,
+    pub byte_budget: usize,
+    pub hits: u64,
+    pub misses: u64,
+}
+
+pub struct SceneCache {
+    entries: Mutex<ByteLru<Entry>>,
+    ttl: Duration,
+    max_age: u32,
+    hits: AtomicU64,
+    misses: AtomicU64,
+}
+
+impl SceneCache {
+    pub fn new(byte_budget: usize, ttl: Duration, max_age: u32) -> Self {
+        Self {
+            entries: Mutex::new(ByteLru::new(byte_budget)),
+            ttl,
+            max_age,
+            hits: AtomicU64::new(0),
+            misses: AtomicU64::new(0),
+        }
+    }
+
+    /// Budget from `SCENE_CACHE_BYTES` (default 64 MiB), TTL from
+    /// `SCENE_CACHE_TTL_SECS` (default 300) and the `max-age` sent to
+    /// clients from `SCENE_MAX_AGE_SECS` (default 0, always revalidate).
+    pub fn from_env() -> Self {
+        let byte_budget = std::env::var("SCENE_CACHE_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_BYTE_BUDGET);
+        let ttl = std::env::var("SCENE_CACHE_TTL_SECS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .map(Duration::from_secs)
+            .unwrap_or(DEFAULT_TTL);
+        let max_age = std::env::var("SCENE_MAX_AGE_SECS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(0);
+        Self::new(byte_budget, ttl, max_age)
+    }
+
+    /// Seconds clients and proxies may reuse a scene without revalidating.
+    pub fn max_age(&self) -> u32 {
+        self.max_age
+    }
+
+    pub fn get(&self, scene_id: &str) -> Option<CachedScene> {
+        let mut entries = self.lock();
+        let expired = match entries.get(scene_id) {
+            Some(entry) if entry.cached_at.elapsed() < self.ttl => {
+                self.hits.fetch_add(1, Ordering::Relaxed);
+                return Some(entry.scene.clone());
+            }
+            Some(_) => true,
+            None => false,
+        };
+        if expired {
+            entries.remove(scene_id);
+        }
+        self.misses.fetch_add(1, Ordering::Relaxed);
+        None
+    }
+
+    pub fn put(&self, scene_id: &str, scene: CachedScene) {
+        let bytes = scene.body.len() + scene.etag.len() + scene_id.len();
+        let entry = Entry {
+            scene,
+            cached_at: Instant::now(),
+        };
+        self.lock().insert(scene_id, entry, bytes);
+    }
+
+    pub fn invalidate(&self, scene_id: &str) {
+        self.lock().remove(scene_id);
+    }
+
+    pub fn stats(&self) -> SceneCacheStats {
+        let entries = self.lock();
+        SceneCacheStats {
+            entries: entries.len(),
+            bytes: entries.bytes(),
+            byte_budget: entries.budget(),
+            hits: self.hits.load(Ordering::Relaxed),
+            misses: self.misses.load(Ordering::Relaxed),
+        }
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, ByteLru<Entry>> {
+        self.entries.lock().unwrap_or_else(|e| e.into_inner())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_etag_follows_body() {
+        let a = CachedScene::new(b"[1]".to_vec());
+        assert_eq!(a.etag, CachedScene::new(b"[1]".to_vec()).etag);
+        assert_ne!(a.etag, CachedScene::new(b"[2]".to_vec()).etag);
+    }
+
+    #[test]
+    fn test_hits_until_invalidated_or_expired() {
+        let cache = SceneCache::new(DEFAULT_BYTE_BUDGET, DEFAULT_TTL, 0);
+        assert!(cache.get("s").is_none());
+        cache.put("s", CachedScene::new(b"{}".to_vec()));
+        assert_eq!(cache.get("s").unwrap().body, Bytes::from_static(b"{}"));
+        cache.invalidate("s");
+        assert!(cache.get("s").is_none());
+
+        let expiring = SceneCache::new(DEFAULT_BYTE_BUDGET, Duration::ZERO, 0);
+        expiring.put("s", CachedScene::new(b"{}".to_vec()));
+        assert!(expiring.get("s").is_none());
+        assert_eq!(expiring.stats().entries, 0);
+    }
+}
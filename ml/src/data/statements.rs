@@ -0,0 +1,101 @@
+//! Prepared statement cache for `DatabaseClient`.
+//!
+//! Statements are prepared on first use and kept by query text, so repeated
+//! INSERTs and SELECTs skip CQL parsing on the coordinator. A node that has
+//! evicted a statement answers UNPREPARED; the statement is then prepared
+//! again and the request retried once.
+
+use super::client::CurrentSession;
+use cdrs_tokio::error::{Error, Result};
+use cdrs_tokio::frame::message_error::ErrorType;
+use cdrs_tokio::frame::Envelope;
+use cdrs_tokio::query::{PreparedQuery, QueryValues, StatementParams, StatementParamsBuilder};
+use serde::Serialize;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, RwLock};
+
+#[derive(Debug, Clone, Serialize)]
+pub struct StatementCacheStats {
+    pub statements: usize,
+    pub prepares: u64,
+    pub reprepares: u64,
+}
+
+#[derive(Default)]
+pub struct StatementCache {
+    prepared: RwLock<HashMap<&'static str, Arc<PreparedQuery>>>,
+    prepares: AtomicU64,
+    reprepares: AtomicU64,
+}
+
+fn is_unprepared(error: &Error) -> bool {
+    matches!(error, Error::Server { body, .. } if matches!(body.ty, ErrorType::Unprepared(_)))
+}
+
+impl StatementCache {
+    pub fn new() -> Self {
+        Self::default()
+    }
+
+    /// Executes `query` as a prepared statement, preparing it if needed.
+    pub async fn execute(
+        &self,
+        session: &CurrentSession,
+        query: &'static str,
+        values: QueryValues,
+    ) -> Result<Envelope> {
+        let params = StatementParamsBuilder::new().with_values(values).build();
+        self.execute_with_params(session, query, &params).await
+    }
+
+    /// Like `execute`, with explicit parameters such as a page size and
+    /// paging state.
+    pub async fn execute_with_params(
+        &self,
+        session: &CurrentSession,
+        query: &'static str,
+        params: &StatementParams,
+    ) -> Result<Envelope> {
+        let prepared = match self.cached(query) {
+            Some(prepared) => prepared,
+            None => self.prepare(session, query).await?,
+        };
+
+        match session.exec_with_params(&prepared, params).await {
+            Err(e) if is_unprepared(&e) => {
+                log::warn!("Statement was evicted by the server, preparing again: {}", query);
+                self.reprepares.fetch_add(1, Ordering::Relaxed);
+                let prepared = self.prepare(session, query).await?;
+                session.exec_with_params(&prepared, params).await
+            }
+            result => result,
+        }
+    }
+
+    pub fn stats(&self) -> StatementCacheStats {
+        StatementCacheStats {
+            statements: self.read().len(),
+            prepares: self.prepares.load(Ordering::Relaxed),
+            reprepares: self.reprepares.load(Ordering::Relaxed),
+        }
+    }
+
+    fn cached(&self, query: &str) -> Option<Arc<PreparedQuery>> {
+        self.read().get(query).cloned()
+    }
+
+    async fn prepare(&self, session: &CurrentSession, query: &'static str) -> Result<Arc<PreparedQuery>> {
+        let prepared = Arc::new(session.prepare(query).await?);
+        self.prepares.fetch_add(1, Ordering::Relaxed);
+        self.prepared
+            .write()
+            .unwrap_or_else(|e| e.into_inner())
+            .insert(query, Arc::clone(&prepared));
+        Ok(prepared)
+    }
+
+    fn read(&self) -> std::sync::RwLockReadGuard<'_, HashMap<&'static str, Arc<PreparedQuery>>> {
+        self.prepared.read().unwrap_or_else(|e| e.into_inner())
+    }
+}
@@ -0,0 +1,1206 @@
+//! Write-behind queue for persistence that does not have to finish before a
+//! response is sent: new concepts, layout positions and text references.
+//!
+//! Each job is appended to a local spool file by a dedicated writer thread
+//! and then handed to a fixed pool of workers through a bounded channel. A
+//! worker takes the jobs waiting, up to `batch_size`, merges concept and
+//! position saves of the same user, and retries failed writes with
+//! exponential backoff. A job's spool record is marked done once it succeeds
+//! or is given up, so jobs still pending when the process stops are replayed
+//! on the next start. When the channel is full `enqueue` waits for room,
+//! slowing uploads down instead of letting writes pile up.
+//!
+//! Retries within a run only send the statements that failed, so a concept's
+//! occurrence count is added once. Replay is at least once though: a job
+//! whose writes landed before the process died, but whose done record did
+//! not, is written again on the next start and adds its occurrences twice.
+
+use super::cdn::github::GitHubCDN;
+use super::client::{
+    concept_id, encode_embedding, ConceptSaveReport, ConceptStatement, ConceptStatements, DatabaseClient,
+};
+use super::concept_cache::UserConceptCache;
+use crate::error::ApiError;
+use crate::models::concepts::Concept;
+use crate::models::embeddings::Embedding;
+use log::{error, info, warn};
+use ndarray::Array1;
+use serde::{Deserialize, Serialize};
+use std::collections::{HashMap, HashSet};
+use std::fs::{File, OpenOptions};
+use std::io::{BufRead, BufReader, BufWriter, Write as _};
+use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicU64, AtomicUsize, Ordering};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+use tokio::sync::{mpsc, oneshot};
+use tokio::task::JoinHandle;
+use uuid::Uuid;
+
+const DEFAULT_WORKERS: usize = 4;
+
+const DEFAULT_CAPACITY: usize = 1024;
+
+const DEFAULT_BATCH_SIZE: usize = 32;
+
+const DEFAULT_MAX_ATTEMPTS: u32 = 6;
+
+const DEFAULT_SPOOL_PATH: &str = "write-spool.jsonl";
+
+const BASE_BACKOFF: Duration = Duration::from_millis(200);
+
+const MAX_BACKOFF: Duration = Duration::from_secs(10);
+
+/// Spool size past which the file is rewritten without finished jobs once
+/// they make up most of it.
+const SPOOL_COMPACT_BYTES: u64 = 8 * 1024 * 1024;
+
+/// A deferred write. Serialized into the spool, so fields only change in
+/// backward compatible ways.
+#[derive(Debug, Clone, PartialEq, Serialize, Deserialize)]
+#[serde(tag = "kind", rename_all = "snake_case")]
+pub enum WriteJob {
+    SaveConcepts {
+        user_id: String,
+        concepts: Vec<Concept>,
+        #[serde(with = "embedding_blobs")]
+        embeddings: Vec<Vec<f32>>,
+        /// Enqueued saves folded into this job, each of which moved the cached
+        /// concept version by one; 0 once a partial write has bumped it.
+        #[serde(default = "one")]
+        saves: i64,
+        /// Statements still to write for each concept, all of them when
+        /// empty. Only retries set it and they are never spooled.
+        #[serde(skip)]
+        statements: Vec<ConceptStatements>,
+    },
+    SavePositions {
+        user_id: String,
+        positions: Vec<(String, [f32; 3])>,
+    },
+    /// Saves a text reference with an empty URL, then uploads `upload`, if
+    /// any, to the CDN and follows up with an `UpdateTextUrl`.
+    SaveText {
+        text_id: Uuid,
+        user_id: Option<String>,
+        filename: String,
+        source_url: String,
+        concepts: Vec<String>,
+        file_size: Option<i32>,
+        upload: Option<String>,
+    },
+    UpdateTextUrl {
+        text_id: Uuid,
+        user_id: String,
+        url: String,
+        concepts: Vec<String>,
+    },
+}
+
+fn one() -> i64 {
+    1
+}
+
+/// Embeddings spooled as base64 of their little-endian f32 bytes rather than
+/// JSON numbers. Lists of numbers written by older versions still load.
+mod embedding_blobs {
+    use super::encode_embedding;
+    use base64::engine::general_purpose::STANDARD;
+    use base64::Engine as _;
+    use serde::de::Error as _;
+    use serde::{Deserialize, Deserializer, Serializer};
+
+    #[derive(Deserialize)]
+    #[serde(untagged)]
+    enum Stored {
+        Blob(String),
+        Values(Vec<f32>),
+    }
+
+    pub fn serialize<S: Serializer>(embeddings: &[Vec<f32>], serializer: S) -> Result<S::Ok, S::Error> {
+        serializer.collect_seq(
+            embeddings
+                .iter()
+                .map(|e| STANDARD.encode(encode_embedding(e.iter().copied()))),
+        )
+    }
+
+    pub fn deserialize<'de, D: Deserializer<'de>>(deserializer: D) -> Result<Vec<Vec<f32>>, D::Error> {
+        Vec::<Stored>::deserialize(deserializer)?
+            .into_iter()
+            .map(|stored| match stored {
+                Stored::Values(values) => Ok(values),
+                Stored::Blob(blob) => {
+                    let bytes = STANDARD.decode(blob).map_err(D::Error::custom)?;
+                    if bytes.len() % 4 != 0 {
+                        return Err(D::Error::custom("embedding blob is not a whole number of f32 values"));
+                    }
+                    Ok(bytes
+                        .chunks_exact(4)
+                        .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]))
+                        .collect())
+                }
+            })
+            .collect()
+    }
+}
+
+impl WriteJob {
+    pub fn save_concepts(user_id: &str, concepts: &[Concept], embeddings: &[Embedding]) -> Self {
+        WriteJob::SaveConcepts {
+            user_id: user_id.to_string(),
+            concepts: concepts.to_vec(),
+            embeddings: embeddings.iter().map(|e| e.to_vec()).collect(),
+            saves: 1,
+            statements: Vec::new(),
+        }
+    }
+
+    fn kind(&self) -> &'static str {
+        match self {
+            WriteJob::SaveConcepts { .. } => "concepts",
+            WriteJob::SavePositions { .. } => "positions",
+            WriteJob::SaveText { .. } => "text reference",
+            WriteJob::UpdateTextUrl { .. } => "text url",
+        }
+    }
+}
+
+#[derive(Debug, Clone, Serialize)]
+pub struct WriteBehindStats {
+    pub workers: usize,
+    pub capacity: usize,
+    /// Jobs waiting in the channel.
+    pub depth: usize,
+    /// Jobs spooled and not yet done, including those being written.
+    pub pending: usize,
+    pub enqueued: u64,
+    pub completed: u64,
+    /// Jobs given up after the last attempt.
+    pub failed: u64,
+    pub retries: u64,
+    /// Enqueues that found the channel full and had to wait.
+    pub backpressure_waits: u64,
+    pub backpressure_wait_ms: u64,
+    pub spooled: bool,
+}
+
+#[derive(Serialize)]
+struct JobRecord<'a> {
+    seq: u64,
+    job: &'a WriteJob,
+}
+
+#[derive(Deserialize)]
+#[serde(untagged)]
+enum Record {
+    Job { seq: u64, job: WriteJob },
+    Done { done: u64 },
+}
+
+fn job_line(seq: u64, job: &WriteJob) -> Option<String> {
+    match serde_json::to_string(&JobRecord { seq, job }) {
+        Ok(line) => Some(line),
+        Err(e) => {
+            error!("Failed to spool {} job: {}", job.kind(), e);
+            None
+        }
+    }
+}
+
+/// Append-only log of jobs and their completion, owned by the spool writer
+/// thread. Records are flushed once per group of writes but not fsynced, so a
+/// crash of the process loses nothing acknowledged and a crash of the machine
+/// may lose the last moments.
+struct Spool {
+    path: Option<PathBuf>,
+    file: Option<BufWriter<File>>,
+    /// Lines of the jobs not yet done, kept to rewrite the file without the rest.
+    live: HashMap<u64, String>,
+    live_bytes: u64,
+    bytes: u64,
+    compact_bytes: u64,
+}
+
+impl Spool {
+    /// Opens the spool at `path`, returning the jobs not marked done in the
+    /// order they were enqueued. The file is rewritten to hold only those.
+    fn open(path: Option<PathBuf>) -> (Self, Vec<(u64, WriteJob)>) {
+        let mut spool = Spool {
+            path: None,
+            file: None,
+            live: HashMap::new(),
+            live_bytes: 0,
+            bytes: 0,
+            compact_bytes: SPOOL_COMPACT_BYTES,
+        };
+        let Some(path) = path else {
+            return (spool, Vec::new());
+        };
+
+        let pending = read_pending(&path);
+        for (seq, job) in &pending {
+            if let Some(line) = job_line(*seq, job) {
+                spool.live_bytes += line.len() as u64 + 1;
+                spool.live.insert(*seq, line);
+            }
+        }
+        match rewrite(&path, &spool.live) {
+            Ok(file) => {
+                spool.file = Some(file);
+                spool.bytes = spool.live_bytes;
+                spool.path = Some(path);
+            }
+            Err(e) => error!("Write spool {} unavailable, writes are not durable: {}", path.display(), e),
+        }
+        (spool, pending)
+    }
+
+    fn append(&mut self, seq: u64, job: &WriteJob) {
+        let Some(line) = job_line(seq, job) else {
+            return;
+        };
+        if self.write_line(&line) {
+            self.live_bytes += line.len() as u64 + 1;
+            self.live.insert(seq, line);
+        }
+    }
+
+    fn done(&mut self, seqs: &[u64]) {
+        for seq in seqs {
+            if let Some(line) = self.live.remove(seq) {
+                self.live_bytes -= line.len() as u64 + 1;
+            }
+            self.write_line(&format!("{{\"done\":{}}}", seq));
+        }
+    }
+
+    fn flush(&mut self) {
+        if let Some(file) = &mut self.file {
+            if let Err(e) = file.flush() {
+                error!("Failed to flush spool {:?}: {}", self.path, e);
+            }
+        }
+    }
+
+    /// Rewrites the file with only the live jobs once it is past
+    /// `compact_bytes` and mostly made of finished jobs, whether or not
+    /// anything is still pending.
+    fn compact(&mut self) {
+        if self.bytes <= self.compact_bytes || self.live_bytes * 2 > self.bytes {
+            return;
+        }
+        let Some(path) = &self.path else {
+            return;
+        };
+        match rewrite(path, &self.live) {
+            Ok(file) => {
+                self.file = Some(file);
+                self.bytes = self.live_bytes;
+            }
+            Err(e) => warn!("Failed to compact write spool {}: {}", path.display(), e),
+        }
+    }
+
+    fn write_line(&mut self, line: &str) -> bool {
+        let Some(file) = &mut self.file else {
+            return false;
+        };
+        let written = file
+            .write_all(line.as_bytes())
+            .and_then(|_| file.write_all(b"\n"));
+        match written {
+            Ok(()) => {
+                self.bytes += line.len() as u64 + 1;
+                true
+            }
+            Err(e) => {
+                error!("Failed to write to spool {:?}: {}", self.path, e);
+                false
+            }
+        }
+    }
+}
+
+fn read_pending(path: &Path) -> Vec<(u64, WriteJob)> {
+    let file = match File::open(path) {
+        Ok(file) => file,
+        Err(e) if e.kind() == std::io::ErrorKind::NotFound => return Vec::new(),
+        Err(e) => {
+            error!("Failed to read write spool {}: {}", path.display(), e);
+            return Vec::new();
+        }
+    };
+
+    let mut jobs = HashMap::new();
+    for line in BufReader::new(file).lines() {
+        let Ok(line) = line else {
+            break;
+        };
+        match serde_json::from_str(&line) {
+            Ok(Record::Job { seq, job }) => {
+                jobs.insert(seq, job);
+            }
+            Ok(Record::Done { done }) => {
+                jobs.remove(&done);
+            }
+            // A record cut short by a crash, the job was never acknowledged
+            Err(e) => warn!("Skipping unreadable write spool record: {}", e),
+        }
+    }
+
+    let mut pending: Vec<(u64, WriteJob)> = jobs.into_iter().collect();
+    pending.sort_by_key(|(seq, _)| *seq);
+    pending
+}
+
+/// Replaces the spool with just the `live` lines in sequence order, through a
+/// temporary file so a crash part way leaves the old spool intact.
+fn rewrite(path: &Path, live: &HashMap<u64, String>) -> std::io::Result<BufWriter<File>> {
+    let mut tmp_path = path.as_os_str().to_owned();
+    tmp_path.push(".tmp");
+    let tmp_path = PathBuf::from(tmp_path);
+
+    let mut seqs: Vec<u64> = live.keys().copied().collect();
+    seqs.sort_unstable();
+    {
+        let mut tmp = BufWriter::new(File::create(&tmp_path)?);
+        for seq in seqs {
+            tmp.write_all(live[&seq].as_bytes())?;
+            tmp.write_all(b"\n")?;
+        }
+        tmp.into_inner().map_err(|e| e.into_error())?.sync_all()?;
+    }
+    std::fs::rename(&tmp_path, path)?;
+
+    let file = OpenOptions::new().append(true).open(path)?;
+    Ok(BufWriter::new(file))
+}
+
+enum SpoolOp {
+    Append(u64, WriteJob, oneshot::Sender<()>),
+    Done(Vec<u64>),
+    Flush(oneshot::Sender<()>),
+}
+
+/// Applies spool operations as they arrive, flushing once for everything that
+/// was queued together before acknowledging it.
+fn write_spool(mut spool: Spool, mut ops: mpsc::UnboundedReceiver<SpoolOp>) {
+    let mut acks = Vec::new();
+    while let Some(op) = ops.blocking_recv() {
+        let mut next = Some(op);
+        while let Some(op) = next {
+            match op {
+                SpoolOp::Append(seq, job, ack) => {
+                    spool.append(seq, &job);
+                    acks.push(ack);
+                }
+                SpoolOp::Done(seqs) => spool.done(&seqs),
+                SpoolOp::Flush(ack) => acks.push(ack),
+            }
+            next = ops.try_recv().ok();
+        }
+        spool.flush();
+        spool.compact();
+        for ack in acks.drain(..) {
+            let _ = ack.send(());
+        }
+    }
+    spool.flush();
+}
+
+/// Hands spool writes to a dedicated thread so neither file I/O nor
+/// serialization runs on an async worker. Sequence numbers and the pending
+/// count are kept here.
+struct SpoolWriter {
+    ops: Option<mpsc::UnboundedSender<SpoolOp>>,
+    next_seq: AtomicU64,
+    pending: AtomicUsize,
+}
+
+impl SpoolWriter {
+    fn start(path: Option<PathBuf>) -> (Self, Vec<(u64, WriteJob)>) {
+        let (spool, pending) = Spool::open(path);
+        let next_seq = pending.last().map_or(0, |(seq, _)| seq + 1);
+
+        let ops = if spool.file.is_some() {
+            let (sender, receiver) = mpsc::unbounded_channel();
+            let spawned = std::thread::Builder::new()
+                .name("write-spool".to_string())
+                .spawn(move || write_spool(spool, receiver));
+            match spawned {
+                Ok(_) => Some(sender),
+                Err(e) => {
+                    error!("Failed to start the spool writer, writes are not durable: {}", e);
+                    None
+                }
+            }
+        } else {
+            None
+        };
+
+        let writer = SpoolWriter {
+            ops,
+            next_seq: AtomicU64::new(next_seq),
+            pending: AtomicUsize::new(pending.len()),
+        };
+        (writer, pending)
+    }
+
+    fn is_durable(&self) -> bool {
+        self.ops.is_some()
+    }
+
+    /// Spools `job`, returning its sequence number once it has been written.
+    async fn append(&self, job: &WriteJob) -> u64 {
+        let seq = self.next_seq.fetch_add(1, Ordering::Relaxed);
+        self.pending.fetch_add(1, Ordering::Relaxed);
+        if let Some(ops) = &self.ops {
+            let (ack, written) = oneshot::channel();
+            if ops.send(SpoolOp::Append(seq, job.clone(), ack)).is_ok() {
+                let _ = written.await;
+            }
+        }
+        seq
+    }
+
+    fn done(&self, seqs: &[u64]) {
+        self.pending.fetch_sub(seqs.len(), Ordering::Relaxed);
+        if let Some(ops) = &self.ops {
+            let _ = ops.send(SpoolOp::Done(seqs.to_vec()));
+        }
+    }
+
+    /// Waits until everything sent so far has been written.
+    async fn flush(&self) {
+        if let Some(ops) = &self.ops {
+            let (ack, written) = oneshot::channel();
+            if ops.send(SpoolOp::Flush(ack)).is_ok() {
+                let _ = written.await;
+            }
+        }
+    }
+
+    fn pending(&self) -> usize {
+        self.pending.load(Ordering::Relaxed)
+    }
+}
+
+/// Folds concept and position saves of the same user into one job each,
+/// keeping their spool sequence numbers. Other jobs pass through unchanged.
+fn merge(batch: Vec<(u64, WriteJob)>) -> Vec<(Vec<u64>, WriteJob)> {
+    let mut merged: Vec<(Vec<u64>, WriteJob)> = Vec::with_capacity(batch.len());
+    let mut by_user: HashMap<(&'static str, String), usize> = HashMap::new();
+
+    for (seq, job) in batch {
+        let key = match &job {
+            WriteJob::SaveConcepts { user_id, .. } | WriteJob::SavePositions { user_id, .. } => {
+                Some((job.kind(), user_id.clone()))
+            }
+            _ => None,
+        };
+        let Some(&index) = key.as_ref().and_then(|key| by_user.get(key)) else {
+            if let Some(key) = key {
+                by_user.insert(key, merged.len());
+            }
+            merged.push((vec![seq], job));
+            continue;
+        };
+
+        let (seqs, into) = &mut merged[index];
+        seqs.push(seq);
+        match (into, job) {
+            (
+                WriteJob::SaveConcepts {
+                    concepts,
+                    embeddings,
+                    saves,
+                    statements,
+                    ..
+                },
+                WriteJob::SaveConcepts {
+                    concepts: more_concepts,
+                    embeddings: more_embeddings,
+                    saves: more_saves,
+                    statements: mut more_statements,
+                    ..
+                },
+            ) => {
+                if !statements.is_empty() || !more_statements.is_empty() {
+                    statements.resize(concepts.len(), ConceptStatements::ALL);
+                    more_statements.resize(more_concepts.len(), ConceptStatements::ALL);
+                    statements.extend(more_statements);
+                }
+                concepts.extend(more_concepts);
+                embeddings.extend(more_embeddings);
+                *saves += more_saves;
+            }
+            (WriteJob::SavePositions { positions, .. }, WriteJob::SavePositions { positions: more, .. }) => {
+                positions.extend(more);
+            }
+            _ => unreachable!("jobs are merged by kind"),
+        }
+    }
+
+    // Concurrent writes to one position could land in any order, keep the last
+    for (_, job) in &mut merged {
+        if let WriteJob::SavePositions { positions, .. } = job {
+            let mut seen = HashSet::new();
+            let mut latest: Vec<_> = positions.drain(..).rev().filter(|(c, _)| seen.insert(c.clone())).collect();
+            latest.reverse();
+            *positions = latest;
+        }
+    }
+    merged
+}
+
+fn backoff(attempt: u32) -> Duration {
+    BASE_BACKOFF
+        .saturating_mul(1 << attempt.saturating_sub(1).min(16))
+        .min(MAX_BACKOFF)
+}
+
+struct Inner {
+    db_client: Arc<DatabaseClient>,
+    concept_cache: Arc<UserConceptCache>,
+    spool: SpoolWriter,
+    receiver: tokio::sync::Mutex<mpsc::Receiver<(u64, WriteJob)>>,
+    batch_size: usize,
+    max_attempts: u32,
+    depth: AtomicUsize,
+    enqueued: AtomicU64,
+    completed: AtomicU64,
+    failed: AtomicU64,
+    retries: AtomicU64,
+    backpressure_waits: AtomicU64,
+    backpressure_wait_ms: AtomicU64,
+}
+
+pub struct WriteBehind {
+    inner: Arc<Inner>,
+    sender: Mutex<Option<mpsc::Sender<(u64, WriteJob)>>>,
+    workers: Mutex<Vec<JoinHandle<()>>>,
+    worker_count: usize,
+    capacity: usize,
+    spooled: bool,
+}
+
+impl WriteBehind {
+    /// Starts `workers` workers behind a channel of `capacity` jobs, first
+    /// replaying the jobs left pending in the spool at `spool_path`. Without
+    /// a spool path jobs are lost on restart. Must be called on a tokio runtime.
+    pub fn start(
+        db_client: Arc<DatabaseClient>,
+        concept_cache: Arc<UserConceptCache>,
+        spool_path: Option<PathBuf>,
+        workers: usize,
+        capacity: usize,
+        batch_size: usize,
+        max_attempts: u32,
+    ) -> Self {
+        let workers = workers.max(1);
+        let capacity = capacity.max(1);
+        let (spool, pending) = SpoolWriter::start(spool_path);
+        let spooled = spool.is_durable();
+        let (sender, receiver) = mpsc::channel(capacity);
+
+        let inner = Arc::new(Inner {
+            db_client,
+            concept_cache,
+            spool,
+            receiver: tokio::sync::Mutex::new(receiver),
+            batch_size: batch_size.max(1),
+            max_attempts: max_attempts.max(1),
+            depth: AtomicUsize::new(0),
+            enqueued: AtomicU64::new(0),
+            completed: AtomicU64::new(0),
+            failed: AtomicU64::new(0),
+            retries: AtomicU64::new(0),
+            backpressure_waits: AtomicU64::new(0),
+            backpressure_wait_ms: AtomicU64::new(0),
+        });
+
+        let handles = (0..workers)
+            .map(|_| tokio::spawn(Arc::clone(&inner).work()))
+            .collect();
+
+        if !pending.is_empty() {
+            info!("Replaying {} spooled writes", pending.len());
+            let sender = sender.clone();
+            let inner = Arc::clone(&inner);
+            tokio::spawn(async move {
+                for job in pending {
+                    inner.depth.fetch_add(1, Ordering::Relaxed);
+                    if sender.send(job).await.is_err() {
+                        inner.depth.fetch_sub(1, Ordering::Relaxed);
+                        break;
+                    }
+                }
+            });
+        }
+
+        Self {
+            inner,
+            sender: Mutex::new(Some(sender)),
+            workers: Mutex::new(handles),
+            worker_count: workers,
+            capacity,
+            spooled,
+        }
+    }
+
+    /// Workers from `WRITE_BEHIND_WORKERS` (default 4), channel capacity from
+    /// `WRITE_BEHIND_CAPACITY` (default 1024), batch size from
+    /// `WRITE_BEHIND_BATCH` (default 32), attempts per job from
+    /// `WRITE_BEHIND_MAX_ATTEMPTS` (default 6) and the spool file from
+    /// `WRITE_SPOOL_PATH` (default `write-spool.jsonl`, empty disables).
+    pub fn from_env(db_client: Arc<DatabaseClient>, concept_cache: Arc<UserConceptCache>) -> Self {
+        fn env<T: std::str::FromStr>(name: &str, default: T) -> T {
+            std::env::var(name).ok().and_then(|v| v.parse().ok()).unwrap_or(default)
+        }
+        let spool_path = std::env::var("WRITE_SPOOL_PATH").unwrap_or_else(|_| DEFAULT_SPOOL_PATH.to_string());
+        Self::start(
+            db_client,
+            concept_cache,
+            Some(spool_path).filter(|p| !p.is_empty()).map(PathBuf::from),
+            env("WRITE_BEHIND_WORKERS", DEFAULT_WORKERS),
+            env("WRITE_BEHIND_CAPACITY", DEFAULT_CAPACITY),
+            env("WRITE_BEHIND_BATCH", DEFAULT_BATCH_SIZE),
+            env("WRITE_BEHIND_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+        )
+    }
+
+    /// Spools `job` and queues it, waiting while the queue is full. After
+    /// shutdown has begun the job stays in the spool for the next start.
+    pub async fn enqueue(&self, job: WriteJob) {
+        let seq = self.inner.spool.append(&job).await;
+        self.inner.enqueued.fetch_add(1, Ordering::Relaxed);
+
+        let sender = self.sender.lock().unwrap_or_else(|e| e.into_inner()).clone();
+        let Some(sender) = sender else {
+            warn!("Write queue shut down, {} job left in the spool", job.kind());
+            return;
+        };
+
+        self.inner.depth.fetch_add(1, Ordering::Relaxed);
+        let sent = match sender.try_send((seq, job)) {
+            Ok(()) => Ok(()),
+            Err(mpsc::error::TrySendError::Full(queued)) => {
+                let started = Instant::now();
+                self.inner.backpressure_waits.fetch_add(1, Ordering::Relaxed);
+                let sent = sender.send(queued).await.map_err(|e| e.0);
+                self.inner
+                    .backpressure_wait_ms
+                    .fetch_add(started.elapsed().as_millis() as u64, Ordering::Relaxed);
+                sent
+            }
+            Err(mpsc::error::TrySendError::Closed(queued)) => Err(queued),
+        };
+        if let Err((_, job)) = sent {
+            self.inner.depth.fetch_sub(1, Ordering::Relaxed);
+            warn!("Write queue closed, {} job left in the spool", job.kind());
+        }
+    }
+
+    /// Stops accepting jobs and waits up to `timeout` for the queued ones to
+    /// be written. Jobs still unwritten stay in the spool.
+    pub async fn shutdown(&self, timeout: Duration) {
+        self.sender.lock().unwrap_or_else(|e| e.into_inner()).take();
+        let workers = std::mem::take(&mut *self.workers.lock().unwrap_or_else(|e| e.into_inner()));
+
+        info!("Draining write queue ({} jobs queued)", self.inner.depth.load(Ordering::Relaxed));
+        let drained = tokio::time::timeout(timeout, futures::future::join_all(workers)).await;
+        match drained {
+            Ok(_) => info!("Write queue drained"),
+            Err(_) => warn!(
+                "Write queue not drained within {:?}, {} jobs left in the spool",
+                timeout,
+                self.inner.spool.pending()
+            ),
+        }
+        // Done records of the drained jobs must reach the file before exit
+        self.inner.spool.flush().await;
+    }
+
+    pub fn stats(&self) -> WriteBehindStats {
+        let inner = &self.inner;
+        WriteBehindStats {
+            workers: self.worker_count,
+            capacity: self.capacity,
+            depth: inner.depth.load(Ordering::Relaxed),
+            pending: inner.spool.pending(),
+            enqueued: inner.enqueued.load(Ordering::Relaxed),
+            completed: inner.completed.load(Ordering::Relaxed),
+            failed: inner.failed.load(Ordering::Relaxed),
+            retries: inner.retries.load(Ordering::Relaxed),
+            backpressure_waits: inner.backpressure_waits.load(Ordering::Relaxed),
+            backpressure_wait_ms: inner.backpressure_wait_ms.load(Ordering::Relaxed),
+            spooled: self.spooled,
+        }
+    }
+}
+
+impl Inner {
+    /// Takes batches off the channel until it is closed and empty.
+    async fn work(self: Arc<Self>) {
+        loop {
+            let batch = {
+                let mut receiver = self.receiver.lock().await;
+                let Some(first) = receiver.recv().await else {
+                    return;
+                };
+                let mut batch = vec![first];
+                while batch.len() < self.batch_size {
+                    match receiver.try_recv() {
+                        Ok(job) => batch.push(job),
+                        Err(_) => break,
+                    }
+                }
+                batch
+            };
+            self.depth.fetch_sub(batch.len(), Ordering::Relaxed);
+
+            for (seqs, job) in merge(batch) {
+                self.run(seqs, job).await;
+            }
+        }
+    }
+
+    /// Writes a job, retrying with backoff, then runs its follow-up if any.
+    async fn run(&self, mut seqs: Vec<u64>, mut job: WriteJob) {
+        let mut attempt = 1;
+        loop {
+            match self.execute(job).await {
+                Ok(follow_up) => {
+                    self.completed.fetch_add(seqs.len() as u64, Ordering::Relaxed);
+                    let next_seq = match &follow_up {
+                        Some(next) => Some(self.spool.append(next).await),
+                        None => None,
+                    };
+                    self.spool.done(&seqs);
+
+                    let (Some(seq), Some(next)) = (next_seq, follow_up) else {
+                        return;
+                    };
+                    seqs = vec![seq];
+                    job = next;
+                    attempt = 1;
+                }
+                Err((retry, message)) if attempt < self.max_attempts => {
+                    let delay = backoff(attempt);
+                    warn!(
+                        "Write of {} failed (attempt {}/{}), retrying in {:?}: {}",
+                        retry.kind(),
+                        attempt,
+                        self.max_attempts,
+                        delay,
+                        message
+                    );
+                    self.retries.fetch_add(1, Ordering::Relaxed);
+                    tokio::time::sleep(delay).await;
+                    attempt += 1;
+                    job = retry;
+                }
+                Err((failed, message)) => {
+                    error!("Giving up on write of {} after {} attempts: {}", failed.kind(), attempt, message);
+                    if let WriteJob::SaveConcepts { user_id, .. } = &failed {
+                        self.concept_cache.invalidate(user_id);
+                    }
+                    self.failed.fetch_add(seqs.len() as u64, Ordering::Relaxed);
+                    self.spool.done(&seqs);
+                    return;
+                }
+            }
+        }
+    }
+
+    /// One attempt at a job. Returns its follow-up on success, or what is
+    /// left to retry with the error.
+    async fn execute(&self, job: WriteJob) -> Result<Option<WriteJob>, (WriteJob, String)> {
+        match job {
+            WriteJob::SaveConcepts {
+                user_id,
+                concepts,
+                embeddings,
+                saves,
+                statements,
+            } => {
+                let arrays: Vec<Embedding> = embeddings.iter().cloned().map(Array1::from).collect();
+                let saved = self
+                    .db_client
+                    .save_concepts(&user_id, &concepts, &arrays, &statements, saves)
+                    .await;
+                let report = match saved {
+                    Ok(report) if report.is_complete() => return Ok(None),
+                    Ok(report) => report,
+                    Err(e) => {
+                        let retry = WriteJob::SaveConcepts {
+                            user_id,
+                            concepts,
+                            embeddings,
+                            saves,
+                            statements,
+                        };
+                        return Err((retry, describe(e)));
+                    }
+                };
+
+                let message = describe_concept_failures(&concepts, &report);
+                // Only the statements that failed are sent again; concepts
+                // rejected for empty embeddings never will be
+                let retry = failed_statements(&concepts, &embeddings, &statements, &report.failures);
+                let (concepts, (embeddings, statements)): (Vec<_>, (Vec<_>, Vec<_>)) = concepts
+                    .into_iter()
+                    .zip(embeddings.into_iter().zip(retry))
+                    .filter(|(_, (_, wanted))| !wanted.is_empty())
+                    .unzip();
+                if concepts.is_empty() {
+                    error!("Failed to save concepts of {}: {}", user_id, message);
+                    self.concept_cache.invalidate(&user_id);
+                    return Ok(None);
+                }
+                // The version already moved if any row was written
+                let saves = if report.written > 0 { 0 } else { saves };
+                let retry = WriteJob::SaveConcepts {
+                    user_id,
+                    concepts,
+                    embeddings,
+                    saves,
+                    statements,
+                };
+                Err((retry, message))
+            }
+            WriteJob::SavePositions { user_id, positions } => {
+                match self.db_client.save_concept_positions(&user_id, &positions).await {
+                    Ok(()) => Ok(None),
+                    Err(e) => Err((WriteJob::SavePositions { user_id, positions }, describe(e))),
+                }
+            }
+            WriteJob::SaveText {
+                text_id,
+                user_id,
+                filename,
+                source_url,
+                concepts,
+                file_size,
+                upload,
+            } => {
+                if let Some(user_id) = &user_id {
+                    let saved = self
+                        .db_client
+                        .save_text_reference(text_id, user_id, &filename, "", &source_url, &concepts, file_size)
+                        .await;
+                    if let Err(e) = saved {
+                        let retry = WriteJob::SaveText {
+                            text_id,
+                            user_id: Some(user_id.clone()),
+                            filename,
+                            source_url,
+                            concepts,
+                            file_size,
+                            upload,
+                        };
+                        return Err((retry, describe(e)));
+                    }
+                }
+
+                // Uploads are not retried, a repeated upload would leave a duplicate
+                let Some(text) = upload else {
+                    return Ok(None);
+                };
+                match GitHubCDN::new().upload_text(&text, &filename).await {
+                    Ok(url) => {
+                        info!("CDN upload succeeded: {}", url);
+                        Ok(user_id.map(|user_id| WriteJob::UpdateTextUrl {
+                            text_id,
+                            user_id,
+                            url,
+                            concepts,
+                        }))
+                    }
+                    Err(e) => {
+                        error!("CDN upload failed (non-fatal): {:?}", e);
+                        Ok(None)
+                    }
+                }
+            }
+            WriteJob::UpdateTextUrl {
+                text_id,
+                user_id,
+                url,
+                concepts,
+            } => match self.db_client.update_text_url(text_id, &user_id, &url, &concepts).await {
+                Ok(()) => Ok(None),
+                Err(e) => Err((WriteJob::UpdateTextUrl { text_id, user_id, url, concepts }, describe(e))),
+            },
+        }
+    }
+}
+
+fn describe(e: ApiError) -> String {
+    format!("{:?}", e)
+}
+
+fn describe_concept_failures(concepts: &[Concept], report: &ConceptSaveReport) -> String {
+    let names: HashMap<Uuid, &str> = concepts
+        .iter()
+        .map(|c| (concept_id(&c.concept), c.concept.as_str()))
+        .collect();
+    report
+        .rejected
+        .iter()
+        .map(|(concept, message)| format!("'{}': {}", concept, message))
+        .chain(report.failures.iter().map(|((id, statement), message)| {
+            let name = names.get(id).copied().unwrap_or_default();
+            format!("'{}' ({:?}): {}", name, statement, message)
+        }))
+        .chain(report.version_error.iter().map(|message| format!("concept version: {}", message)))
+        .collect::<Vec<_>>()
+        .join("; ")
+}
+
+/// What each of `concepts` still has to write after `failures`. A failed
+/// upsert goes to the last spelling of its concept, which is the one that
+/// wrote it; a failed occurrence increment to every entry that was counted,
+/// so the retried increment is the one that failed. Nothing that succeeded,
+/// and in particular no increment, is sent again.
+fn failed_statements(
+    concepts: &[Concept],
+    embeddings: &[Vec<f32>],
+    statements: &[ConceptStatements],
+    failures: &[((Uuid, ConceptStatement), String)],
+) -> Vec<ConceptStatements> {
+    let wanted = |i: usize| statements.get(i).copied().unwrap_or(ConceptStatements::ALL);
+    let ids: Vec<Option<Uuid>> = concepts
+        .iter()
+        .zip(embeddings)
+        .map(|(c, e)| Some(concept_id(&c.concept)).filter(|_| !e.is_empty()))
+        .collect();
+
+    let mut retry = vec![ConceptStatements::NONE; concepts.len()];
+    for &((id, statement), _) in failures {
+        let entries = (0..concepts.len()).filter(|&i| ids[i] == Some(id));
+        match statement {
+            ConceptStatement::Occurrences => {
+                for i in entries.filter(|&i| wanted(i).occurrences) {
+                    retry[i].insert(statement);
+                }
+            }
+            ConceptStatement::Row | ConceptStatement::Source => {
+                if let Some(i) = entries.filter(|&i| wanted(i).row || wanted(i).source).last() {
+                    retry[i].insert(statement);
+                }
+            }
+        }
+    }
+    retry
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn concepts_job(user_id: &str, names: &[&str]) -> WriteJob {
+        WriteJob::SaveConcepts {
+            user_id: user_id.to_string(),
+            concepts: names
+                .iter()
+                .map(|name| Concept {
+                    concept: name.to_string(),
+                    importance: 0.5,
+                })
+                .collect(),
+            embeddings: names.iter().map(|_| vec![1.0, 0.0]).collect(),
+            saves: 1,
+            statements: Vec::new(),
+        }
+    }
+
+    fn positions_job(user_id: &str, positions: &[(&str, f32)]) -> WriteJob {
+        WriteJob::SavePositions {
+            user_id: user_id.to_string(),
+            positions: positions.iter().map(|&(c, x)| (c.to_string(), [x, 0.0, 0.0])).collect(),
+        }
+    }
+
+    fn text_url_job() -> WriteJob {
+        WriteJob::UpdateTextUrl {
+            text_id: Uuid::nil(),
+            user_id: "u".to_string(),
+            url: "https://cdn/a.txt".to_string(),
+            concepts: vec!["a".to_string()],
+        }
+    }
+
+    fn spool_path(name: &str) -> PathBuf {
+        let path = std::env::temp_dir().join(format!("write-spool-{}-{}.jsonl", name, Uuid::new_v4()));
+        let _ = std::fs::remove_file(&path);
+        path
+    }
+
+    #[test]
+    fn test_merges_saves_of_the_same_user() {
+        let merged = merge(vec![
+            (0, concepts_job("u", &["a"])),
+            (1, positions_job("u", &[("a", 1.0), ("b", 1.0)])),
+            (2, text_url_job()),
+            (3, concepts_job("v", &["c"])),
+            (4, concepts_job("u", &["b"])),
+            (5, positions_job("u", &[("a", 2.0)])),
+        ]);
+
+        // Both saves count towards the concept version
+        let mut both = concepts_job("u", &["a", "b"]);
+        if let WriteJob::SaveConcepts { saves, .. } = &mut both {
+            *saves = 2;
+        }
+
+        assert_eq!(merged.len(), 4);
+        assert_eq!(merged[0], (vec![0, 4], both));
+        assert_eq!(merged[1], (vec![1, 5], positions_job("u", &[("b", 1.0), ("a", 2.0)])));
+        assert_eq!(merged[2], (vec![2], text_url_job()));
+        assert_eq!(merged[3], (vec![3], concepts_job("v", &["c"])));
+    }
+
+    #[test]
+    fn test_partial_failure_does_not_count_occurrences_again() {
+        let WriteJob::SaveConcepts {
+            concepts, embeddings, ..
+        } = concepts_job("u", &["a", "b", "A", "c"])
+        else {
+            unreachable!()
+        };
+        let (a, b, c) = (concept_id("a"), concept_id("b"), concept_id("c"));
+        let failures = vec![
+            ((a, ConceptStatement::Row), "timeout".to_string()),
+            ((b, ConceptStatement::Source), "timeout".to_string()),
+            ((c, ConceptStatement::Occurrences), "timeout".to_string()),
+        ];
+
+        let retry = failed_statements(&concepts, &embeddings, &[], &failures);
+        let only = |statement| {
+            let mut statements = ConceptStatements::NONE;
+            statements.insert(statement);
+            statements
+        };
+        // "a" was written from its last spelling and counted twice already
+        assert_eq!(
+            retry,
+            vec![
+                ConceptStatements::NONE,
+                only(ConceptStatement::Source),
+                only(ConceptStatement::Row),
+                only(ConceptStatement::Occurrences),
+            ]
+        );
+
+        // A retry that fails again only repeats what it was sent
+        let again = failed_statements(&concepts, &embeddings, &retry, &failures[..1]);
+        assert_eq!(again[2], only(ConceptStatement::Row));
+        assert!(again.iter().all(|s| !s.occurrences));
+    }
+
+    #[test]
+    fn test_spool_replays_pending_jobs_in_order() {
+        let path = spool_path("replay");
+        {
+            let (mut spool, pending) = Spool::open(Some(path.clone()));
+            assert!(pending.is_empty());
+            spool.append(0, &concepts_job("u", &["a"]));
+            spool.append(1, &text_url_job());
+            spool.append(2, &positions_job("u", &[("a", 1.0)]));
+            spool.done(&[1]);
+            spool.flush();
+            assert_eq!(spool.live.len(), 2);
+        }
+        // A record torn by a crash is skipped
+        OpenOptions::new()
+            .append(true)
+            .open(&path)
+            .unwrap()
+            .write_all(b"{\"seq\":3,\"job\":{\"ki")
+            .unwrap();
+
+        let (mut spool, pending) = Spool::open(Some(path.clone()));
+        assert_eq!(
+            pending,
+            vec![(0, concepts_job("u", &["a"])), (2, positions_job("u", &[("a", 1.0)]))]
+        );
+        spool.append(3, &text_url_job());
+        spool.done(&[0, 2, 3]);
+        spool.flush();
+        drop(spool);
+
+        // The reopened spool was compacted to what was pending
+        let (_, pending) = Spool::open(Some(path.clone()));
+        assert!(pending.is_empty());
+        assert_eq!(std::fs::metadata(&path).unwrap().len(), 0);
+        let _ = std::fs::remove_file(&path);
+    }
+
+    #[test]
+    fn test_spool_compacts_while_jobs_are_pending() {
+        let path = spool_path("compact");
+        let (mut spool, _) = Spool::open(Some(path.clone()));
+        spool.compact_bytes = 1024;
+
+        spool.append(0, &concepts_job("u", &["kept"]));
+        for seq in 1..100 {
+            spool.append(seq, &positions_job("u", &[("a", seq as f32)]));
+            spool.done(&[seq]);
+        }
+        spool.flush();
+        spool.compact();
+
+        // Only the pending job is left, without reopening the spool
+        assert_eq!(spool.bytes, spool.live_bytes);
+        assert_eq!(std::fs::metadata(&path).unwrap().len(), spool.bytes);
+        spool.append(100, &text_url_job());
+        spool.flush();
+        drop(spool);
+
+        let (_, pending) = Spool::open(Some(path.clone()));
+        assert_eq!(pending, vec![(0, concepts_job("u", &["kept"])), (100, text_url_job())]);
+        let _ = std::fs::remove_file(&path);
+    }
+
+    #[tokio::test]
+    async fn test_spool_writer_acknowledges_written_jobs() {
+        let path = spool_path("writer");
+        let (writer, _) = SpoolWriter::start(Some(path.clone()));
+        assert!(writer.is_durable());
+
+        let a = writer.append(&concepts_job("u", &["a"])).await;
+        let b = writer.append(&text_url_job()).await;
+        writer.done(&[a]);
+        writer.flush().await;
+        assert_eq!((a, b, writer.pending()), (0, 1, 1));
+
+        let (_, pending) = Spool::open(Some(path.clone()));
+        assert_eq!(pending, vec![(1, text_url_job())]);
+        let _ = std::fs::remove_file(&path);
+    }
+
+    #[test]
+    fn test_embeddings_are_spooled_as_blobs() {
+        let job = concepts_job("u", &["a"]);
+        let line = serde_json::to_string(&job).unwrap();
+        assert!(line.contains(r#""embeddings":["AACAPwAAAAA="]"#), "{}", line);
+        assert_eq!(serde_json::from_str::<WriteJob>(&line).unwrap(), job);
+    }
+
+    #[test]
+    fn test_jobs_spooled_by_older_versions_still_load() {
+        // Embeddings as numbers and no save count
+        let line = r#"{"kind":"save_concepts","user_id":"u","concepts":[{"concept":"a","importance":0.5}],"embeddings":[[1.0,0.0]]}"#;
+        let job: WriteJob = serde_json::from_str(line).unwrap();
+        assert_eq!(job, concepts_job("u", &["a"]));
+    }
+
+    #[test]
+    fn test_backoff_doubles_up_to_the_cap() {
+        assert_eq!(backoff(1), BASE_BACKOFF);
+        assert_eq!(backoff(3), BASE_BACKOFF * 4);
+        assert_eq!(backoff(40), MAX_BACKOFF);
+    }
+}
@@ -0,0 +1,378 @@
+//! Content-addressed cache of layout results.
+//!
+//! A layout is keyed by the sorted concepts with their importances, the
+//! previous positions it was warm-started from, the embedding model id and
+//! the `ForceParams` it ran with, so re-uploading a document or reloading an
+//! unchanged map returns the stored `ConceptGroup`s instead of merging and
+//! laying out again. Results live in an LRU memory tier bounded by a byte
+//! budget, together with the merge dendrogram for re-grouping, optionally
+//! backed by one JSON file of groups per key on disk.
+
+use super::regroup::Regrouping;
+use super::{ConceptGroup, ForceParams, PreviousPositions};
+use crate::data::lru::ByteLru;
+use crate::models::concepts::Concept;
+use serde::Serialize;
+use std::path::PathBuf;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::sync::{Arc, Mutex};
+
+const DEFAULT_BYTE_BUDGET: usize = 64 * 1024 * 1024;
+
+/// 128-bit FNV-1a, stable across processes so disk entries stay valid.
+pub(crate) fn fnv1a_128(chunks: &[&[u8]]) -> u128 {
+    const OFFSET: u128 = 0x6c62272e07bb014262b821756295c58d;
+    const PRIME: u128 = 0x0000000001000000000000000000013B;
+    let mut hash = OFFSET;
+    for chunk in chunks {
+        for &byte in *chunk {
+            hash ^= byte as u128;
+            hash = hash.wrapping_mul(PRIME);
+        }
+        // Separator so ("ab", "c") and ("a", "bc") differ
+        hash ^= 0xff;
+        hash = hash.wrapping_mul(PRIME);
+    }
+    hash
+}
+
+/// Approximate heap footprint of a cached result.
+fn estimated_bytes(groups: &[ConceptGroup]) -> usize {
+    groups
+        .iter()
+        .map(|g| {
+            std::mem::size_of::<ConceptGroup>()
+                + g.concepts
+                    .iter()
+                    .map(|c| std::mem::size_of::<String>() + c.len())
+                    .sum::<usize>()
+                + g.reduced_embedding.len() * std::mem::size_of::<f32>()
+                + g.connections.len() * std::mem::size_of::<usize>()
+                + g.connection_weights.len() * std::mem::size_of::<f32>()
+        })
+        .sum()
+}
+
+/// A cached layout. Entries read back from disk carry no regrouping.
+#[derive(Clone)]
+pub struct CachedLayout {
+    pub groups: Arc<Vec<ConceptGroup>>,
+    pub regrouping: Option<Arc<Regrouping>>,
+}
+
+impl CachedLayout {
+    fn estimated_bytes(&self) -> usize {
+        estimated_bytes(&self.groups) + self.regrouping.as_ref().map_or(0, |r| r.estimated_bytes())
+    }
+}
+
+#[derive(Debug, Clone, Serialize)]
+pub struct LayoutCacheStats {
+    pub entries: usize,
+    pub bytes: usize,
+    pub byte_budget: usize,
+    pub disk_enabled: bool,
+    pub memory_hits: u64,
+    pub disk_hits: u64,
+    pub misses: u64,
+}
+
+pub struct LayoutCache {
+    memory: Mutex<ByteLru<CachedLayout>>,
+    disk_dir: Option<PathBuf>,
+    memory_hits: AtomicU64,
+    disk_hits: AtomicU64,
+    misses: AtomicU64,
+}
+
+impl LayoutCache {
+    pub fn new(byte_budget: usize, disk_dir: Option<PathBuf>) -> Self {
+        let disk_dir = disk_dir.and_then(|dir| match std::fs::create_dir_all(&dir) {
+            Ok(()) => Some(dir),
+            Err(e) => {
+                log::warn!(
+                    "Layout cache directory {:?} unusable, memory only: {}",
+                    dir,
+                    e
+                );
+                None
+            }
+        });
+
+        Self {
+            memory: Mutex::new(ByteLru::new(byte_budget)),
+            disk_dir,
+            memory_hits: AtomicU64::new(0),
+            disk_hits: AtomicU64::new(0),
+            misses: AtomicU64::new(0),
+        }
+    }
+
+    /// Budget from `LAYOUT_CACHE_BYTES` (default 64 MiB); the disk tier is
+    /// enabled by setting `LAYOUT_CACHE_DIR`.
+    pub fn from_env() -> Self {
+        let byte_budget = std::env::var("LAYOUT_CACHE_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_BYTE_BUDGET);
+
+        let disk_dir = std::env::var("LAYOUT_CACHE_DIR")
+            .ok()
+            .filter(|v| !v.is_empty())
+            .map(PathBuf::from);
+
+        Self::new(byte_budget, disk_dir)
+    }
+
+    /// Cache key for laying out `concepts` embedded by `model_id` with
+    /// `params`, warm-started from `previous` positions. Independent of concept
+    /// order; only the previous positions of `concepts` count.
+    pub fn key(
+        concepts: &[Concept],
+        previous: &PreviousPositions,
+        model_id: &str,
+        params: &ForceParams,
+    ) -> String {
+        let mut sorted: Vec<&Concept> = concepts.iter().collect();
+        sorted.sort_unstable_by(|a, b| {
+            a.concept
+                .cmp(&b.concept)
+                .then_with(|| a.importance.total_cmp(&b.importance))
+        });
+
+        // Importance and any previous position of each concept, as raw bits
+        let extras: Vec<Vec<u8>> = sorted
+            .iter()
+            .map(|c| {
+                let position = previous.get(&c.concept).into_iter().flatten();
+                std::iter::once(&c.importance)
+                    .chain(position)
+                    .flat_map(|v| v.to_bits().to_le_bytes())
+                    .collect()
+            })
+            .collect();
+
+        let params = format!("{:?}", params);
+        let mut chunks: Vec<&[u8]> = vec![model_id.as_bytes(), params.as_bytes()];
+        for (concept, extra) in sorted.iter().zip(&extras) {
+            chunks.push(concept.concept.as_bytes());
+            chunks.push(extra);
+        }
+        format!("{:032x}", fnv1a_128(&chunks))
+    }
+
+    pub fn get(&self, key: &str) -> Option<CachedLayout> {
+        if let Some(cached) = self.lock_memory().get(key) {
+            self.memory_hits.fetch_add(1, Ordering::Relaxed);
+            return Some(cached.clone());
+        }
+
+        if let Some(groups) = self.read_disk(key) {
+            let cached = CachedLayout {
+                groups: Arc::new(groups),
+                regrouping: None,
+            };
+            self.lock_memory()
+                .insert(key, cached.clone(), cached.estimated_bytes());
+            self.disk_hits.fetch_add(1, Ordering::Relaxed);
+            return Some(cached);
+        }
+
+        self.misses.fetch_add(1, Ordering::Relaxed);
+        None
+    }
+
+    pub fn insert(
+        &self,
+        key: &str,
+        groups: Vec<ConceptGroup>,
+        regrouping: Option<Arc<Regrouping>>,
+    ) {
+        self.write_disk(key, &groups);
+        let cached = CachedLayout {
+            groups: Arc::new(groups),
+            regrouping,
+        };
+        let bytes = cached.estimated_bytes();
+        self.lock_memory().insert(key, cached, bytes);
+    }
+
+    pub fn stats(&self) -> LayoutCacheStats {
+        let memory = self.lock_memory();
+        LayoutCacheStats {
+            entries: memory.len(),
+            bytes: memory.bytes(),
+            byte_budget: memory.budget(),
+            disk_enabled: self.disk_dir.is_some(),
+            memory_hits: self.memory_hits.load(Ordering::Relaxed),
+            disk_hits: self.disk_hits.load(Ordering::Relaxed),
+            misses: self.misses.load(Ordering::Relaxed),
+        }
+    }
+
+    fn lock_memory(&self) -> std::sync::MutexGuard<'_, ByteLru<CachedLayout>> {
+        self.memory.lock().unwrap_or_else(|e| e.into_inner())
+    }
+
+    fn disk_path(&self, key: &str) -> Option<PathBuf> {
+        self.disk_dir
+            .as_ref()
+            .map(|dir| dir.join(format!("{}.json", key)))
+    }
+
+    fn read_disk(&self, key: &str) -> Option<Vec<ConceptGroup>> {
+        let path = self.disk_path(key)?;
+        let bytes = std::fs::read(&path).ok()?;
+        match serde_json::from_slice(&bytes) {
+            Ok(groups) => Some(groups),
+            Err(e) => {
+                log::warn!("Discarding unreadable layout cache entry {:?}: {}", path, e);
+                let _ = std::fs::remove_file(&path);
+                None
+            }
+        }
+    }
+
+    /// Writes through a temporary file so readers never see a partial entry.
+    fn write_disk(&self, key: &str, groups: &[ConceptGroup]) {
+        let Some(path) = self.disk_path(key) else {
+            return;
+        };
+        let tmp = path.with_extension(format!("json.tmp-{}", std::process::id()));
+
+        let result = serde_json::to_vec(groups)
+            .map_err(std::io::Error::from)
+            .and_then(|bytes| std::fs::write(&tmp, bytes))
+            .and_then(|()| std::fs::rename(&tmp, &path));
+        if let Err(e) = result {
+            log::warn!("Failed to write layout cache entry {:?}: {}", path, e);
+            let _ = std::fs::remove_file(&tmp);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn concept(name: &str) -> Concept {
+        Concept {
+            concept: name.to_string(),
+            importance: 0.5,
+        }
+    }
+
+    fn groups(label: &str, n: usize) -> Vec<ConceptGroup> {
+        (0..n)
+            .map(|i| ConceptGroup {
+                concepts: vec![format!("{}-{}", label, i)],
+                reduced_embedding: vec![i as f32, 0.0, 1.0],
+                connections: vec![(i + 1) % n],
+                connection_weights: vec![0.5],
+                importance_score: 0.5,
+                group_id: i,
+            })
+            .collect()
+    }
+
+    #[test]
+    fn test_key_ignores_order_but_not_params_or_model() {
+        let params = ForceParams::default();
+        let none = PreviousPositions::new();
+        let a = LayoutCache::key(&[concept("x"), concept("y")], &none, "m", &params);
+        let b = LayoutCache::key(&[concept("y"), concept("x")], &none, "m", &params);
+        assert_eq!(a, b);
+
+        assert_ne!(
+            a,
+            LayoutCache::key(&[concept("x"), concept("y")], &none, "other", &params)
+        );
+        let tweaked = ForceParams {
+            iterations: 10,
+            ..ForceParams::default()
+        };
+        assert_ne!(
+            a,
+            LayoutCache::key(&[concept("x"), concept("y")], &none, "m", &tweaked)
+        );
+        assert_ne!(a, LayoutCache::key(&[concept("xy")], &none, "m", &params));
+    }
+
+    #[test]
+    fn test_key_covers_importance_and_previous_positions() {
+        let params = ForceParams::default();
+        let none = PreviousPositions::new();
+        let a = LayoutCache::key(&[concept("x"), concept("y")], &none, "m", &params);
+
+        let heavier = Concept {
+            importance: 0.9,
+            ..concept("x")
+        };
+        assert_ne!(
+            a,
+            LayoutCache::key(&[heavier, concept("y")], &none, "m", &params)
+        );
+
+        // Another user's planets are a different warm start
+        let placed: PreviousPositions = [("x".to_string(), [1.0, 2.0, 3.0])].into_iter().collect();
+        let warm = LayoutCache::key(&[concept("x"), concept("y")], &placed, "m", &params);
+        assert_ne!(a, warm);
+
+        // Positions of concepts outside the set do not matter
+        let mut unrelated = placed.clone();
+        unrelated.insert("z".to_string(), [0.0, 0.0, 0.0]);
+        assert_eq!(
+            warm,
+            LayoutCache::key(&[concept("x"), concept("y")], &unrelated, "m", &params)
+        );
+    }
+
+    #[test]
+    fn test_memory_tier_evicts_least_recently_used() {
+        let entry_bytes = estimated_bytes(&groups("a", 4));
+        let cache = LayoutCache::new(entry_bytes * 2, None);
+
+        cache.insert("a", groups("a", 4), None);
+        cache.insert("b", groups("b", 4), None);
+        assert!(cache.get("a").is_some());
+
+        // "b" is now the least recently used and makes room for "c"
+        cache.insert("c", groups("c", 4), None);
+        assert!(cache.get("b").is_none());
+        assert!(cache.get("a").is_some());
+        assert!(cache.get("c").is_some());
+
+        let stats = cache.stats();
+        assert_eq!(stats.entries, 2);
+        assert!(stats.bytes <= stats.byte_budget);
+        assert_eq!((stats.memory_hits, stats.misses), (3, 1));
+    }
+
+    #[test]
+    fn test_oversized_results_are_not_cached() {
+        let cache = LayoutCache::new(16, None);
+        cache.insert("big", groups("big", 10), None);
+        assert!(cache.get("big").is_none());
+        assert_eq!(cache.stats().bytes, 0);
+    }
+
+    #[test]
+    fn test_disk_tier_survives_a_new_cache() {
+        let dir = std::env::temp_dir().join(format!("layout-cache-test-{}", std::process::id()));
+        let _ = std::fs::remove_dir_all(&dir);
+
+        LayoutCache::new(DEFAULT_BYTE_BUDGET, Some(dir.clone())).insert("k", groups("d", 3), None);
+
+        let reopened = LayoutCache::new(DEFAULT_BYTE_BUDGET, Some(dir.clone()));
+        let cached = reopened.get("k").expect("disk hit");
+        assert_eq!(cached.groups[2].concepts, vec!["d-2".to_string()]);
+        assert!(cached.regrouping.is_none());
+        assert_eq!(reopened.stats().disk_hits, 1);
+
+        // Promoted to memory on the first read
+        reopened.get("k");
+        assert_eq!(reopened.stats().memory_hits, 1);
+
+        std::fs::remove_dir_all(&dir).unwrap();
+    }
+}
@@ -0,0 +1,153 @@
+//! Single-linkage dendrogram over a similarity graph.
+//!
+//! Kruskal's algorithm on edges in descending similarity keeps only the edges
+//! that join two clusters, i.e. a maximum spanning forest. Single-linkage
+//! clusters at threshold `t` are the components of the forest edges above
+//! `t`, so any cut is one union-find pass over a prefix of the merges.
+
+use super::graph::SimilarityGraph;
+
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub struct Merge {
+    pub a: usize,
+    pub b: usize,
+    pub similarity: f32,
+}
+
+#[derive(Debug, Clone, Default)]
+pub struct Dendrogram {
+    len: usize,
+    /// Spanning-forest edges, most similar first.
+    merges: Vec<Merge>,
+}
+
+fn find(parent: &mut [usize], mut x: usize) -> usize {
+    while parent[x] != x {
+        parent[x] = parent[parent[x]];
+        x = parent[x];
+    }
+    x
+}
+
+impl Dendrogram {
+    pub fn from_graph(graph: &SimilarityGraph) -> Self {
+        let mut edges: Vec<(usize, usize, f32)> = graph.edges().collect();
+        edges.sort_by(|x, y| y.2.total_cmp(&x.2).then_with(|| (x.0, x.1).cmp(&(y.0, y.1))));
+
+        let mut parent: Vec<usize> = (0..graph.len()).collect();
+        let mut merges = Vec::with_capacity(graph.len().saturating_sub(1));
+        for (a, b, similarity) in edges {
+            let (root_a, root_b) = (find(&mut parent, a), find(&mut parent, b));
+            if root_a != root_b {
+                parent[root_b] = root_a;
+                merges.push(Merge { a, b, similarity });
+            }
+        }
+
+        Self {
+            len: graph.len(),
+            merges,
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.len
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len == 0
+    }
+
+    pub fn merges(&self) -> &[Merge] {
+        &self.merges
+    }
+
+    /// Cluster of every node when only merges strictly above `threshold` are
+    /// applied. Clusters are numbered in order of their lowest node.
+    pub fn cut(&self, threshold: f32) -> Vec<usize> {
+        let mut parent: Vec<usize> = (0..self.len).collect();
+        for merge in self.merges.iter().take_while(|m| m.similarity > threshold) {
+            let (root_a, root_b) = (find(&mut parent, merge.a), find(&mut parent, merge.b));
+            if root_a != root_b {
+                parent[root_a.max(root_b)] = root_a.min(root_b);
+            }
+        }
+
+        const UNASSIGNED: usize = usize::MAX;
+        let mut cluster_of_root = vec![UNASSIGNED; self.len];
+        let mut clusters = 0;
+        (0..self.len)
+            .map(|i| {
+                let root = find(&mut parent, i);
+                if cluster_of_root[root] == UNASSIGNED {
+                    cluster_of_root[root] = clusters;
+                    clusters += 1;
+                }
+                cluster_of_root[root]
+            })
+            .collect()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Two tight triples {0,1,2} and {3,4,5} joined by one 0.5 edge.
+    fn two_clusters() -> SimilarityGraph {
+        SimilarityGraph::from_similarity(6, 5, 0.0, |i, j| match (i / 3 == j / 3, i, j) {
+            (true, 0, 1) | (true, 3, 4) => 0.95,
+            (true, _, _) => 0.8,
+            (false, 2, 3) => 0.5,
+            _ => 0.0,
+        })
+    }
+
+    #[test]
+    fn test_forest_has_one_merge_per_joined_pair_of_clusters() {
+        let dendrogram = Dendrogram::from_graph(&two_clusters());
+        assert_eq!(dendrogram.merges().len(), 5);
+        let similarities: Vec<f32> = dendrogram.merges().iter().map(|m| m.similarity).collect();
+        assert!(similarities.windows(2).all(|w| w[0] >= w[1]));
+    }
+
+    #[test]
+    fn test_cuts_at_different_thresholds() {
+        let dendrogram = Dendrogram::from_graph(&two_clusters());
+        assert_eq!(dendrogram.cut(0.99), vec![0, 1, 2, 3, 4, 5]);
+        assert_eq!(dendrogram.cut(0.9), vec![0, 0, 1, 2, 2, 3]);
+        assert_eq!(dendrogram.cut(0.7), vec![0, 0, 0, 1, 1, 1]);
+        assert_eq!(dendrogram.cut(0.4), vec![0; 6]);
+    }
+
+    #[test]
+    fn test_cut_is_strict() {
+        let dendrogram = Dendrogram::from_graph(&two_clusters());
+        assert_eq!(dendrogram.cut(0.8), dendrogram.cut(0.9));
+    }
+
+    #[test]
+    fn test_cut_matches_union_find_over_all_edges() {
+        let graph = SimilarityGraph::from_similarity(60, 6, 0.0, |i, j| {
+            ((i * 7 + j * 13) % 17) as f32 / 17.0
+        });
+        let dendrogram = Dendrogram::from_graph(&graph);
+
+        for threshold in [0.3, 0.6, 0.85] {
+            let mut parent: Vec<usize> = (0..graph.len()).collect();
+            for (i, j, similarity) in graph.edges() {
+                if similarity > threshold {
+                    let (a, b) = (find(&mut parent, i), find(&mut parent, j));
+                    parent[a] = b;
+                }
+            }
+            let labels = dendrogram.cut(threshold);
+            for i in 0..graph.len() {
+                for j in 0..graph.len() {
+                    let same = find(&mut parent, i) == find(&mut parent, j);
+                    assert_eq!(same, labels[i] == labels[j], "t = {} ({}, {})", threshold, i, j);
+                }
+            }
+        }
+    }
+}
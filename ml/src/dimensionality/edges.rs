@@ -0,0 +1,132 @@
+//! Compact edge list for layout responses.
+//!
+//! Instead of every group listing its neighbours, each undirected edge is
+//! sent once. Edges are sorted by `(i, j)` with `i < j` and stored as two
+//! small deltas each: `i` minus the previous edge's `i`, then `j` minus the
+//! previous `j` on the same row (or minus `i` on a new row). Weights are
+//! similarities quantized to one byte.
+
+use super::ConceptGroup;
+use serde::{Deserialize, Serialize};
+use std::collections::BTreeMap;
+
+#[derive(Debug, Clone, Default, PartialEq, Serialize, Deserialize)]
+pub struct CompactEdges {
+    /// Two deltas per edge, see the module docs.
+    pub deltas: Vec<u32>,
+    /// Similarity of each edge scaled to 0..=255.
+    pub weights: Vec<u8>,
+}
+
+fn quantize(similarity: f32) -> u8 {
+    (similarity.clamp(0.0, 1.0) * 255.0).round() as u8
+}
+
+impl CompactEdges {
+    /// Edges from the `connections` of `groups`, indexed by position. An edge
+    /// listed by only one endpoint is still included.
+    pub fn from_groups(groups: &[ConceptGroup]) -> Self {
+        let mut edges: BTreeMap<(usize, usize), f32> = BTreeMap::new();
+        for (i, group) in groups.iter().enumerate() {
+            for (k, &j) in group.connections.iter().enumerate() {
+                if i == j {
+                    continue;
+                }
+                let weight = group.connection_weights.get(k).copied().unwrap_or(0.0);
+                let entry = edges.entry((i.min(j), i.max(j))).or_insert(weight);
+                *entry = entry.max(weight);
+            }
+        }
+        Self::from_sorted(edges.into_iter().map(|((i, j), w)| (i, j, w)))
+    }
+
+    /// Encodes edges already sorted by `(i, j)` with `i < j`.
+    pub fn from_sorted(edges: impl IntoIterator<Item = (usize, usize, f32)>) -> Self {
+        let mut compact = Self::default();
+        let mut previous: Option<(usize, usize)> = None;
+        for (i, j, similarity) in edges {
+            let (delta_i, base) = match previous {
+                Some((pi, pj)) if pi == i => (0, pj),
+                Some((pi, _)) => (i - pi, i),
+                None => (i, i),
+            };
+            compact.deltas.push(delta_i as u32);
+            compact.deltas.push((j - base) as u32);
+            compact.weights.push(quantize(similarity));
+            previous = Some((i, j));
+        }
+        compact
+    }
+
+    pub fn len(&self) -> usize {
+        self.weights.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.weights.is_empty()
+    }
+
+    /// `(i, j, similarity)` for every edge, with similarities dequantized.
+    pub fn decode(&self) -> Vec<(usize, usize, f32)> {
+        let mut edges = Vec::with_capacity(self.len());
+        let (mut i, mut j) = (0usize, 0usize);
+        for (pair, &weight) in self.deltas.chunks_exact(2).zip(&self.weights) {
+            if pair[0] > 0 || edges.is_empty() {
+                i += pair[0] as usize;
+                j = i;
+            }
+            j += pair[1] as usize;
+            edges.push((i, j, weight as f32 / 255.0));
+        }
+        edges
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn group(connections: Vec<usize>, weights: Vec<f32>) -> ConceptGroup {
+        ConceptGroup {
+            concepts: vec![],
+            reduced_embedding: vec![0.0, 0.0, 0.0],
+            connections,
+            connection_weights: weights,
+            importance_score: 0.5,
+            group_id: 0,
+        }
+    }
+
+    #[test]
+    fn test_round_trip_within_quantization_error() {
+        let edges = vec![(0, 3, 0.9), (0, 7, 0.25), (2, 3, 0.5), (2, 40, 1.0), (5, 6, 0.0)];
+        let compact = CompactEdges::from_sorted(edges.clone());
+        assert_eq!(compact.deltas, vec![0, 3, 0, 4, 2, 1, 0, 37, 3, 1]);
+
+        let decoded = compact.decode();
+        assert_eq!(decoded.len(), edges.len());
+        for ((i, j, w), (di, dj, dw)) in edges.into_iter().zip(decoded) {
+            assert_eq!((i, j), (di, dj));
+            assert!((w - dw).abs() <= 0.51 / 255.0);
+        }
+    }
+
+    #[test]
+    fn test_groups_share_each_edge_once() {
+        let groups = vec![
+            group(vec![1, 2], vec![0.8, 0.4]),
+            group(vec![0], vec![0.8]),
+            // Listed from both ends, sent once
+            group(vec![0], vec![0.4]),
+        ];
+        let edges = CompactEdges::from_groups(&groups).decode();
+        let pairs: Vec<(usize, usize)> = edges.iter().map(|&(i, j, _)| (i, j)).collect();
+        assert_eq!(pairs, vec![(0, 1), (0, 2)]);
+    }
+
+    #[test]
+    fn test_missing_weights_decode_as_zero() {
+        let groups = vec![group(vec![1], vec![]), group(vec![], vec![])];
+        assert_eq!(CompactEdges::from_groups(&groups).decode(), vec![(0, 1, 0.0)]);
+    }
+}
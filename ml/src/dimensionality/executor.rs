@@ -0,0 +1,325 @@
+//! Bounded compute pool that runs layouts off the actix worker threads.
+//!
+//! Jobs run on tokio's blocking threads, with at most `workers` running at
+//! once and at most `queue_capacity` more waiting; beyond that new jobs are
+//! rejected instead of piling up. Dropping the future returned by
+//! `LayoutPool::run` (e.g. when the client disconnects) raises the job's
+//! cancellation flag, which the layout checks between iterations.
+//!
+//! The physics step of every running layout shares one rayon pool, sized so
+//! that workers times physics threads stays near the core count.
+
+use crate::error::ApiError;
+use rayon::ThreadPool;
+use serde::Serialize;
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::Arc;
+use tokio::sync::Semaphore;
+
+/// Raised when the caller of a layout job goes away.
+pub type CancelFlag = Arc<AtomicBool>;
+
+/// Point-in-time pool occupancy, served by the metrics endpoint.
+#[derive(Debug, Clone, Serialize)]
+pub struct LayoutPoolStats {
+    pub workers: usize,
+    pub queue_capacity: usize,
+    /// Threads of the shared physics pool; 1 means layouts run serially.
+    pub physics_threads: usize,
+    pub running: usize,
+    pub queued: usize,
+    /// Fraction of worker and queue slots in use, in `[0, 1]`.
+    pub saturation: f32,
+    pub completed: u64,
+    pub rejected: u64,
+    pub cancelled: u64,
+}
+
+pub struct LayoutPool {
+    workers: usize,
+    queue_capacity: usize,
+    physics: Option<Arc<ThreadPool>>,
+    admission: Arc<Semaphore>,
+    execution: Arc<Semaphore>,
+    running: Arc<AtomicUsize>,
+    queued: AtomicUsize,
+    completed: Arc<AtomicU64>,
+    rejected: AtomicU64,
+    cancelled: Arc<AtomicU64>,
+}
+
+/// Builds the rayon pool that parallelizes the physics step of layouts.
+/// 0 threads uses all cores; 1 returns `None`, running layouts serially.
+pub fn physics_thread_pool(threads: usize) -> Option<Arc<ThreadPool>> {
+    if threads == 1 {
+        return None;
+    }
+    match rayon::ThreadPoolBuilder::new()
+        .num_threads(threads)
+        .thread_name(|i| format!("layout-{}", i))
+        .build()
+    {
+        Ok(pool) => Some(Arc::new(pool)),
+        Err(e) => {
+            log::warn!("Failed to build layout thread pool, running serially: {}", e);
+            None
+        }
+    }
+}
+
+/// Sets the flag when dropped unless disarmed, so an abandoned request
+/// cancels its job.
+struct CancelOnDrop {
+    flag: CancelFlag,
+    armed: bool,
+}
+
+impl Drop for CancelOnDrop {
+    fn drop(&mut self) {
+        if self.armed {
+            self.flag.store(true, Ordering::Relaxed);
+        }
+    }
+}
+
+/// Decrements a counter when dropped, so abandoned waits and panicking jobs
+/// are still accounted for.
+struct CountGuard<'a>(&'a AtomicUsize);
+
+impl Drop for CountGuard<'_> {
+    fn drop(&mut self) {
+        self.0.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+impl LayoutPool {
+    pub fn new(workers: usize, queue_capacity: usize) -> Self {
+        let workers = workers.max(1);
+        Self {
+            workers,
+            queue_capacity,
+            physics: None,
+            admission: Arc::new(Semaphore::new(workers + queue_capacity)),
+            execution: Arc::new(Semaphore::new(workers)),
+            running: Arc::new(AtomicUsize::new(0)),
+            queued: AtomicUsize::new(0),
+            completed: Arc::new(AtomicU64::new(0)),
+            rejected: AtomicU64::new(0),
+            cancelled: Arc::new(AtomicU64::new(0)),
+        }
+    }
+
+    /// Shares a physics pool of `threads` threads among the layouts run here.
+    pub fn with_physics_threads(mut self, threads: usize) -> Self {
+        self.physics = physics_thread_pool(threads);
+        self
+    }
+
+    /// The physics pool to hand to each layout, if layouts run in parallel.
+    pub fn physics_pool(&self) -> Option<Arc<ThreadPool>> {
+        self.physics.clone()
+    }
+
+    /// Sized from `LAYOUT_WORKERS` (default: half the cores, at least 1),
+    /// `LAYOUT_QUEUE_CAPACITY` (default: 4 per worker) and `LAYOUT_THREADS`
+    /// for the shared physics pool (default: the cores divided among workers).
+    pub fn from_env() -> Self {
+        let cores = std::thread::available_parallelism().map_or(1, |n| n.get());
+
+        let workers = std::env::var("LAYOUT_WORKERS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or((cores / 2).max(1));
+
+        let queue_capacity = std::env::var("LAYOUT_QUEUE_CAPACITY")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(workers * 4);
+
+        let workers = workers.max(1);
+        let physics_threads = std::env::var("LAYOUT_THREADS")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or((cores / workers).max(1));
+
+        Self::new(workers, queue_capacity).with_physics_threads(physics_threads)
+    }
+
+    /// Runs `job` on a blocking thread once a worker slot is free.
+    ///
+    /// Fails immediately with `ApiError::LayoutQueueFull` if every worker and
+    /// queue slot is taken. The job receives a flag that is raised if this
+    /// future is dropped before the job finishes.
+    pub async fn run<T, F>(&self, job: F) -> Result<T, ApiError>
+    where
+        F: FnOnce(CancelFlag) -> Result<T, ApiError> + Send + 'static,
+        T: Send + 'static,
+    {
+        let admitted = match Arc::clone(&self.admission).try_acquire_owned() {
+            Ok(permit) => permit,
+            Err(_) => {
+                self.rejected.fetch_add(1, Ordering::Relaxed);
+                log::warn!(
+                    "Layout pool saturated ({} running, {} queued), rejecting job",
+                    self.running.load(Ordering::Relaxed),
+                    self.queued.load(Ordering::Relaxed)
+                );
+                return Err(ApiError::LayoutQueueFull);
+            }
+        };
+
+        let worker = {
+            self.queued.fetch_add(1, Ordering::Relaxed);
+            let _waiting = CountGuard(&self.queued);
+            Arc::clone(&self.execution)
+                .acquire_owned()
+                .await
+                .map_err(|e| ApiError::InternalError(format!("Layout pool closed: {}", e)))?
+        };
+
+        let flag: CancelFlag = Arc::new(AtomicBool::new(false));
+        let mut guard = CancelOnDrop {
+            flag: Arc::clone(&flag),
+            armed: true,
+        };
+
+        let running = Arc::clone(&self.running);
+        let completed = Arc::clone(&self.completed);
+        let cancelled = Arc::clone(&self.cancelled);
+        running.fetch_add(1, Ordering::Relaxed);
+
+        // Permits move into the blocking task so slots free up only when the
+        // work has actually stopped, not when the caller gives up
+        let handle = tokio::task::spawn_blocking(move || {
+            // Declared first so it drops last, after the permits are released
+            let _running = CountGuard(&running);
+            let _slots = (admitted, worker);
+            let result = job(Arc::clone(&flag));
+            if flag.load(Ordering::Relaxed) {
+                cancelled.fetch_add(1, Ordering::Relaxed);
+            } else {
+                completed.fetch_add(1, Ordering::Relaxed);
+            }
+            result
+        });
+
+        let result = handle
+            .await
+            .map_err(|e| ApiError::InternalError(format!("Layout job failed: {}", e)));
+        guard.armed = false;
+        result?
+    }
+
+    pub fn stats(&self) -> LayoutPoolStats {
+        let running = self.running.load(Ordering::Relaxed);
+        let queued = self.queued.load(Ordering::Relaxed);
+        let slots = self.workers + self.queue_capacity;
+        LayoutPoolStats {
+            workers: self.workers,
+            queue_capacity: self.queue_capacity,
+            physics_threads: self.physics.as_ref().map_or(1, |pool| pool.current_num_threads()),
+            running,
+            queued,
+            saturation: ((running + queued) as f32 / slots as f32).min(1.0),
+            completed: self.completed.load(Ordering::Relaxed),
+            rejected: self.rejected.load(Ordering::Relaxed),
+            cancelled: self.cancelled.load(Ordering::Relaxed),
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::time::Duration;
+
+    /// Spins until `flag` is raised or `timeout` passes; reports which.
+    fn wait_for(flag: &CancelFlag, timeout: Duration) -> bool {
+        let start = std::time::Instant::now();
+        while start.elapsed() < timeout {
+            if flag.load(Ordering::Relaxed) {
+                return true;
+            }
+            std::thread::sleep(Duration::from_millis(1));
+        }
+        false
+    }
+
+    #[tokio::test]
+    async fn test_runs_job_and_counts_completion() {
+        let pool = LayoutPool::new(2, 2);
+        let value = pool.run(|_| Ok(41 + 1)).await.unwrap();
+        assert_eq!(value, 42);
+
+        let stats = pool.stats();
+        assert_eq!(stats.completed, 1);
+        assert_eq!(stats.running, 0);
+        assert_eq!(stats.saturation, 0.0);
+    }
+
+    #[tokio::test(flavor = "multi_thread", worker_threads = 2)]
+    async fn test_rejects_when_queue_is_full() {
+        let pool = Arc::new(LayoutPool::new(1, 1));
+        let release = Arc::new(AtomicBool::new(false));
+
+        // One job running, one waiting: the pool is at capacity
+        let mut jobs = Vec::new();
+        for _ in 0..2 {
+            let pool = Arc::clone(&pool);
+            let release = Arc::clone(&release);
+            jobs.push(tokio::spawn(async move {
+                pool.run(move |_| {
+                    wait_for(&release, Duration::from_secs(5));
+                    Ok(())
+                })
+                .await
+            }));
+        }
+        while pool.stats().running + pool.stats().queued < 2 {
+            tokio::time::sleep(Duration::from_millis(1)).await;
+        }
+        assert_eq!(pool.stats().saturation, 1.0);
+
+        let rejected = pool.run(|_| Ok(())).await;
+        assert!(matches!(rejected, Err(ApiError::LayoutQueueFull)));
+        assert_eq!(pool.stats().rejected, 1);
+
+        release.store(true, Ordering::Relaxed);
+        for job in jobs {
+            job.await.unwrap().unwrap();
+        }
+        assert_eq!(pool.stats().completed, 2);
+    }
+
+    #[tokio::test(flavor = "multi_thread", worker_threads = 2)]
+    async fn test_dropping_the_caller_cancels_the_job() {
+        let pool = Arc::new(LayoutPool::new(1, 0));
+        let observed = Arc::new(AtomicBool::new(false));
+
+        let job_observed = Arc::clone(&observed);
+        let caller = {
+            let pool = Arc::clone(&pool);
+            tokio::spawn(async move {
+                pool.run(move |cancel| {
+                    let seen = wait_for(&cancel, Duration::from_secs(5));
+                    job_observed.store(seen, Ordering::Relaxed);
+                    Err::<(), _>(ApiError::LayoutCancelled)
+                })
+                .await
+            })
+        };
+        while pool.stats().running == 0 {
+            tokio::time::sleep(Duration::from_millis(1)).await;
+        }
+        caller.abort();
+
+        while pool.stats().running > 0 {
+            tokio::time::sleep(Duration::from_millis(1)).await;
+        }
+        assert!(observed.load(Ordering::Relaxed));
+        assert_eq!(pool.stats().cancelled, 1);
+
+        // The slot is free again
+        assert_eq!(pool.run(|_| Ok(7)).await.unwrap(), 7);
+    }
+}
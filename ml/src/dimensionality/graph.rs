@@ -0,0 +1,216 @@
+//! Sparse top-k similarity graph in CSR form.
+//!
+//! Replaces the dense n×n similarity matrices: each node keeps at most `k`
+//! strongest neighbours above a floor, and the result is symmetrized, so memory
+//! is O(n·k) and neighbour iteration is proportional to the degree.
+
+use std::cmp::Ordering;
+use std::collections::BinaryHeap;
+
+#[derive(Debug, Clone, Copy)]
+struct Candidate {
+    similarity: f32,
+    index: usize,
+}
+
+impl PartialEq for Candidate {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
+}
+
+impl Eq for Candidate {}
+
+impl PartialOrd for Candidate {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl Ord for Candidate {
+    /// Reversed so `BinaryHeap` pops the weakest candidate first; ties keep the
+    /// lower index.
+    fn cmp(&self, other: &Self) -> Ordering {
+        other
+            .similarity
+            .total_cmp(&self.similarity)
+            .then_with(|| self.index.cmp(&other.index))
+    }
+}
+
+/// Accumulates candidate edges and keeps the top `k` per node.
+pub struct TopKBuilder {
+    k: usize,
+    floor: f32,
+    heaps: Vec<BinaryHeap<Candidate>>,
+}
+
+impl TopKBuilder {
+    pub fn new(n: usize, k: usize, floor: f32) -> Self {
+        Self {
+            k,
+            floor,
+            heaps: (0..n).map(|_| BinaryHeap::with_capacity(k + 1)).collect(),
+        }
+    }
+
+    /// Offers an undirected edge; it is kept for each endpoint whose top-k it enters.
+    pub fn offer(&mut self, i: usize, j: usize, similarity: f32) {
+        if i == j || !(similarity > self.floor) || self.k == 0 {
+            return;
+        }
+        self.offer_directed(i, j, similarity);
+        self.offer_directed(j, i, similarity);
+    }
+
+    fn offer_directed(&mut self, from: usize, to: usize, similarity: f32) {
+        let heap = &mut self.heaps[from];
+        let candidate = Candidate { similarity, index: to };
+        if heap.len() < self.k {
+            heap.push(candidate);
+        } else if let Some(weakest) = heap.peek() {
+            if candidate < *weakest {
+                heap.pop();
+                heap.push(candidate);
+            }
+        }
+    }
+
+    pub fn build(self) -> SimilarityGraph {
+        let n = self.heaps.len();
+
+        // Symmetrize: keep an edge if either endpoint selected it
+        let mut adjacency: Vec<Vec<(usize, f32)>> = vec![Vec::new(); n];
+        for (i, heap) in self.heaps.into_iter().enumerate() {
+            for candidate in heap.into_vec() {
+                adjacency[i].push((candidate.index, candidate.similarity));
+                adjacency[candidate.index].push((i, candidate.similarity));
+            }
+        }
+
+        let mut offsets = Vec::with_capacity(n + 1);
+        let mut neighbors = Vec::new();
+        let mut weights = Vec::new();
+        offsets.push(0);
+        for mut row in adjacency {
+            row.sort_by_key(|&(j, _)| j);
+            row.dedup_by_key(|&mut (j, _)| j);
+            for (j, similarity) in row {
+                neighbors.push(j);
+                weights.push(similarity);
+            }
+            offsets.push(neighbors.len());
+        }
+
+        SimilarityGraph {
+            offsets,
+            neighbors,
+            weights,
+        }
+    }
+}
+
+#[derive(Debug, Clone, Default)]
+pub struct SimilarityGraph {
+    offsets: Vec<usize>,
+    neighbors: Vec<usize>,
+    weights: Vec<f32>,
+}
+
+impl SimilarityGraph {
+    /// Builds the graph by evaluating `similarity` for every unordered pair.
+    pub fn from_similarity<F>(n: usize, k: usize, floor: f32, similarity: F) -> Self
+    where
+        F: Fn(usize, usize) -> f32,
+    {
+        let mut builder = TopKBuilder::new(n, k, floor);
+        for i in 0..n {
+            for j in (i + 1)..n {
+                builder.offer(i, j, similarity(i, j));
+            }
+        }
+        builder.build()
+    }
+
+    pub fn len(&self) -> usize {
+        self.offsets.len().saturating_sub(1)
+    }
+
+    pub fn edge_count(&self) -> usize {
+        self.neighbors.len() / 2
+    }
+
+    pub fn degree(&self, i: usize) -> usize {
+        self.offsets[i + 1] - self.offsets[i]
+    }
+
+    /// Neighbours of `i` in ascending index order, with their similarities.
+    pub fn neighbors(&self, i: usize) -> impl Iterator<Item = (usize, f32)> + '_ {
+        let range = self.offsets[i]..self.offsets[i + 1];
+        self.neighbors[range.clone()]
+            .iter()
+            .copied()
+            .zip(self.weights[range].iter().copied())
+    }
+
+    /// Each undirected edge once, as `(i, j, similarity)` with `i < j`.
+    pub fn edges(&self) -> impl Iterator<Item = (usize, usize, f32)> + '_ {
+        (0..self.len()).flat_map(move |i| {
+            self.neighbors(i)
+                .filter(move |&(j, _)| i < j)
+                .map(move |(j, similarity)| (i, j, similarity))
+        })
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn line_similarity(i: usize, j: usize) -> f32 {
+        1.0 / (1.0 + (i as f32 - j as f32).abs())
+    }
+
+    #[test]
+    fn test_keeps_top_k_and_symmetrizes() {
+        let graph = SimilarityGraph::from_similarity(10, 2, 0.0, line_similarity);
+        assert_eq!(graph.len(), 10);
+
+        // Middle nodes pick their immediate neighbours
+        let middle: Vec<usize> = graph.neighbors(5).map(|(j, _)| j).collect();
+        assert_eq!(middle, vec![4, 6]);
+
+        // Every edge is present in both directions
+        for (i, j, _) in graph.edges() {
+            assert!(graph.neighbors(j).any(|(k, _)| k == i));
+        }
+    }
+
+    #[test]
+    fn test_floor_is_strict() {
+        let graph = SimilarityGraph::from_similarity(4, 3, 0.4, line_similarity);
+        for (_, _, similarity) in graph.edges() {
+            assert!(similarity > 0.4);
+        }
+        assert_eq!(graph.edge_count(), 3);
+    }
+
+    #[test]
+    fn test_edge_count_bounded_by_n_k() {
+        let graph = SimilarityGraph::from_similarity(200, 4, 0.0, |i, j| {
+            ((i * 31 + j * 17) % 97) as f32 / 97.0
+        });
+        for i in 0..graph.len() {
+            assert!(graph.degree(i) >= 4);
+        }
+        assert!(graph.edge_count() <= 200 * 4);
+    }
+
+    #[test]
+    fn test_empty_graph() {
+        let graph = SimilarityGraph::from_similarity(3, 5, 0.0, |_, _| 0.0);
+        assert_eq!(graph.len(), 3);
+        assert_eq!(graph.edge_count(), 0);
+        assert_eq!(graph.degree(1), 0);
+    }
+}
@@ -0,0 +1,658 @@
+//! Hierarchical navigable small world index over unit-normalized embeddings.
+//!
+//! Similarity is the dot product of normalized vectors (cosine). Nodes are
+//! inserted one at a time, so an index can be kept per user and extended as
+//! concepts are saved instead of being rebuilt. `range_search` returns every
+//! neighbour above a similarity threshold, which is what concept merging needs.
+//!
+//! Re-inserting a label with a new vector marks its old node deleted; deleted
+//! nodes still route searches but are never returned, and the index is
+//! rebuilt once they outnumber the live ones.
+
+use crate::data::lru::ByteLru;
+use std::cmp::{Ordering, Reverse};
+use std::collections::{BinaryHeap, HashMap, HashSet};
+use std::sync::{Arc, Mutex};
+
+/// Nodes below which deleted nodes are never compacted away.
+const MIN_COMPACT_NODES: usize = 64;
+
+const DEFAULT_REGISTRY_BYTES: usize = 256 * 1024 * 1024;
+
+/// Largest per-component difference at which a re-inserted vector counts as
+/// unchanged, above the rounding of normalizing a normalized vector again.
+const SAME_VECTOR_EPSILON: f32 = 1e-5;
+
+#[derive(Debug, Clone)]
+pub struct HnswParams {
+    /// Links per node on upper layers; layer 0 keeps twice as many.
+    pub m: usize,
+    pub ef_construction: usize,
+    /// Beam width for queries; range queries widen it as needed.
+    pub ef_search: usize,
+}
+
+impl Default for HnswParams {
+    fn default() -> Self {
+        Self {
+            m: 16,
+            ef_construction: 100,
+            ef_search: 64,
+        }
+    }
+}
+
+#[derive(Debug, Clone, Copy)]
+struct Scored {
+    similarity: f32,
+    id: usize,
+}
+
+impl PartialEq for Scored {
+    fn eq(&self, other: &Self) -> bool {
+        self.cmp(other) == Ordering::Equal
+    }
+}
+
+impl Eq for Scored {}
+
+impl PartialOrd for Scored {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl Ord for Scored {
+    fn cmp(&self, other: &Self) -> Ordering {
+        self.similarity
+            .total_cmp(&other.similarity)
+            .then_with(|| other.id.cmp(&self.id))
+    }
+}
+
+#[derive(Debug, Clone)]
+pub struct HnswIndex {
+    dim: usize,
+    params: HnswParams,
+    vectors: Vec<f32>,
+    labels: Vec<String>,
+    ids: HashMap<String, usize>,
+    /// `links[node][layer]` holds neighbour ids.
+    links: Vec<Vec<Vec<usize>>>,
+    /// Nodes replaced by a later insert of the same label.
+    deleted: Vec<bool>,
+    live: usize,
+    label_bytes: usize,
+    entry_point: Option<usize>,
+    max_layer: usize,
+}
+
+impl HnswIndex {
+    pub fn new(dim: usize, params: HnswParams) -> Self {
+        Self {
+            dim,
+            params,
+            vectors: Vec::new(),
+            labels: Vec::new(),
+            ids: HashMap::new(),
+            links: Vec::new(),
+            deleted: Vec::new(),
+            live: 0,
+            label_bytes: 0,
+            entry_point: None,
+            max_layer: 0,
+        }
+    }
+
+    pub fn dim(&self) -> usize {
+        self.dim
+    }
+
+    /// Live nodes, not counting those replaced by a newer vector.
+    pub fn len(&self) -> usize {
+        self.live
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.live == 0
+    }
+
+    /// Approximate heap footprint, for bounding the indexes kept in memory.
+    pub fn estimated_bytes(&self) -> usize {
+        let per_node = std::mem::size_of::<String>() * 2
+            + std::mem::size_of::<Vec<Vec<usize>>>()
+            + std::mem::size_of::<Vec<usize>>()
+            + self.params.m * 2 * std::mem::size_of::<usize>()
+            + 1;
+        std::mem::size_of::<Self>()
+            + self.vectors.len() * std::mem::size_of::<f32>()
+            + self.label_bytes * 2
+            + self.labels.len() * per_node
+    }
+
+    pub fn label(&self, id: usize) -> &str {
+        &self.labels[id]
+    }
+
+    pub fn id_of(&self, label: &str) -> Option<usize> {
+        self.ids.get(label).copied()
+    }
+
+    fn vector(&self, id: usize) -> &[f32] {
+        &self.vectors[id * self.dim..(id + 1) * self.dim]
+    }
+
+    fn similarity(&self, query: &[f32], id: usize) -> f32 {
+        query.iter().zip(self.vector(id)).map(|(a, b)| a * b).sum()
+    }
+
+    /// Deterministic layer draw: -ln(U) / ln(M) with U hashed from the node id.
+    fn random_layer(&self, id: usize) -> usize {
+        let mut z = (id as u64).wrapping_add(0x9E37_79B9_7F4A_7C15);
+        z = (z ^ (z >> 30)).wrapping_mul(0xBF58_476D_1CE4_E5B9);
+        z = (z ^ (z >> 27)).wrapping_mul(0x94D0_49BB_1331_11EB);
+        z ^= z >> 31;
+        let uniform = ((z >> 11) as f64 + 1.0) / (1u64 << 53) as f64;
+        let level_mult = 1.0 / (self.params.m.max(2) as f64).ln();
+        (-uniform.ln() * level_mult) as usize
+    }
+
+    fn max_links(&self, layer: usize) -> usize {
+        if layer == 0 {
+            self.params.m * 2
+        } else {
+            self.params.m
+        }
+    }
+
+    /// Adds a vector under `label` and returns its id. The vector is
+    /// normalized on insertion. A label already present with the same vector
+    /// keeps its node; with a different one the old node is replaced. A width
+    /// mismatch is ignored and returns `None`.
+    pub fn insert(&mut self, label: &str, vector: &[f32]) -> Option<usize> {
+        if vector.len() != self.dim {
+            return None;
+        }
+
+        let norm = vector.iter().map(|v| v * v).sum::<f32>().sqrt();
+        let scale = if norm > 0.0 { 1.0 / norm } else { 0.0 };
+        let query: Vec<f32> = vector.iter().map(|v| v * scale).collect();
+
+        if let Some(id) = self.id_of(label) {
+            let unchanged = self
+                .vector(id)
+                .iter()
+                .zip(&query)
+                .all(|(a, b)| (a - b).abs() <= SAME_VECTOR_EPSILON);
+            if unchanged {
+                return Some(id);
+            }
+            self.deleted[id] = true;
+            self.live -= 1;
+        }
+
+        let id = self.add_node(label, &query);
+        if self.labels.len() >= MIN_COMPACT_NODES && self.labels.len() - self.live > self.live {
+            self.compact();
+            return self.id_of(label);
+        }
+        Some(id)
+    }
+
+    /// Rebuilds the graph from the live nodes only.
+    fn compact(&mut self) {
+        let mut rebuilt = HnswIndex::new(self.dim, self.params.clone());
+        for id in 0..self.labels.len() {
+            if !self.deleted[id] {
+                rebuilt.add_node(&self.labels[id], self.vector(id));
+            }
+        }
+        *self = rebuilt;
+    }
+
+    /// Links a normalized vector into the graph as a new node.
+    fn add_node(&mut self, label: &str, query: &[f32]) -> usize {
+        let id = self.labels.len();
+        let layer = self.random_layer(id);
+        self.vectors.extend_from_slice(query);
+        if self.ids.insert(label.to_string(), id).is_none() {
+            self.label_bytes += label.len();
+        }
+        self.labels.push(label.to_string());
+        self.links.push(vec![Vec::new(); layer + 1]);
+        self.deleted.push(false);
+        self.live += 1;
+
+        let Some(mut entry) = self.entry_point else {
+            self.entry_point = Some(id);
+            self.max_layer = layer;
+            return id;
+        };
+
+        // Greedy descent through layers above the new node's top layer
+        for l in (layer + 1..=self.max_layer).rev() {
+            entry = self.greedy_closest(query, entry, l);
+        }
+
+        for l in (0..=layer.min(self.max_layer)).rev() {
+            let candidates = self.search_layer(query, &[entry], self.params.ef_construction, l);
+            let max_links = self.max_links(l);
+            let neighbors: Vec<usize> =
+                candidates.iter().take(max_links).map(|s| s.id).collect();
+
+            for &neighbor in &neighbors {
+                self.links[neighbor][l].push(id);
+                if self.links[neighbor][l].len() > max_links {
+                    self.prune(neighbor, l, max_links);
+                }
+            }
+            self.links[id][l] = neighbors;
+
+            if let Some(best) = candidates.first() {
+                entry = best.id;
+            }
+        }
+
+        if layer > self.max_layer {
+            self.max_layer = layer;
+            self.entry_point = Some(id);
+        }
+
+        id
+    }
+
+    /// Keeps the `max_links` neighbours of `node` most similar to it.
+    fn prune(&mut self, node: usize, layer: usize, max_links: usize) {
+        let base = self.vector(node).to_vec();
+        let mut scored: Vec<Scored> = self.links[node][layer]
+            .iter()
+            .map(|&id| Scored {
+                similarity: self.similarity(&base, id),
+                id,
+            })
+            .collect();
+        scored.sort_by(|a, b| b.cmp(a));
+        scored.truncate(max_links);
+        self.links[node][layer] = scored.into_iter().map(|s| s.id).collect();
+    }
+
+    fn greedy_closest(&self, query: &[f32], mut current: usize, layer: usize) -> usize {
+        let mut best = self.similarity(query, current);
+        loop {
+            let mut improved = false;
+            for &neighbor in &self.links[current][layer] {
+                let similarity = self.similarity(query, neighbor);
+                if similarity > best {
+                    best = similarity;
+                    current = neighbor;
+                    improved = true;
+                }
+            }
+            if !improved {
+                return current;
+            }
+        }
+    }
+
+    /// Beam search on one layer; returns up to `ef` nodes, most similar first.
+    fn search_layer(&self, query: &[f32], entries: &[usize], ef: usize, layer: usize) -> Vec<Scored> {
+        let mut visited: HashSet<usize> = entries.iter().copied().collect();
+        let mut candidates: BinaryHeap<Scored> = BinaryHeap::new();
+        let mut results: BinaryHeap<Reverse<Scored>> = BinaryHeap::new();
+
+        for &id in entries {
+            let scored = Scored {
+                similarity: self.similarity(query, id),
+                id,
+            };
+            candidates.push(scored);
+            results.push(Reverse(scored));
+        }
+
+        while let Some(current) = candidates.pop() {
+            let worst = results.peek().map_or(f32::MIN, |r| r.0.similarity);
+            if current.similarity < worst && results.len() >= ef {
+                break;
+            }
+
+            for &neighbor in &self.links[current.id][layer] {
+                if !visited.insert(neighbor) {
+                    continue;
+                }
+                let scored = Scored {
+                    similarity: self.similarity(query, neighbor),
+                    id: neighbor,
+                };
+                let worst = results.peek().map_or(f32::MIN, |r| r.0.similarity);
+                if results.len() < ef || scored.similarity > worst {
+                    candidates.push(scored);
+                    results.push(Reverse(scored));
+                    if results.len() > ef {
+                        results.pop();
+                    }
+                }
+            }
+        }
+
+        let mut sorted: Vec<Scored> = results.into_iter().map(|r| r.0).collect();
+        sorted.sort_by(|a, b| b.cmp(a));
+        sorted
+    }
+
+    /// Approximate `k` nearest neighbours of `query` as `(id, similarity)`.
+    pub fn search(&self, query: &[f32], k: usize, ef: usize) -> Vec<(usize, f32)> {
+        let Some(mut entry) = self.entry_point else {
+            return Vec::new();
+        };
+        if query.len() != self.dim {
+            return Vec::new();
+        }
+
+        let norm = query.iter().map(|v| v * v).sum::<f32>().sqrt();
+        if norm == 0.0 {
+            return Vec::new();
+        }
+        let query: Vec<f32> = query.iter().map(|v| v / norm).collect();
+
+        for l in (1..=self.max_layer).rev() {
+            entry = self.greedy_closest(&query, entry, l);
+        }
+
+        self.search_layer(&query, &[entry], ef.max(k), 0)
+            .into_iter()
+            .filter(|s| !self.deleted[s.id])
+            .take(k)
+            .map(|s| (s.id, s.similarity))
+            .collect()
+    }
+
+    /// All indexed nodes with similarity strictly above `threshold`.
+    ///
+    /// The beam is doubled until it returns at least one node below the
+    /// threshold, so the answer is not truncated by `ef_search`.
+    pub fn range_search(&self, query: &[f32], threshold: f32) -> Vec<(usize, f32)> {
+        let mut ef = self.params.ef_search.max(1);
+        loop {
+            let results = self.search(query, ef, ef);
+            let hits: Vec<(usize, f32)> = results
+                .iter()
+                .copied()
+                .filter(|&(_, similarity)| similarity > threshold)
+                .collect();
+            if hits.len() < results.len() || ef >= self.labels.len() {
+                return hits;
+            }
+            ef *= 2;
+        }
+    }
+}
+
+/// Per-user indexes kept alive across requests, keyed by user id and
+/// bounded by a byte budget with LRU eviction. An evicted index is rebuilt
+/// by the next merge that needs it.
+pub struct IndexRegistry {
+    indexes: Mutex<ByteLru<Arc<Mutex<HnswIndex>>>>,
+}
+
+impl IndexRegistry {
+    pub fn new(byte_budget: usize) -> Self {
+        Self {
+            indexes: Mutex::new(ByteLru::new(byte_budget)),
+        }
+    }
+
+    /// Budget from `CONCEPT_INDEX_BYTES` (default 256 MiB).
+    pub fn from_env() -> Self {
+        let byte_budget = std::env::var("CONCEPT_INDEX_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_REGISTRY_BYTES);
+        Self::new(byte_budget)
+    }
+
+    /// The user's index, created empty on first use. The width is fixed by
+    /// the first embeddings merged into it. Its size is re-counted against
+    /// the budget unless a merge is using it right now.
+    pub fn get(&self, user_id: &str) -> Arc<Mutex<HnswIndex>> {
+        let mut indexes = self.lock();
+        let index = match indexes.get(user_id) {
+            Some(index) => Arc::clone(index),
+            None => Arc::new(Mutex::new(HnswIndex::new(0, HnswParams::default()))),
+        };
+        let bytes = match index.try_lock() {
+            Ok(locked) => Some(locked.estimated_bytes()),
+            Err(_) => None,
+        };
+        match bytes {
+            Some(bytes) => indexes.insert(user_id, Arc::clone(&index), bytes),
+            None if indexes.peek_mut(user_id).is_none() => {
+                indexes.insert(user_id, Arc::clone(&index), std::mem::size_of::<HnswIndex>())
+            }
+            None => {}
+        }
+        index
+    }
+
+    /// Adds or replaces saved concepts in the user's index, if one is kept
+    /// and has their width. Indexes not kept are built by the next merge.
+    pub fn update<'a, I>(&self, user_id: &str, vectors: I)
+    where
+        I: IntoIterator<Item = (&'a str, &'a [f32])>,
+    {
+        let Some(index) = self.lock().peek_mut(user_id).map(|index| Arc::clone(index)) else {
+            return;
+        };
+        let bytes = {
+            let mut index = index.lock().unwrap_or_else(|e| e.into_inner());
+            if index.dim() == 0 {
+                return;
+            }
+            for (label, vector) in vectors {
+                index.insert(label, vector);
+            }
+            index.estimated_bytes()
+        };
+
+        let mut indexes = self.lock();
+        if indexes.peek_mut(user_id).is_some_and(|kept| Arc::ptr_eq(kept, &index)) {
+            indexes.insert(user_id, index, bytes);
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.lock().len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.lock().is_empty()
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, ByteLru<Arc<Mutex<HnswIndex>>>> {
+        self.indexes.lock().unwrap_or_else(|e| e.into_inner())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::collections::HashSet;
+
+    const DIM: usize = 128;
+
+    /// Feature-hashed bag of words plus bigrams; a cheap stand-in for model
+    /// embeddings that still has realistic near-duplicate structure.
+    fn hashed_embedding(text: &str) -> Vec<f32> {
+        let words: Vec<String> = text
+            .split(|c: char| !c.is_alphanumeric())
+            .filter(|w| w.len() > 2)
+            .map(|w| w.to_lowercase())
+            .collect();
+        let mut v = vec![0.0f32; DIM];
+        let mut add = |token: &str, weight: f32| {
+            let mut h: u64 = 0xcbf29ce484222325;
+            for b in token.bytes() {
+                h ^= b as u64;
+                h = h.wrapping_mul(0x100000001b3);
+            }
+            v[(h % DIM as u64) as usize] += weight;
+        };
+        for w in &words {
+            add(w, 1.0);
+        }
+        for pair in words.windows(2) {
+            add(&format!("{} {}", pair[0], pair[1]), 0.5);
+        }
+        v
+    }
+
+    /// Distinct non-empty lines of a mock, so index ids match positions.
+    /// Some mocks are Latin-1, so they are read as bytes and decoded lossily.
+    fn corpus(bytes: &[u8], limit: usize) -> Vec<(String, Vec<f32>)> {
+        let mut seen = HashSet::new();
+        String::from_utf8_lossy(bytes)
+            .lines()
+            .map(str::trim)
+            .filter(|l| !l.is_empty() && seen.insert(l.to_string()))
+            .map(|l| (l.to_string(), hashed_embedding(l)))
+            .filter(|(_, v)| v.iter().any(|&x| x != 0.0))
+            .take(limit)
+            .collect()
+    }
+
+    fn normalized(v: &[f32]) -> Vec<f32> {
+        let norm = v.iter().map(|x| x * x).sum::<f32>().sqrt();
+        v.iter().map(|x| x / norm).collect()
+    }
+
+    fn range_recall(items: &[(String, Vec<f32>)], threshold: f32) -> (usize, f32) {
+        let mut index = HnswIndex::new(DIM, HnswParams::default());
+        for (label, vector) in items {
+            index.insert(label, vector);
+        }
+
+        let unit: Vec<Vec<f32>> = items.iter().map(|(_, v)| normalized(v)).collect();
+        let mut exact = HashSet::new();
+        for i in 0..unit.len() {
+            for j in (i + 1)..unit.len() {
+                let s: f32 = unit[i].iter().zip(&unit[j]).map(|(a, b)| a * b).sum();
+                if s > threshold {
+                    exact.insert((i, j));
+                }
+            }
+        }
+
+        let mut found = HashSet::new();
+        for (i, (_, vector)) in items.iter().enumerate() {
+            for (j, _) in index.range_search(vector, threshold) {
+                if i != j {
+                    found.insert((i.min(j), i.max(j)));
+                }
+            }
+        }
+
+        let hit = exact.intersection(&found).count();
+        (exact.len(), hit as f32 / exact.len().max(1) as f32)
+    }
+
+    #[test]
+    fn test_range_recall_on_firefox_titles() {
+        let items = corpus(include_bytes!("../mocks/firefox.txt"), 1200);
+        let (pairs, recall) = range_recall(&items, 0.7);
+        assert!(pairs > 20, "too few ground-truth pairs: {}", pairs);
+        assert!(recall >= 0.95, "recall {} over {} pairs", recall, pairs);
+    }
+
+    #[test]
+    fn test_range_recall_on_mixed_corpora() {
+        let mut items = corpus(include_bytes!("../mocks/wine.txt"), 400);
+        items.extend(corpus(include_bytes!("../mocks/grail.txt"), 400));
+        items.extend(corpus(include_bytes!("../mocks/pirates.txt"), 400));
+        let mut seen = HashSet::new();
+        items.retain(|(label, _)| seen.insert(label.clone()));
+        let (pairs, recall) = range_recall(&items, 0.6);
+        assert!(pairs > 0);
+        assert!(recall >= 0.95, "recall {} over {} pairs", recall, pairs);
+    }
+
+    #[test]
+    fn test_search_finds_exact_match_first() {
+        let items = corpus(include_bytes!("../mocks/firefox.txt"), 500);
+        let mut index = HnswIndex::new(DIM, HnswParams::default());
+        for (label, vector) in &items {
+            index.insert(label, vector);
+        }
+        for (i, (_, vector)) in items.iter().enumerate().step_by(37) {
+            let top = index.search(vector, 1, 64);
+            assert!((top[0].1 - 1.0).abs() < 1e-4, "query {} got {:?}", i, top);
+        }
+    }
+
+    #[test]
+    fn test_rejects_wrong_width_and_handles_empty() {
+        let mut index = HnswIndex::new(4, HnswParams::default());
+        assert!(index.search(&[1.0, 0.0, 0.0, 0.0], 3, 10).is_empty());
+        assert_eq!(index.insert("bad", &[1.0, 0.0]), None);
+        assert_eq!(index.insert("a", &[1.0, 0.0, 0.0, 0.0]), Some(0));
+        assert_eq!(index.label(0), "a");
+        assert_eq!(index.insert("a", &[2.0, 0.0, 0.0, 0.0]), Some(0));
+        assert_eq!(index.len(), 1);
+        assert_eq!(index.range_search(&[1.0, 0.0, 0.0, 0.0], 0.5).len(), 1);
+    }
+
+    #[test]
+    fn test_reinserted_label_replaces_its_vector() {
+        let items = corpus(include_bytes!("../mocks/firefox.txt"), 200);
+        let mut index = HnswIndex::new(DIM, HnswParams::default());
+        for (label, vector) in &items {
+            index.insert(label, vector);
+        }
+
+        // Every label moves onto the vector of the next one, then the one after
+        for shift in 1..=2 {
+            for (i, (label, _)) in items.iter().enumerate() {
+                index.insert(label, &items[(i + shift) % items.len()].1);
+            }
+        }
+        assert_eq!(index.len(), items.len());
+        for (i, (label, _)) in items.iter().enumerate().step_by(17) {
+            let moved = &items[(i + 2) % items.len()].1;
+            let hits = index.range_search(moved, 0.999);
+            assert!(hits.iter().any(|&(id, _)| index.label(id) == label.as_str()), "{} not moved", label);
+            assert!(hits.iter().all(|&(id, _)| !index.deleted[id]));
+        }
+        // Replaced nodes were compacted away once they outnumbered live ones
+        assert!(index.labels.len() < items.len() * 2);
+    }
+
+    #[test]
+    fn test_registry_evicts_beyond_budget_and_updates_kept_indexes() {
+        let one = {
+            let mut index = HnswIndex::new(2, HnswParams::default());
+            index.insert("a", &[1.0, 0.0]);
+            index.estimated_bytes()
+        };
+        let registry = IndexRegistry::new(one * 2);
+        for user in ["u", "v"] {
+            // As a merge does on first use
+            let index = registry.get(user);
+            let mut index = index.lock().unwrap();
+            *index = HnswIndex::new(2, HnswParams::default());
+            index.insert("a", &[1.0, 0.0]).unwrap();
+        }
+        // Indexes are re-counted at their grown size, evicting the oldest
+        registry.get("u");
+        registry.get("v");
+        registry.get("w");
+        assert!(registry.len() <= 2);
+
+        let kept = registry.get("v");
+        registry.update("v", [("b", &[0.0, 1.0][..]), ("a", &[0.0, 1.0][..])]);
+        let kept = kept.lock().unwrap();
+        assert_eq!(kept.len(), 2);
+        assert_eq!(kept.range_search(&[0.0, 1.0], 0.9).len(), 2);
+
+        // Users without a kept index are left to the next merge
+        registry.update("x", [("a", &[1.0, 0.0][..])]);
+        assert!(registry.lock().peek_mut("x").is_none());
+    }
+}
@@ -0,0 +1,1691 @@
+pub mod cache;
+pub mod dendrogram;
+pub mod edges;
+pub mod executor;
+pub mod graph;
+pub mod hnsw;
+pub mod multilevel;
+pub mod octree;
+pub mod pca;
+pub mod regroup;
+pub mod schedule;
+pub mod similarity;
+pub mod soa;
+
+use crate::error::ApiError;
+use crate::models::concepts::Concept;
+use crate::models::embeddings::Embedding;
+use log::info;
+use ndarray::Array2;
+use cache::LayoutCache;
+use dendrogram::Dendrogram;
+use executor::CancelFlag;
+use graph::{SimilarityGraph, TopKBuilder};
+use hnsw::{HnswIndex, HnswParams};
+use multilevel::Hierarchy;
+use octree::Octree;
+use regroup::Regrouping;
+use schedule::ActiveSet;
+use soa::{PhysicsBuffers, SoaPositions};
+use rayon::prelude::*;
+use rayon::ThreadPool;
+use serde::{Deserialize, Serialize};
+use std::collections::HashMap;
+use std::sync::atomic::Ordering;
+use std::sync::{Arc, Mutex};
+
+/// Layout positions from a previous run, keyed by concept text.
+pub type PreviousPositions = HashMap<String, [f32; 3]>;
+
+#[derive(Debug, Clone, Serialize, Deserialize)]
+pub struct ConceptGroup {
+    pub concepts: Vec<String>,
+    pub reduced_embedding: Vec<f32>,
+    pub connections: Vec<usize>,
+    /// Similarity of each entry of `connections`. Not part of list responses,
+    /// which strip it; compact responses carry it as edge weights.
+    #[serde(default, skip_serializing_if = "Vec::is_empty")]
+    pub connection_weights: Vec<f32>,
+    pub importance_score: f32,
+    pub group_id: usize,
+}
+
+/// Solver used for the PCA that seeds a full layout.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum PcaSolver {
+    /// Randomized truncated SVD computing only the top 3 components.
+    Randomized,
+    /// Full `linfa_reduction::Pca` fit.
+    Linfa,
+}
+
+/// How universal repulsion is computed during the force-directed layout.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum RepulsionMode {
+    /// All-pairs O(n²) repulsion.
+    Exact,
+    /// Barnes–Hut octree approximation, O(n log n) per iteration.
+    BarnesHut,
+    /// Exact below `barnes_hut_threshold` nodes, Barnes–Hut at or above it.
+    Auto,
+}
+
+/// Memory layout used by the physics step.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum PhysicsKernel {
+    /// Double-buffered x/y/z columns with a chunked, auto-vectorized
+    /// repulsion loop.
+    Soa,
+    /// Original `[f32; 3]` per node path, kept as a reference for tests and
+    /// benchmarks.
+    Aos,
+}
+
+/// How a full (not warm-started) layout is computed.
+#[derive(Debug, Clone, Copy, PartialEq)]
+pub enum LayoutEngine {
+    /// PCA seed followed by `iterations` steps over all nodes.
+    Flat,
+    /// Lay out a coarsened graph, then prolong and refine level by level.
+    Multilevel,
+    /// Flat below `multilevel_threshold` nodes, multilevel at or above it.
+    Auto,
+}
+
+/// Importance of a group from its members' NLP importances, its number of
+/// connections and its size.
+fn importance_score(importances: &[f32], connection_count: usize, concept_count: usize) -> f32 {
+    let avg_nlp_importance = if importances.is_empty() {
+        0.5
+    } else {
+        importances.iter().sum::<f32>() / importances.len() as f32
+    };
+
+    (avg_nlp_importance * 0.4 + connection_count as f32 * 0.4 + concept_count as f32 * 0.2).max(0.1)
+}
+
+/// Upper bound on coarsening levels for the multilevel layout.
+const MAX_LEVELS: usize = 32;
+
+#[derive(Debug, Clone)]
+pub struct ForceParams {
+    pub attraction_strength: f32,
+    pub repulsion_strength: f32,
+    pub center_gravity: f32,
+    pub damping: f32,
+    pub min_distance: f32,
+    pub max_velocity: f32,
+    pub iterations: usize,
+    pub similarity_threshold: f32,
+    pub repulsion_mode: RepulsionMode,
+    /// Opening angle: cells with `width / distance < theta` are approximated.
+    pub barnes_hut_theta: f32,
+    /// Node count at which `RepulsionMode::Auto` switches to Barnes–Hut.
+    pub barnes_hut_threshold: usize,
+    /// Max strongest neighbours each node keeps in the sparse similarity graph.
+    pub max_neighbors: usize,
+    /// Similarities at or below this are not attraction edges.
+    pub similarity_floor: f32,
+    /// Iterations of local relaxation when warm-starting from previous positions.
+    pub warm_start_iterations: usize,
+    /// Above this fraction of unseen nodes a full layout is run instead.
+    pub warm_start_max_new_fraction: f32,
+    pub pca_solver: PcaSolver,
+    /// Concept count at which merge candidates come from an HNSW index
+    /// instead of the all-pairs similarity scan.
+    pub hnsw_merge_threshold: usize,
+    pub layout_engine: LayoutEngine,
+    /// Node count at which `LayoutEngine::Auto` switches to multilevel.
+    pub multilevel_threshold: usize,
+    /// Coarsening stops once a level has at most this many nodes.
+    pub multilevel_coarsest_size: usize,
+    /// Refinement iterations on each level finer than the coarsest.
+    pub multilevel_refine_iterations: usize,
+    pub physics_kernel: PhysicsKernel,
+    /// Nodes moving slower than this per step are frozen once settled;
+    /// 0 disables freezing. Only the SoA kernel freezes nodes.
+    pub freeze_speed: f32,
+    /// Consecutive slow steps before a node is frozen.
+    pub freeze_after: usize,
+    /// A frozen node wakes when a graph neighbour moves farther than this in a step.
+    pub wake_distance: f32,
+    /// Merges are recorded in the dendrogram down to this similarity (or
+    /// `similarity_threshold` if lower), the lowest threshold a finished
+    /// layout can be re-grouped at.
+    pub dendrogram_floor: f32,
+    /// Strongest graph neighbours listed as a group's connections; 0 lists all.
+    pub max_connections: usize,
+}
+
+impl Default for ForceParams {
+    fn default() -> Self {
+        Self {
+            attraction_strength: 2.0,
+            repulsion_strength: 10.0,
+            center_gravity: 0.1,
+            damping: 0.9,
+            min_distance: 3.0,
+            max_velocity: 2.0,
+            iterations: 150,
+            similarity_threshold: 0.7,
+            repulsion_mode: RepulsionMode::Auto,
+            barnes_hut_theta: 0.8,
+            barnes_hut_threshold: 500,
+            max_neighbors: 16,
+            similarity_floor: 0.0,
+            warm_start_iterations: 30,
+            warm_start_max_new_fraction: 0.5,
+            pca_solver: PcaSolver::Randomized,
+            hnsw_merge_threshold: 2000,
+            layout_engine: LayoutEngine::Auto,
+            multilevel_threshold: 5000,
+            multilevel_coarsest_size: 200,
+            multilevel_refine_iterations: 25,
+            physics_kernel: PhysicsKernel::Soa,
+            freeze_speed: 0.01,
+            freeze_after: 5,
+            wake_distance: 0.05,
+            dendrogram_floor: 0.5,
+            max_connections: 16,
+        }
+    }
+}
+
+pub struct MindMapProcessor {
+    force_params: ForceParams,
+    similarity_graph: SimilarityGraph,
+    positions: Vec<[f32; 3]>,
+    concept_groups: Vec<ConceptGroup>,
+    /// Shared pool that parallelizes the physics step; serial without one.
+    thread_pool: Option<Arc<ThreadPool>>,
+    /// Nodes moved by the physics step; the rest stay pinned.
+    active_nodes: Vec<usize>,
+    previous_positions: PreviousPositions,
+    /// Persistent per-user index used for merge candidates, if any.
+    concept_index: Option<Arc<Mutex<HnswIndex>>>,
+    cancel: Option<CancelFlag>,
+    /// Result cache and the embedding model id that is part of its keys.
+    layout_cache: Option<(Arc<LayoutCache>, String)>,
+    /// Sum of active nodes over all physics steps of the last layout.
+    node_iterations: usize,
+    /// Dendrogram and layout of the last processed concept set.
+    regrouping: Option<Arc<Regrouping>>,
+}
+
+impl MindMapProcessor {
+    pub fn new(force_params: Option<ForceParams>) -> Self {
+        Self {
+            force_params: force_params.unwrap_or_default(),
+            similarity_graph: SimilarityGraph::default(),
+            positions: Vec::new(),
+            concept_groups: Vec::new(),
+            thread_pool: None,
+            active_nodes: Vec::new(),
+            previous_positions: PreviousPositions::new(),
+            concept_index: None,
+            cancel: None,
+            layout_cache: None,
+            node_iterations: 0,
+            regrouping: None,
+        }
+    }
+
+    /// Runs the physics step on `pool`, shared by all layouts, instead of serially.
+    pub fn with_thread_pool(mut self, pool: Arc<ThreadPool>) -> Self {
+        self.thread_pool = Some(pool);
+        self
+    }
+
+    /// Seeds the layout with positions from a previous run so only new
+    /// concepts and their neighbourhood are relaxed.
+    pub fn with_previous_positions(mut self, positions: PreviousPositions) -> Self {
+        self.previous_positions = positions;
+        self
+    }
+
+    /// Finds merge candidates through a persistent HNSW index, adding any
+    /// concepts it has not seen yet, instead of scanning all pairs. Only used
+    /// at `hnsw_merge_threshold` concepts and above.
+    pub fn with_concept_index(mut self, index: Arc<Mutex<HnswIndex>>) -> Self {
+        self.concept_index = Some(index);
+        self
+    }
+
+    /// Stops processing with `ApiError::LayoutCancelled` once `flag` is raised.
+    /// Checked between pipeline stages and between layout iterations.
+    pub fn with_cancellation(mut self, flag: CancelFlag) -> Self {
+        self.cancel = Some(flag);
+        self
+    }
+
+    /// Returns stored results for concept sets already laid out with the same
+    /// embedding model and parameters, and stores new ones.
+    pub fn with_layout_cache(mut self, cache: Arc<LayoutCache>, model_id: &str) -> Self {
+        self.layout_cache = Some((cache, model_id.to_string()));
+        self
+    }
+
+    fn check_cancelled(&self) -> Result<(), ApiError> {
+        match &self.cancel {
+            Some(flag) if flag.load(Ordering::Relaxed) => Err(ApiError::LayoutCancelled),
+            _ => Ok(()),
+        }
+    }
+
+    /// Concepts whose position differs from the previous run (or is new),
+    /// i.e. what needs persisting after `process_concepts`.
+    pub fn moved_concepts(&self) -> Vec<(String, [f32; 3])> {
+        let mut moved = Vec::new();
+        for group in &self.concept_groups {
+            let position = [
+                group.reduced_embedding[0],
+                group.reduced_embedding[1],
+                group.reduced_embedding[2],
+            ];
+            for concept in &group.concepts {
+                if self.previous_positions.get(concept) != Some(&position) {
+                    moved.push((concept.clone(), position));
+                }
+            }
+        }
+        moved
+    }
+
+    /// Runs `steps` physics iterations from `positions` over `graph`, without
+    /// PCA initialization or convergence checks. Lets benchmarks time the
+    /// layout in isolation.
+    pub fn relax(
+        &mut self,
+        positions: &[[f32; 3]],
+        graph: &SimilarityGraph,
+        steps: usize,
+    ) -> Vec<[f32; 3]> {
+        self.positions = positions.to_vec();
+        self.similarity_graph = graph.clone();
+        self.active_nodes = (0..positions.len()).collect();
+        let mut buffers = self.physics_buffers();
+        for _ in 0..steps {
+            self.physics_step(buffers.as_mut());
+        }
+        self.finish_steps(buffers);
+        self.positions.clone()
+    }
+
+    pub fn process_concepts(
+        &mut self,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+    ) -> Result<Vec<ConceptGroup>, ApiError> {
+        let Some((cache, model_id)) = self.layout_cache.clone() else {
+            return self.compute_layout(concepts, embeddings);
+        };
+
+        let key = LayoutCache::key(
+            concepts,
+            &self.previous_positions,
+            &model_id,
+            &self.force_params,
+        );
+        if let Some(cached) = cache.get(&key) {
+            info!("Layout cache hit for {} concepts", concepts.len());
+            self.concept_groups = cached.groups.as_ref().clone();
+            self.regrouping = match cached.regrouping {
+                Some(regrouping) => Some(regrouping),
+                // Disk entries keep only the groups; redo the merge for re-grouping
+                None => match self.merge_dendrogram(concepts, embeddings) {
+                    Ok(dendrogram) => self.regrouping_for(concepts, dendrogram),
+                    Err(_) => None,
+                },
+            };
+            return Ok(self.concept_groups.clone());
+        }
+
+        let groups = self.compute_layout(concepts, embeddings)?;
+        cache.insert(&key, groups.clone(), self.regrouping.clone());
+        Ok(groups)
+    }
+
+    fn compute_layout(
+        &mut self,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+    ) -> Result<Vec<ConceptGroup>, ApiError> {
+        info!(
+            "Starting mind map processing for {} concepts",
+            concepts.len()
+        );
+
+        // Step 1: Merge similar concepts
+        let dendrogram = self.merge_dendrogram(concepts, embeddings)?;
+        let merged_groups = self.merged_groups(concepts, embeddings, &dendrogram);
+        self.check_cancelled()?;
+
+        // Step 2: Extract merged embeddings for processing
+        let merged_embeddings: Vec<Embedding> = merged_groups
+            .iter()
+            .map(|(_, embedding, _, _)| embedding.clone())
+            .collect();
+
+        // Step 3: Normalize once; the graph and PCA both work on this block
+        let normalized = similarity::normalize_rows(merged_embeddings.iter().map(|e| e.view()))?;
+
+        // Step 4: Build sparse top-k similarity graph
+        self.build_similarity_graph(&normalized);
+        self.check_cancelled()?;
+
+        // Step 5: Run force-directed layout, warm-started from previous positions if any
+        let seeds = self.seed_positions(&merged_groups);
+        self.run_force_directed_layout(&normalized, &seeds)?;
+
+        // Step 6: Build final concept groups
+        self.build_concept_groups(&merged_groups);
+        self.regrouping = self.regrouping_for(concepts, dendrogram);
+
+        Ok(self.concept_groups.clone())
+    }
+
+    /// Groups concepts whose embeddings are above `similarity_threshold`.
+    /// Each group is `(concepts, mean embedding, importances, root index)`.
+    pub fn merge_similar_concepts(
+        &self,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+    ) -> Result<Vec<(Vec<String>, Embedding, Vec<f32>, usize)>, ApiError> {
+        let dendrogram = self.merge_dendrogram(concepts, embeddings)?;
+        Ok(self.merged_groups(concepts, embeddings, &dendrogram))
+    }
+
+    /// The dendrogram and layout of the last processed concept set, for
+    /// re-grouping at other merge thresholds.
+    pub fn take_regrouping(&mut self) -> Option<Arc<Regrouping>> {
+        self.regrouping.take()
+    }
+
+    /// Lowest similarity the merge graph keeps.
+    fn merge_floor(&self) -> f32 {
+        self.force_params
+            .similarity_threshold
+            .min(self.force_params.dendrogram_floor)
+    }
+
+    fn regrouping_for(
+        &self,
+        concepts: &[Concept],
+        dendrogram: Dendrogram,
+    ) -> Option<Arc<Regrouping>> {
+        let regrouping =
+            Regrouping::new(concepts, dendrogram, self.merge_floor(), &self.concept_groups);
+        if regrouping.is_none() {
+            log::warn!("Concept groups do not cover all concepts, re-grouping disabled");
+        }
+        regrouping.map(Arc::new)
+    }
+
+    /// Single-linkage dendrogram of `concepts` over merge candidates down to
+    /// `merge_floor`.
+    fn merge_dendrogram(
+        &self,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+    ) -> Result<Dendrogram, ApiError> {
+        if concepts.is_empty() || embeddings.is_empty() {
+            return Err(ApiError::InternalError(
+                "Empty concepts or embeddings".to_string(),
+            ));
+        }
+
+        if concepts.len() != embeddings.len() {
+            return Err(ApiError::InternalError(format!(
+                "Concepts length ({}) does not match embeddings length ({})",
+                concepts.len(),
+                embeddings.len()
+            )));
+        }
+
+        // Check for zero-dimensional embeddings
+        for (i, embedding) in embeddings.iter().enumerate() {
+            if embedding.len() == 0 {
+                log::error!("Embedding {} has zero dimensions for concept: '{}'", 
+                           i, concepts[i].concept);
+                return Err(ApiError::InternalError(format!(
+                    "Embedding {} has zero dimensions", i
+                )));
+            }
+        }
+
+        // Log embedding dimensions for debugging
+        let dimensions: Vec<usize> = embeddings.iter().map(|e| e.len()).collect();
+        let unique_dims: std::collections::HashSet<usize> = dimensions.iter().cloned().collect();
+        info!("Embedding dimensions: {} unique dimensions found: {:?}", 
+              unique_dims.len(), unique_dims);
+        
+        if unique_dims.len() > 1 {
+            log::warn!("Inconsistent embedding dimensions detected");
+            for (i, &dim) in dimensions.iter().enumerate() {
+                if dim != embeddings[0].len() {
+                    log::warn!("Embedding {} has {} dimensions, expected {}", 
+                              i, dim, embeddings[0].len());
+                }
+            }
+        }
+
+        // Only pairs above the dendrogram floor matter, so keep just those top-k edges
+        let normalized = similarity::normalize_rows(embeddings.iter().map(|e| e.view()))?;
+        // Small sets are merged exactly even when a persistent index is kept
+        let merge_graph = match &self.concept_index {
+            _ if concepts.len() < self.force_params.hnsw_merge_threshold => {
+                self.top_k_graph(&normalized, self.merge_floor())
+            }
+            Some(index) => {
+                let mut index = index.lock().unwrap_or_else(|e| e.into_inner());
+                self.merge_graph_from_index(&mut index, concepts, &normalized)
+            }
+            None => {
+                let mut index = HnswIndex::new(normalized.ncols(), HnswParams::default());
+                self.merge_graph_from_index(&mut index, concepts, &normalized)
+            }
+        };
+
+        Ok(Dendrogram::from_graph(&merge_graph))
+    }
+
+    /// Merged groups for the dendrogram cut at `similarity_threshold`, in
+    /// order of their lowest concept index, which is also their root.
+    fn merged_groups(
+        &self,
+        concepts: &[Concept],
+        embeddings: &[Embedding],
+        dendrogram: &Dendrogram,
+    ) -> Vec<(Vec<String>, Embedding, Vec<f32>, usize)> {
+        let labels = dendrogram.cut(self.force_params.similarity_threshold);
+        let mut groups: Vec<Vec<usize>> = Vec::new();
+        for (i, &label) in labels.iter().enumerate() {
+            if label == groups.len() {
+                groups.push(Vec::new());
+            }
+            groups[label].push(i);
+        }
+
+        let mut merged_groups = Vec::new();
+        for indices in &groups {
+            let group_concepts: Vec<String> = indices
+                .iter()
+                .map(|&idx| concepts[idx].concept.clone())
+                .collect();
+
+            let group_importances: Vec<f32> = indices
+                .iter()
+                .map(|&idx| concepts[idx].importance)
+                .collect();
+
+            // Average embeddings
+            let mut avg_embedding = embeddings[indices[0]].clone();
+            if indices.len() > 1 {
+                avg_embedding.fill(0.0);
+                for &idx in indices {
+                    avg_embedding += &embeddings[idx];
+                }
+                avg_embedding /= indices.len() as f32;
+            }
+
+            merged_groups.push((group_concepts, avg_embedding, group_importances, indices[0]));
+        }
+
+        info!(
+            "Merged {} concepts into {} groups",
+            concepts.len(),
+            merged_groups.len()
+        );
+
+        merged_groups
+    }
+
+    /// Merge edges from HNSW range queries. Concepts missing from `index` are
+    /// inserted first; candidate similarities are recomputed from `normalized`
+    /// so the floor is applied exactly.
+    fn merge_graph_from_index(
+        &self,
+        index: &mut HnswIndex,
+        concepts: &[Concept],
+        normalized: &Array2<f32>,
+    ) -> SimilarityGraph {
+        let floor = self.merge_floor();
+
+        if index.dim() != normalized.ncols() {
+            if !index.is_empty() {
+                log::warn!(
+                    "Concept index width {} does not match embeddings ({}), rebuilding",
+                    index.dim(),
+                    normalized.ncols()
+                );
+            }
+            *index = HnswIndex::new(normalized.ncols(), HnswParams::default());
+        }
+
+        // Index ids map back to every slice position carrying that concept text
+        let mut positions: HashMap<usize, Vec<usize>> = HashMap::new();
+        for (i, concept) in concepts.iter().enumerate() {
+            if let Some(row) = normalized.row(i).as_slice() {
+                if let Some(id) = index.insert(&concept.concept, row) {
+                    positions.entry(id).or_default().push(i);
+                }
+            }
+        }
+
+        let mut builder =
+            TopKBuilder::new(normalized.nrows(), self.force_params.max_neighbors, floor);
+        for i in 0..concepts.len() {
+            let Some(query) = normalized.row(i).as_slice() else {
+                continue;
+            };
+            for (id, _) in index.range_search(query, floor) {
+                for &j in positions.get(&id).into_iter().flatten() {
+                    if i < j {
+                        builder.offer(i, j, normalized.row(i).dot(&normalized.row(j)));
+                    }
+                }
+            }
+        }
+
+        info!(
+            "Merge candidates from HNSW index over {} concepts",
+            index.len()
+        );
+        builder.build()
+    }
+
+    fn top_k_graph(&self, normalized: &Array2<f32>, floor: f32) -> SimilarityGraph {
+        let mut builder =
+            TopKBuilder::new(normalized.nrows(), self.force_params.max_neighbors, floor);
+        similarity::for_each_pair(normalized, |i, j, sim| builder.offer(i, j, sim));
+        builder.build()
+    }
+
+    fn build_similarity_graph(&mut self, normalized: &Array2<f32>) {
+        // Continuous similarities above the floor are kept as edge weights,
+        // preserving gradient information for the force-directed layout
+        self.similarity_graph = self.top_k_graph(normalized, self.force_params.similarity_floor);
+
+        info!(
+            "Similarity graph: {} nodes, {} edges (k = {})",
+            self.similarity_graph.len(),
+            self.similarity_graph.edge_count(),
+            self.force_params.max_neighbors
+        );
+    }
+
+    /// Previous position of each merged group: the mean over its members that
+    /// were placed before, or `None` for groups made only of new concepts.
+    fn seed_positions(
+        &self,
+        merged_groups: &[(Vec<String>, Embedding, Vec<f32>, usize)],
+    ) -> Vec<Option<[f32; 3]>> {
+        merged_groups
+            .iter()
+            .map(|(concepts, _, _, _)| {
+                let known: Vec<&[f32; 3]> = concepts
+                    .iter()
+                    .filter_map(|c| self.previous_positions.get(c))
+                    .collect();
+                if known.is_empty() {
+                    return None;
+                }
+                let mut mean = [0.0f32; 3];
+                for p in &known {
+                    mean = self.add_vectors(mean, **p);
+                }
+                Some(self.scale_vector(mean, 1.0 / known.len() as f32))
+            })
+            .collect()
+    }
+
+    fn run_force_directed_layout(
+        &mut self,
+        normalized: &Array2<f32>,
+        seeds: &[Option<[f32; 3]>],
+    ) -> Result<(), ApiError> {
+        let n = normalized.nrows();
+        if n == 0 {
+            return Err(ApiError::InternalError("No concepts to layout".to_string()));
+        }
+
+        let known = seeds.iter().filter(|s| s.is_some()).count();
+        let new_fraction = (n - known) as f32 / n as f32;
+
+        self.node_iterations = 0;
+        if known == 0 || new_fraction > self.force_params.warm_start_max_new_fraction {
+            if self.uses_multilevel(n) {
+                self.run_multilevel_layout(normalized)?;
+            } else {
+                // Use PCA to initialize positions from embedding space (deterministic)
+                self.positions = self.initialize_pca_positions(normalized)?;
+                self.check_cancelled()?;
+                self.active_nodes = (0..n).collect();
+                self.iterate(self.force_params.iterations)?;
+            }
+        } else {
+            self.positions = self.place_new_nodes(seeds);
+            self.active_nodes = self.affected_neighbourhood(seeds);
+            info!(
+                "Warm start: {} known nodes, {} new, relaxing {} nodes",
+                known,
+                n - known,
+                self.active_nodes.len()
+            );
+            self.iterate(self.force_params.warm_start_iterations)?;
+        }
+
+        info!(
+            "Layout of {} nodes took {} node-iterations",
+            n, self.node_iterations
+        );
+        Ok(())
+    }
+
+    fn uses_multilevel(&self, n: usize) -> bool {
+        match self.force_params.layout_engine {
+            LayoutEngine::Flat => false,
+            LayoutEngine::Multilevel => true,
+            LayoutEngine::Auto => n >= self.force_params.multilevel_threshold,
+        }
+    }
+
+    /// Coarsens the similarity graph, lays out the coarsest level from the PCA
+    /// of its mean embeddings, then prolongs each level onto the next finer one
+    /// and refines it with a few iterations.
+    fn run_multilevel_layout(&mut self, normalized: &Array2<f32>) -> Result<(), ApiError> {
+        let hierarchy = Hierarchy::build(
+            std::mem::take(&mut self.similarity_graph),
+            self.force_params.max_neighbors,
+            self.force_params.multilevel_coarsest_size,
+            MAX_LEVELS,
+        );
+        let coarsest = hierarchy.depth() - 1;
+        let sizes: Vec<usize> = (0..hierarchy.depth()).map(|l| hierarchy.len_at(l)).collect();
+        info!("Multilevel layout: {} levels, sizes {:?}", hierarchy.depth(), sizes);
+
+        let membership = hierarchy.coarsest_membership();
+        let mut coarse_embeddings = Array2::<f32>::zeros((sizes[coarsest], normalized.ncols()));
+        for (i, &c) in membership.iter().enumerate() {
+            let mut row = coarse_embeddings.row_mut(c);
+            row += &normalized.row(i);
+        }
+        let coarse_embeddings = similarity::normalize_rows(coarse_embeddings.rows())?;
+        self.positions = self.initialize_pca_positions(&coarse_embeddings)?;
+        self.check_cancelled()?;
+
+        let (graphs, parents) = hierarchy.into_parts();
+        for (level, graph) in graphs.into_iter().enumerate().rev() {
+            if level < coarsest {
+                self.positions = self.prolong(&parents[level]);
+            }
+            self.similarity_graph = graph;
+            self.active_nodes = (0..self.positions.len()).collect();
+
+            let iterations = if level == coarsest {
+                self.force_params.iterations
+            } else {
+                self.force_params.multilevel_refine_iterations
+            };
+            self.iterate(iterations)?;
+        }
+
+        Ok(())
+    }
+
+    /// Places every fine node on its coarse parent; siblings after the first
+    /// get a small deterministic offset so they do not start coincident.
+    fn prolong(&self, parent: &[usize]) -> Vec<[f32; 3]> {
+        let mut placed = vec![0usize; self.positions.len()];
+        parent
+            .iter()
+            .enumerate()
+            .map(|(i, &p)| {
+                let rank = placed[p];
+                placed[p] += 1;
+                if rank == 0 {
+                    return self.positions[p];
+                }
+                let angle = i as f32 * 2.399_963;
+                let offset = [angle.cos(), angle.sin(), ((i % 7) as f32 - 3.0) / 3.0];
+                self.add_scaled(self.positions[p], offset, self.force_params.min_distance * 0.25)
+            })
+            .collect()
+    }
+
+    fn iterate(&mut self, iterations: usize) -> Result<(), ApiError> {
+        let convergence_threshold = 0.001;
+        let mut buffers = self.physics_buffers();
+        let eligible = self.active_nodes.clone();
+        let mut active_set = buffers.as_ref().map(|b| {
+            ActiveSet::new(
+                &b.active,
+                self.force_params.freeze_speed,
+                self.force_params.freeze_after,
+                self.force_params.wake_distance,
+            )
+        });
+        let start_node_iterations = self.node_iterations;
+        let mut steps = 0;
+
+        for iteration in 0..iterations {
+            if let Err(e) = self.check_cancelled() {
+                info!("Force layout cancelled at iteration {}", iteration);
+                self.active_nodes = eligible;
+                return Err(e);
+            }
+
+            let total_energy = self.physics_step(buffers.as_mut());
+            self.node_iterations += self.active_nodes.len();
+            steps += 1;
+
+            // Frozen nodes stay in place but still exert forces
+            if let (Some(b), Some(set)) = (buffers.as_mut(), active_set.as_mut()) {
+                if set.update(&b.energy, &mut b.active, &self.similarity_graph) {
+                    self.active_nodes = (0..b.active.len()).filter(|&i| b.active[i]).collect();
+                }
+            }
+
+            if iteration % 50 == 0 {
+                info!(
+                    "Force-directed iteration: {}/{} (energy: {:.4})",
+                    iteration, iterations, total_energy
+                );
+            }
+
+            // Early termination if system has converged
+            if total_energy < convergence_threshold {
+                info!(
+                    "Force layout converged at iteration {} (energy: {:.6})",
+                    iteration, total_energy
+                );
+                break;
+            }
+        }
+
+        if let Some(set) = &active_set {
+            info!(
+                "Active set: {} of {} nodes still moving after {} steps \
+                 ({} freezes, {} wakes, {} node-iterations)",
+                self.active_nodes.len(),
+                eligible.len(),
+                steps,
+                set.freezes,
+                set.wakes,
+                self.node_iterations - start_node_iterations
+            );
+        }
+
+        self.active_nodes = eligible;
+        self.finish_steps(buffers);
+        Ok(())
+    }
+
+    /// Keeps seeded nodes where they were and places each new node at the
+    /// similarity-weighted mean of its already-placed neighbours.
+    fn place_new_nodes(&self, seeds: &[Option<[f32; 3]>]) -> Vec<[f32; 3]> {
+        let mut centroid = [0.0f32; 3];
+        let mut known = 0usize;
+        for seed in seeds.iter().flatten() {
+            centroid = self.add_vectors(centroid, *seed);
+            known += 1;
+        }
+        if known > 0 {
+            centroid = self.scale_vector(centroid, 1.0 / known as f32);
+        }
+
+        seeds
+            .iter()
+            .enumerate()
+            .map(|(i, seed)| {
+                if let Some(position) = seed {
+                    return *position;
+                }
+
+                let mut weighted = [0.0f32; 3];
+                let mut total_weight = 0.0f32;
+                for (j, similarity) in self.similarity_graph.neighbors(i) {
+                    if let Some(neighbor) = seeds[j] {
+                        weighted = self.add_scaled(weighted, neighbor, similarity);
+                        total_weight += similarity;
+                    }
+                }
+                let anchor = if total_weight > 0.0 {
+                    self.scale_vector(weighted, 1.0 / total_weight)
+                } else {
+                    centroid
+                };
+
+                // Deterministic golden-angle offset so new nodes sharing an
+                // anchor do not start on top of each other
+                let angle = i as f32 * 2.399_963;
+                let offset = [angle.cos(), angle.sin(), ((i % 7) as f32 - 3.0) / 3.0];
+                self.add_scaled(anchor, offset, self.force_params.max_velocity * 0.5)
+            })
+            .collect()
+    }
+
+    /// New nodes plus their direct graph neighbours, in ascending order.
+    fn affected_neighbourhood(&self, seeds: &[Option<[f32; 3]>]) -> Vec<usize> {
+        let mut affected = vec![false; seeds.len()];
+        for (i, seed) in seeds.iter().enumerate() {
+            if seed.is_none() {
+                affected[i] = true;
+                for (j, _) in self.similarity_graph.neighbors(i) {
+                    affected[j] = true;
+                }
+            }
+        }
+        (0..seeds.len()).filter(|&i| affected[i]).collect()
+    }
+
+    fn build_concept_groups(
+        &mut self,
+        merged_groups: &[(Vec<String>, Embedding, Vec<f32>, usize)],
+    ) {
+        self.concept_groups.clear();
+
+        info!("Building concept groups: {} merged groups, {} positions",
+              merged_groups.len(), self.positions.len());
+
+        // Remap root IDs to compact sequential group IDs
+        let unique_roots: Vec<usize> = {
+            let mut roots: Vec<usize> = merged_groups.iter().map(|(_, _, _, root)| *root).collect();
+            roots.sort();
+            roots.dedup();
+            roots
+        };
+
+        for (i, (concepts, _, importances, root)) in merged_groups.iter().enumerate() {
+            if i >= self.positions.len() {
+                log::error!("Position index {} out of bounds for positions array of length {}",
+                           i, self.positions.len());
+                continue;
+            }
+
+            let (connections, connection_weights) = self.find_connections(i).into_iter().unzip();
+            let importance_score = self.calculate_importance(i, concepts, importances);
+            let group_id = unique_roots.iter().position(|r| r == root).unwrap_or(0);
+
+            self.concept_groups.push(ConceptGroup {
+                concepts: concepts.clone(),
+                reduced_embedding: self.positions[i].to_vec(),
+                connections,
+                connection_weights,
+                importance_score,
+                group_id,
+            });
+        }
+
+        info!("Successfully built {} concept groups", self.concept_groups.len());
+    }
+
+    /// The `max_connections` most similar graph neighbours of `index`, in
+    /// index order, with their similarities.
+    fn find_connections(&self, index: usize) -> Vec<(usize, f32)> {
+        let mut neighbors: Vec<(usize, f32)> = self.similarity_graph.neighbors(index).collect();
+        let k = self.force_params.max_connections;
+        if k > 0 && neighbors.len() > k {
+            // Partial selection: only the k strongest need to be found, not ordered
+            neighbors.select_nth_unstable_by(k - 1, |a, b| {
+                b.1.total_cmp(&a.1).then_with(|| a.0.cmp(&b.0))
+            });
+            neighbors.truncate(k);
+            neighbors.sort_unstable_by_key(|&(j, _)| j);
+        }
+        neighbors
+    }
+
+    fn calculate_importance(&self, index: usize, concepts: &[String], importances: &[f32]) -> f32 {
+        importance_score(importances, self.similarity_graph.degree(index), concepts.len())
+    }
+
+    // Physics helper methods
+    fn initialize_pca_positions(&self, normalized: &Array2<f32>) -> Result<Vec<[f32; 3]>, ApiError> {
+        let n = normalized.nrows();
+        if n == 0 {
+            return Err(ApiError::InternalError("No embeddings for PCA".to_string()));
+        }
+
+        // Handle degenerate case: 1-2 embeddings can't do meaningful PCA
+        if n <= 2 {
+            let mut positions = Vec::with_capacity(n);
+            for i in 0..n {
+                positions.push([(i as f32) * 3.0 - 1.5, 0.0, 0.0]);
+            }
+            return Ok(positions);
+        }
+
+        // PCA to 3 components
+        let projected = match self.force_params.pca_solver {
+            PcaSolver::Randomized => pca::randomized_pca(normalized, 3)?,
+            PcaSolver::Linfa => pca::linfa_pca(normalized, 3)?,
+        };
+
+        // Scale to [-5, 5] range
+        let mut min_vals = [f32::MAX; 3];
+        let mut max_vals = [f32::MIN; 3];
+        for row in projected.rows() {
+            for (d, &val) in row.iter().enumerate() {
+                if d < 3 {
+                    min_vals[d] = min_vals[d].min(val);
+                    max_vals[d] = max_vals[d].max(val);
+                }
+            }
+        }
+
+        let positions: Vec<[f32; 3]> = projected
+            .rows()
+            .into_iter()
+            .map(|row| {
+                let mut pos = [0.0f32; 3];
+                for d in 0..3 {
+                    let range = max_vals[d] - min_vals[d];
+                    if range > 1e-6 {
+                        pos[d] = (row[d] - min_vals[d]) / range * 10.0 - 5.0;
+                    }
+                }
+                pos
+            })
+            .collect();
+
+        info!("PCA initialized {} positions in 3D space", positions.len());
+        Ok(positions)
+    }
+
+    fn uses_barnes_hut(&self, n: usize) -> bool {
+        match self.force_params.repulsion_mode {
+            RepulsionMode::Exact => false,
+            RepulsionMode::BarnesHut => true,
+            RepulsionMode::Auto => n >= self.force_params.barnes_hut_threshold,
+        }
+    }
+
+    /// Buffers for a run of SoA steps over the current positions, or `None`
+    /// when the AoS kernel is selected.
+    fn physics_buffers(&self) -> Option<PhysicsBuffers> {
+        match self.force_params.physics_kernel {
+            PhysicsKernel::Soa => Some(PhysicsBuffers::new(&self.positions, &self.active_nodes)),
+            PhysicsKernel::Aos => None,
+        }
+    }
+
+    /// Copies the result of a run of SoA steps back into `positions`.
+    fn finish_steps(&mut self, buffers: Option<PhysicsBuffers>) {
+        if let Some(buffers) = buffers {
+            buffers.front.write_aos(&mut self.positions);
+        }
+    }
+
+    fn physics_step(&mut self, buffers: Option<&mut PhysicsBuffers>) -> f32 {
+        match buffers {
+            Some(buffers) => self.apply_soa_physics_step(buffers),
+            None => self.apply_physics_step(),
+        }
+    }
+
+    /// SoA counterpart of `apply_physics_step`: reads `buffers.front`, writes
+    /// every node into `buffers.back`, then swaps them. `self.positions` is
+    /// left untouched until `finish_steps`.
+    fn apply_soa_physics_step(&self, buffers: &mut PhysicsBuffers) -> f32 {
+        let n = buffers.front.len();
+
+        let octree = if self.uses_barnes_hut(n) {
+            buffers.front.write_aos(&mut buffers.scratch);
+            Some(Octree::build(&buffers.scratch))
+        } else {
+            None
+        };
+        let octree = octree.as_ref();
+
+        let PhysicsBuffers {
+            front,
+            back,
+            energy,
+            active,
+            scratch,
+        } = buffers;
+        let (front, active, scratch) = (&*front, &*active, &*scratch);
+
+        let update = |(i, ((x, y), (z, e))): (usize, ((&mut f32, &mut f32), (&mut f32, &mut f32)))| {
+            if active[i] {
+                let v = self.soa_node_velocity(i, front, octree, scratch);
+                *x = front.x[i] + v[0];
+                *y = front.y[i] + v[1];
+                *z = front.z[i] + v[2];
+                *e = v[0] * v[0] + v[1] * v[1] + v[2] * v[2];
+            } else {
+                *x = front.x[i];
+                *y = front.y[i];
+                *z = front.z[i];
+                *e = 0.0;
+            }
+        };
+
+        match &self.thread_pool {
+            Some(pool) => pool.install(|| {
+                back.x
+                    .par_iter_mut()
+                    .zip(back.y.par_iter_mut())
+                    .zip(back.z.par_iter_mut().zip(energy.par_iter_mut()))
+                    .enumerate()
+                    .for_each(update)
+            }),
+            None => back
+                .x
+                .iter_mut()
+                .zip(back.y.iter_mut())
+                .zip(back.z.iter_mut().zip(energy.iter_mut()))
+                .enumerate()
+                .for_each(update),
+        }
+
+        buffers.swap();
+
+        // Sum energy serially in node order to keep it deterministic
+        self.active_nodes.iter().map(|&i| buffers.energy[i]).sum()
+    }
+
+    /// `node_velocity` over SoA positions; `aos` mirrors `positions` and is
+    /// only read when an octree is given.
+    fn soa_node_velocity(
+        &self,
+        i: usize,
+        positions: &SoaPositions,
+        octree: Option<&Octree>,
+        aos: &[[f32; 3]],
+    ) -> [f32; 3] {
+        let p = positions.get(i);
+        let mut velocity = [0.0; 3];
+
+        for (j, similarity) in self.similarity_graph.neighbors(i) {
+            let direction = self.subtract_and_normalize(positions.get(j), p);
+            let force = similarity * self.force_params.attraction_strength;
+            velocity = self.add_scaled(velocity, direction, force);
+        }
+
+        let repulsion = match octree {
+            Some(tree) => tree.repulsion(
+                i,
+                aos,
+                self.force_params.repulsion_strength,
+                self.force_params.barnes_hut_theta,
+            ),
+            None => soa::exact_repulsion(positions, i, self.force_params.repulsion_strength),
+        };
+        velocity = self.add_vectors(velocity, repulsion);
+
+        let to_center = self.scale_vector(p, -self.force_params.center_gravity);
+        velocity = self.add_vectors(velocity, to_center);
+
+        velocity = self.scale_vector(velocity, self.force_params.damping);
+        self.clamp_magnitude(velocity, self.force_params.max_velocity)
+    }
+
+    /// Moves the active nodes one step. Returns their total kinetic energy for
+    /// convergence detection.
+    fn apply_physics_step(&mut self) -> f32 {
+        let n = self.positions.len();
+
+        // Rebuilt every step since nodes move; pinned nodes still repel
+        let octree = if self.uses_barnes_hut(n) {
+            Some(Octree::build(&self.positions))
+        } else {
+            None
+        };
+        let octree = octree.as_ref();
+
+        // Each velocity depends only on the previous positions, so nodes are
+        // independent and the parallel result is identical to the serial one
+        let velocities: Vec<[f32; 3]> = match &self.thread_pool {
+            Some(pool) => pool.install(|| {
+                self.active_nodes
+                    .par_iter()
+                    .map(|&i| self.node_velocity(i, octree))
+                    .collect()
+            }),
+            None => self
+                .active_nodes
+                .iter()
+                .map(|&i| self.node_velocity(i, octree))
+                .collect(),
+        };
+
+        // Sum energy serially in node order to keep it deterministic
+        let mut total_energy = 0.0f32;
+        for (&i, velocity) in self.active_nodes.iter().zip(velocities.iter()) {
+            total_energy += velocity[0] * velocity[0] + velocity[1] * velocity[1] + velocity[2] * velocity[2];
+            let position = &mut self.positions[i];
+            *position = [
+                position[0] + velocity[0],
+                position[1] + velocity[1],
+                position[2] + velocity[2],
+            ];
+        }
+
+        total_energy
+    }
+
+    /// Damped, clamped velocity of node `i` given the current positions.
+    fn node_velocity(&self, i: usize, octree: Option<&Octree>) -> [f32; 3] {
+        let mut velocity = [0.0; 3];
+
+        // Attraction forces along graph edges (continuous similarity as weight)
+        for (j, similarity) in self.similarity_graph.neighbors(i) {
+            let direction = self.subtract_and_normalize(self.positions[j], self.positions[i]);
+            let force = similarity * self.force_params.attraction_strength;
+            velocity = self.add_scaled(velocity, direction, force);
+        }
+
+        // Universal repulsion forces (inverse-square)
+        match octree {
+            Some(tree) => {
+                let repulsion = tree.repulsion(
+                    i,
+                    &self.positions,
+                    self.force_params.repulsion_strength,
+                    self.force_params.barnes_hut_theta,
+                );
+                velocity = self.add_vectors(velocity, repulsion);
+            }
+            None => {
+                for j in 0..self.positions.len() {
+                    if i != j {
+                        let distance = self.calculate_distance(self.positions[i], self.positions[j]);
+                        let direction =
+                            self.subtract_and_normalize(self.positions[i], self.positions[j]);
+                        let force =
+                            self.force_params.repulsion_strength / (distance * distance + 0.01);
+                        velocity = self.add_scaled(velocity, direction, force);
+                    }
+                }
+            }
+        }
+
+        // Center gravity (weak, prevents drift)
+        let to_center = self.scale_vector(self.positions[i], -self.force_params.center_gravity);
+        velocity = self.add_vectors(velocity, to_center);
+
+        // Apply damping and limits
+        velocity = self.scale_vector(velocity, self.force_params.damping);
+        self.clamp_magnitude(velocity, self.force_params.max_velocity)
+    }
+
+    // Vector math helpers (same as before)
+    fn subtract_and_normalize(&self, a: [f32; 3], b: [f32; 3]) -> [f32; 3] {
+        let diff = [a[0] - b[0], a[1] - b[1], a[2] - b[2]];
+        let mag = (diff[0] * diff[0] + diff[1] * diff[1] + diff[2] * diff[2]).sqrt();
+        if mag > 0.0001 {
+            [diff[0] / mag, diff[1] / mag, diff[2] / mag]
+        } else {
+            [0.0, 0.0, 0.0]
+        }
+    }
+
+    fn add_scaled(&self, a: [f32; 3], b: [f32; 3], scale: f32) -> [f32; 3] {
+        [
+            a[0] + b[0] * scale,
+            a[1] + b[1] * scale,
+            a[2] + b[2] * scale,
+        ]
+    }
+
+    fn add_vectors(&self, a: [f32; 3], b: [f32; 3]) -> [f32; 3] {
+        [a[0] + b[0], a[1] + b[1], a[2] + b[2]]
+    }
+
+    fn scale_vector(&self, v: [f32; 3], scale: f32) -> [f32; 3] {
+        [v[0] * scale, v[1] * scale, v[2] * scale]
+    }
+
+    fn calculate_distance(&self, a: [f32; 3], b: [f32; 3]) -> f32 {
+        let dx = a[0] - b[0];
+        let dy = a[1] - b[1];
+        let dz = a[2] - b[2];
+        (dx * dx + dy * dy + dz * dz).sqrt()
+    }
+
+    fn clamp_magnitude(&self, v: [f32; 3], max_mag: f32) -> [f32; 3] {
+        let mag = (v[0] * v[0] + v[1] * v[1] + v[2] * v[2]).sqrt();
+        if mag > max_mag && mag > 0.0001 {
+            let scale = max_mag / mag;
+            [v[0] * scale, v[1] * scale, v[2] * scale]
+        } else {
+            v
+        }
+    }
+}
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use executor::physics_thread_pool;
+
+    fn processor_with(mode: RepulsionMode, positions: Vec<[f32; 3]>) -> MindMapProcessor {
+        let n = positions.len();
+        let mut processor = MindMapProcessor::new(Some(ForceParams {
+            repulsion_mode: mode,
+            barnes_hut_theta: 0.3,
+            ..ForceParams::default()
+        }));
+        processor.similarity_graph = SimilarityGraph::from_similarity(n, 1, 0.0, |_, _| 0.0);
+        processor.positions = positions;
+        processor.active_nodes = (0..n).collect();
+        processor
+    }
+
+    fn grid(n_per_axis: usize) -> Vec<[f32; 3]> {
+        let mut positions = Vec::new();
+        for x in 0..n_per_axis {
+            for y in 0..n_per_axis {
+                for z in 0..n_per_axis {
+                    positions.push([
+                        x as f32 * 1.3 - 5.0 + (y as f32 * 0.17),
+                        y as f32 * 1.1 - 5.0 + (z as f32 * 0.13),
+                        z as f32 * 0.9 - 5.0 + (x as f32 * 0.11),
+                    ]);
+                }
+            }
+        }
+        positions
+    }
+
+    #[test]
+    fn test_parallel_step_is_bit_identical_to_serial() {
+        let positions = grid(9);
+        let n = positions.len();
+        let graph =
+            SimilarityGraph::from_similarity(n, 4, 0.0, |i, j| 1.0 / (1.0 + (i as f32 - j as f32).abs()));
+
+        let mut serial = MindMapProcessor::new(None);
+        let mut parallel = MindMapProcessor::new(None).with_thread_pool(physics_thread_pool(4).unwrap());
+        assert!(physics_thread_pool(1).is_none());
+
+        let a = serial.relax(&positions, &graph, 5);
+        let b = parallel.relax(&positions, &graph, 5);
+        assert_eq!(a, b);
+    }
+
+    fn concept(name: &str) -> Concept {
+        Concept {
+            concept: name.to_string(),
+            importance: 0.5,
+        }
+    }
+
+    /// One-hot embeddings plus a shared component, so every pair is weakly
+    /// similar but none merge.
+    fn distinct_embedding(dim: usize, hot: &[usize]) -> Embedding {
+        let mut e = ndarray::Array1::<f32>::zeros(dim);
+        for &h in hot {
+            e[h] = 1.0 / (hot.len() as f32).sqrt();
+        }
+        e[dim - 1] = 0.3;
+        e
+    }
+
+    #[test]
+    fn test_warm_start_pins_nodes_outside_the_new_neighbourhood() {
+        let dim = 48;
+        let concepts: Vec<Concept> = (0..40).map(|i| concept(&format!("c{}", i))).collect();
+        let embeddings: Vec<Embedding> = (0..40).map(|i| distinct_embedding(dim, &[i])).collect();
+
+        let mut first = MindMapProcessor::new(None);
+        let groups = first.process_concepts(&concepts, &embeddings).unwrap();
+        assert_eq!(first.moved_concepts().len(), 40);
+
+        let previous: PreviousPositions = groups
+            .iter()
+            .map(|g| {
+                let p = &g.reduced_embedding;
+                (g.concepts[0].clone(), [p[0], p[1], p[2]])
+            })
+            .collect();
+
+        let mut all_concepts = concepts.clone();
+        all_concepts.push(concept("new"));
+        let mut all_embeddings = embeddings.clone();
+        all_embeddings.push(distinct_embedding(dim, &[0, 1, 2, 3]));
+
+        let mut second = MindMapProcessor::new(None).with_previous_positions(previous.clone());
+        let groups = second.process_concepts(&all_concepts, &all_embeddings).unwrap();
+        assert_eq!(groups.len(), 41);
+
+        let new_group = groups.iter().find(|g| g.concepts[0] == "new").unwrap();
+        let affected: std::collections::HashSet<String> = new_group
+            .connections
+            .iter()
+            .map(|&j| groups[j].concepts[0].clone())
+            .collect();
+
+        for group in &groups {
+            let name = &group.concepts[0];
+            if name == "new" || affected.contains(name) {
+                continue;
+            }
+            let p = &group.reduced_embedding;
+            assert_eq!(previous[name], [p[0], p[1], p[2]], "{} moved", name);
+        }
+
+        let moved = second.moved_concepts();
+        assert!(moved.iter().any(|(c, _)| c == "new"));
+        assert!(moved.len() <= affected.len() + 1);
+    }
+
+    #[test]
+    fn test_auto_mode_switches_at_threshold() {
+        let processor = MindMapProcessor::new(None);
+        let threshold = processor.force_params.barnes_hut_threshold;
+        assert!(!processor.uses_barnes_hut(threshold - 1));
+        assert!(processor.uses_barnes_hut(threshold));
+    }
+
+    #[test]
+    fn test_barnes_hut_step_tracks_exact_step() {
+        let positions = grid(8);
+        let mut exact = processor_with(RepulsionMode::Exact, positions.clone());
+        let mut approx = processor_with(RepulsionMode::BarnesHut, positions);
+
+        exact.apply_physics_step();
+        approx.apply_physics_step();
+
+        let max_velocity = exact.force_params.max_velocity;
+        for (a, b) in exact.positions.iter().zip(approx.positions.iter()) {
+            let drift = exact.calculate_distance(*a, *b);
+            assert!(drift < 0.1 * max_velocity, "drift {} too large", drift);
+        }
+    }
+
+    #[test]
+    fn test_hnsw_merge_matches_exact_merge() {
+        let dim = 32;
+        let mut concepts = Vec::new();
+        let mut embeddings = Vec::new();
+        for i in 0..30 {
+            // Pairs of near-duplicates on the same axis
+            concepts.push(concept(&format!("c{}", i)));
+            embeddings.push(distinct_embedding(dim, &[i / 2]));
+        }
+
+        let sorted_groups = |processor: &MindMapProcessor| {
+            let mut groups: Vec<Vec<String>> = processor
+                .merge_similar_concepts(&concepts, &embeddings)
+                .unwrap()
+                .into_iter()
+                .map(|(mut names, _, _, _)| {
+                    names.sort();
+                    names
+                })
+                .collect();
+            groups.sort();
+            groups
+        };
+
+        let exact = MindMapProcessor::new(None);
+        let approx = MindMapProcessor::new(Some(ForceParams {
+            hnsw_merge_threshold: 0,
+            ..ForceParams::default()
+        }));
+        let index = Arc::new(Mutex::new(HnswIndex::new(0, HnswParams::default())));
+        let persistent = MindMapProcessor::new(Some(ForceParams {
+            hnsw_merge_threshold: 0,
+            ..ForceParams::default()
+        }))
+        .with_concept_index(Arc::clone(&index));
+
+        let expected = sorted_groups(&exact);
+        assert_eq!(expected.len(), 15);
+        assert_eq!(sorted_groups(&approx), expected);
+        assert_eq!(sorted_groups(&persistent), expected);
+
+        // A second run reuses the already indexed concepts
+        assert_eq!(sorted_groups(&persistent), expected);
+        assert_eq!(index.lock().unwrap().len(), 30);
+
+        // Below the threshold a kept index is not used
+        let unused = Arc::new(Mutex::new(HnswIndex::new(0, HnswParams::default())));
+        let small = MindMapProcessor::new(None).with_concept_index(Arc::clone(&unused));
+        assert_eq!(sorted_groups(&small), expected);
+        assert!(unused.lock().unwrap().is_empty());
+    }
+
+    #[test]
+    fn test_raised_cancel_flag_stops_processing() {
+        let concepts: Vec<Concept> = (0..10).map(|i| concept(&format!("c{}", i))).collect();
+        let embeddings: Vec<Embedding> = (0..10).map(|i| distinct_embedding(16, &[i])).collect();
+
+        let flag: CancelFlag = Arc::new(std::sync::atomic::AtomicBool::new(true));
+        let mut processor = MindMapProcessor::new(None).with_cancellation(flag);
+        let result = processor.process_concepts(&concepts, &embeddings);
+        assert!(matches!(result, Err(ApiError::LayoutCancelled)));
+    }
+
+    fn mean_distances(positions: &[[f32; 3]], cluster_of: impl Fn(usize) -> usize) -> (f32, f32) {
+        let (mut intra, mut inter) = ((0.0, 0usize), (0.0, 0usize));
+        for i in 0..positions.len() {
+            for j in (i + 1)..positions.len() {
+                let d = ((0..3).map(|k| (positions[i][k] - positions[j][k]).powi(2)).sum::<f32>()).sqrt();
+                let bucket = if cluster_of(i) == cluster_of(j) { &mut intra } else { &mut inter };
+                bucket.0 += d;
+                bucket.1 += 1;
+            }
+        }
+        (intra.0 / intra.1 as f32, inter.0 / inter.1 as f32)
+    }
+
+    #[test]
+    fn test_multilevel_layout_uses_fewer_node_iterations() {
+        let (clusters, size) = (12, 50);
+        let n = clusters * size;
+        let embeddings: Vec<Embedding> = (0..n)
+            .map(|i| {
+                let mut e = ndarray::Array1::<f32>::zeros(clusters + 40);
+                e[i / size] = 1.0;
+                e[clusters + i % 40] = 0.5;
+                e
+            })
+            .collect();
+        let normalized = similarity::normalize_rows(embeddings.iter().map(|e| e.view())).unwrap();
+        let seeds = vec![None; n];
+
+        let run = |engine: LayoutEngine| {
+            let mut processor = MindMapProcessor::new(Some(ForceParams {
+                layout_engine: engine,
+                multilevel_coarsest_size: 50,
+                ..ForceParams::default()
+            }));
+            processor.build_similarity_graph(&normalized);
+            processor.run_force_directed_layout(&normalized, &seeds).unwrap();
+            assert_eq!(processor.positions.len(), n);
+            assert_eq!(processor.similarity_graph.len(), n);
+            processor
+        };
+
+        let flat = run(LayoutEngine::Flat);
+        let multilevel = run(LayoutEngine::Multilevel);
+        assert!(
+            multilevel.node_iterations * 2 < flat.node_iterations,
+            "multilevel {} vs flat {}",
+            multilevel.node_iterations,
+            flat.node_iterations
+        );
+
+        let (intra, inter) = mean_distances(&multilevel.positions, |i| i / size);
+        assert!(intra < inter, "intra {} inter {}", intra, inter);
+    }
+
+    #[test]
+    fn test_soa_step_tracks_aos_step() {
+        for mode in [RepulsionMode::Exact, RepulsionMode::BarnesHut] {
+            let positions = grid(7);
+            let n = positions.len();
+            let graph = SimilarityGraph::from_similarity(n, 4, 0.0, |i, j| {
+                1.0 / (1.0 + (i as f32 - j as f32).abs())
+            });
+
+            let run = |kernel: PhysicsKernel| {
+                let mut processor = MindMapProcessor::new(Some(ForceParams {
+                    repulsion_mode: mode,
+                    physics_kernel: kernel,
+                    ..ForceParams::default()
+                }));
+                processor.relax(&positions, &graph, 3)
+            };
+
+            let aos = run(PhysicsKernel::Aos);
+            let soa = run(PhysicsKernel::Soa);
+            for (a, b) in aos.iter().zip(soa.iter()) {
+                for k in 0..3 {
+                    assert!((a[k] - b[k]).abs() < 1e-3, "{:?}: {:?} vs {:?}", mode, a, b);
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn test_soa_step_keeps_pinned_nodes() {
+        let positions = grid(4);
+        let mut processor = MindMapProcessor::new(None);
+        processor.similarity_graph =
+            SimilarityGraph::from_similarity(positions.len(), 2, 0.0, |_, _| 0.5);
+        processor.positions = positions.clone();
+        processor.active_nodes = vec![3, 10];
+
+        let mut buffers = processor.physics_buffers();
+        processor.physics_step(buffers.as_mut());
+        processor.finish_steps(buffers);
+
+        for (i, (before, after)) in positions.iter().zip(processor.positions.iter()).enumerate() {
+            if i == 3 || i == 10 {
+                assert_ne!(before, after);
+            } else {
+                assert_eq!(before, after);
+            }
+        }
+    }
+
+    #[test]
+    fn test_freezing_settled_nodes_saves_node_iterations() {
+        let (clusters, size) = (8, 40);
+        let n = clusters * size;
+        let embeddings: Vec<Embedding> = (0..n)
+            .map(|i| {
+                let mut e = ndarray::Array1::<f32>::zeros(clusters + 20);
+                e[i / size] = 1.0;
+                e[clusters + i % 20] = 0.5;
+                e
+            })
+            .collect();
+        let normalized = similarity::normalize_rows(embeddings.iter().map(|e| e.view())).unwrap();
+        let seeds = vec![None; n];
+
+        let run = |freeze_speed: f32| {
+            let mut processor = MindMapProcessor::new(Some(ForceParams {
+                layout_engine: LayoutEngine::Flat,
+                freeze_speed,
+                ..ForceParams::default()
+            }));
+            processor.build_similarity_graph(&normalized);
+            processor.run_force_directed_layout(&normalized, &seeds).unwrap();
+            assert_eq!(processor.active_nodes.len(), n);
+            processor
+        };
+
+        let full = run(0.0);
+        let frozen = run(0.05);
+        assert!(
+            frozen.node_iterations < full.node_iterations,
+            "frozen {} vs full {}",
+            frozen.node_iterations,
+            full.node_iterations
+        );
+
+        let (intra, inter) = mean_distances(&frozen.positions, |i| i / size);
+        assert!(intra < inter, "intra {} inter {}", intra, inter);
+    }
+
+    #[test]
+    fn test_regrouping_reproduces_layout_and_merges_below_threshold() {
+        // Pairs of near-duplicates, each pair slightly similar to the next
+        let dim = 16;
+        let concepts: Vec<Concept> = (0..12).map(|i| concept(&format!("c{}", i))).collect();
+        let embeddings: Vec<Embedding> = (0..12)
+            .map(|i| {
+                let mut e = distinct_embedding(dim, &[i / 2]);
+                e[(i / 2 + 1) % dim] = 0.8;
+                e
+            })
+            .collect();
+
+        let mut processor = MindMapProcessor::new(None);
+        let groups = processor.process_concepts(&concepts, &embeddings).unwrap();
+        let regrouping = processor.take_regrouping().expect("regrouping");
+
+        assert_eq!(groups.len(), 6);
+        assert_eq!(
+            serde_json::to_string(&regrouping.cut(0.7)).unwrap(),
+            serde_json::to_string(&groups).unwrap()
+        );
+
+        // Neighbouring pairs are ~0.51 similar, so the floor chains them all
+        let merged = regrouping.cut(regrouping.floor());
+        assert_eq!(merged.len(), 1);
+        assert_eq!(merged[0].concepts.len(), 12);
+    }
+
+    #[test]
+    fn test_connections_keep_only_the_strongest_neighbours() {
+        let mut processor = processor_with(RepulsionMode::Exact, grid(2));
+        processor.force_params.max_connections = 3;
+        processor.similarity_graph =
+            SimilarityGraph::from_similarity(8, 7, 0.0, |i, j| 1.0 - 0.1 * (i + j) as f32);
+
+        // Node 0's neighbours 1..7 have similarity 0.9 down to 0.3
+        let strongest: Vec<usize> = processor.find_connections(0).iter().map(|&(j, _)| j).collect();
+        assert_eq!(strongest, vec![1, 2, 3]);
+
+        processor.force_params.max_connections = 0;
+        assert_eq!(processor.find_connections(0).len(), 7);
+    }
+
+    #[test]
+    fn test_repeated_concept_set_is_served_from_layout_cache() {
+        let concepts: Vec<Concept> = (0..12).map(|i| concept(&format!("c{}", i))).collect();
+        let embeddings: Vec<Embedding> = (0..12).map(|i| distinct_embedding(16, &[i])).collect();
+        let cache = Arc::new(LayoutCache::new(1 << 20, None));
+
+        let mut first =
+            MindMapProcessor::new(None).with_layout_cache(Arc::clone(&cache), "model-a");
+        let computed = first.process_concepts(&concepts, &embeddings).unwrap();
+
+        // Same set in another order hits; the embeddings are not even read
+        let mut reversed = concepts.clone();
+        reversed.reverse();
+        let mut second =
+            MindMapProcessor::new(None).with_layout_cache(Arc::clone(&cache), "model-a");
+        let cached = second.process_concepts(&reversed, &[]).unwrap();
+        assert_eq!(
+            serde_json::to_string(&cached).unwrap(),
+            serde_json::to_string(&computed).unwrap()
+        );
+        // The hit re-groups from the cached dendrogram without the embeddings
+        assert!(Arc::ptr_eq(
+            &second.take_regrouping().expect("cached regrouping"),
+            &first.take_regrouping().expect("regrouping")
+        ));
+
+        // A warm start from saved positions is a different layout
+        let placed: PreviousPositions =
+            [("c0".to_string(), [5.0, 5.0, 5.0])].into_iter().collect();
+        let mut warm = MindMapProcessor::new(None)
+            .with_layout_cache(Arc::clone(&cache), "model-a")
+            .with_previous_positions(placed);
+        warm.process_concepts(&concepts, &embeddings).unwrap();
+
+        let mut other_model =
+            MindMapProcessor::new(None).with_layout_cache(Arc::clone(&cache), "model-b");
+        other_model.process_concepts(&concepts, &embeddings).unwrap();
+
+        let stats = cache.stats();
+        assert_eq!((stats.memory_hits, stats.misses, stats.entries), (1, 3, 3));
+    }
+}
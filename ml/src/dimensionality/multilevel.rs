@@ -0,0 +1,188 @@
+//! Graph coarsening for the multilevel layout.
+//!
+//! Each level is built by heavy-edge matching: every node is paired with its
+//! most similar unmatched neighbour and the pair becomes one coarse node.
+//! Edges between coarse nodes carry the mean similarity of the fine edges they
+//! replace. The layout runs on the coarsest graph first and is then prolonged
+//! and refined level by level.
+
+use super::graph::{SimilarityGraph, TopKBuilder};
+use std::collections::HashMap;
+
+/// Coarsening stops once a level shrinks by less than this factor.
+const MIN_REDUCTION: f32 = 0.9;
+
+/// Collapses a heavy-edge matching of `graph`.
+///
+/// Returns the coarse graph, keeping at most `k` neighbours per node, and the
+/// coarse node of every fine node.
+pub fn coarsen(graph: &SimilarityGraph, k: usize) -> (SimilarityGraph, Vec<usize>) {
+    let n = graph.len();
+
+    // Low-degree nodes pick first so they are not left without a partner
+    let mut order: Vec<usize> = (0..n).collect();
+    order.sort_by_key(|&i| (graph.degree(i), i));
+
+    const UNMATCHED: usize = usize::MAX;
+    let mut parent = vec![UNMATCHED; n];
+    let mut coarse_len = 0;
+    for &i in &order {
+        if parent[i] != UNMATCHED {
+            continue;
+        }
+        let partner = graph
+            .neighbors(i)
+            .filter(|&(j, _)| parent[j] == UNMATCHED)
+            .max_by(|a, b| a.1.total_cmp(&b.1).then_with(|| b.0.cmp(&a.0)));
+
+        parent[i] = coarse_len;
+        if let Some((j, _)) = partner {
+            parent[j] = coarse_len;
+        }
+        coarse_len += 1;
+    }
+
+    let mut aggregated: HashMap<(usize, usize), (f32, u32)> = HashMap::new();
+    for (i, j, similarity) in graph.edges() {
+        let (a, b) = (parent[i], parent[j]);
+        if a != b {
+            let entry = aggregated.entry((a.min(b), a.max(b))).or_insert((0.0, 0));
+            entry.0 += similarity;
+            entry.1 += 1;
+        }
+    }
+
+    let mut edges: Vec<((usize, usize), (f32, u32))> = aggregated.into_iter().collect();
+    edges.sort_by_key(|&(pair, _)| pair);
+
+    let mut builder = TopKBuilder::new(coarse_len, k, f32::NEG_INFINITY);
+    for ((a, b), (sum, count)) in edges {
+        builder.offer(a, b, sum / count as f32);
+    }
+
+    (builder.build(), parent)
+}
+
+/// Successively coarser graphs, finest first.
+pub struct Hierarchy {
+    levels: Vec<SimilarityGraph>,
+    /// `parents[l][i]` is the node on level `l + 1` that node `i` of level `l` collapsed into.
+    parents: Vec<Vec<usize>>,
+}
+
+impl Hierarchy {
+    /// Coarsens until a level has at most `coarsest_size` nodes, `max_levels`
+    /// levels exist, or matching stops making progress.
+    pub fn build(graph: SimilarityGraph, k: usize, coarsest_size: usize, max_levels: usize) -> Self {
+        let mut levels = vec![graph];
+        let mut parents = Vec::new();
+
+        while levels.len() < max_levels.max(1) {
+            let finer = &levels[levels.len() - 1];
+            if finer.len() <= coarsest_size {
+                break;
+            }
+            let (coarser, parent) = coarsen(finer, k);
+            if coarser.len() as f32 > finer.len() as f32 * MIN_REDUCTION {
+                break;
+            }
+            levels.push(coarser);
+            parents.push(parent);
+        }
+
+        Self { levels, parents }
+    }
+
+    pub fn depth(&self) -> usize {
+        self.levels.len()
+    }
+
+    pub fn len_at(&self, level: usize) -> usize {
+        self.levels[level].len()
+    }
+
+    /// The coarsest-level node each finest-level node belongs to.
+    pub fn coarsest_membership(&self) -> Vec<usize> {
+        let mut membership: Vec<usize> = (0..self.len_at(0)).collect();
+        for parent in &self.parents {
+            for node in membership.iter_mut() {
+                *node = parent[*node];
+            }
+        }
+        membership
+    }
+
+    /// Graphs finest first, and the parent map below each coarser level.
+    pub fn into_parts(self) -> (Vec<SimilarityGraph>, Vec<Vec<usize>>) {
+        (self.levels, self.parents)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// `clusters` dense cliques of `size` nodes, joined in a ring by weak edges.
+    fn clustered(clusters: usize, size: usize) -> SimilarityGraph {
+        let n = clusters * size;
+        SimilarityGraph::from_similarity(n, 8, 0.0, |i, j| {
+            if i / size == j / size {
+                0.9 - 0.01 * ((i + j) % 5) as f32
+            } else if (i / size + 1) % clusters == j / size && i % size == 0 && j % size == 0 {
+                0.2
+            } else {
+                0.0
+            }
+        })
+    }
+
+    #[test]
+    fn test_matching_roughly_halves_the_graph() {
+        let graph = clustered(10, 8);
+        let (coarse, parent) = coarsen(&graph, 8);
+
+        assert_eq!(parent.len(), graph.len());
+        assert!(coarse.len() <= graph.len() / 2 + 5, "{} coarse nodes", coarse.len());
+
+        // Each coarse node holds one or two fine nodes
+        let mut sizes = vec![0; coarse.len()];
+        for &p in &parent {
+            sizes[p] += 1;
+        }
+        assert!(sizes.iter().all(|&s| s == 1 || s == 2));
+    }
+
+    #[test]
+    fn test_matching_stays_within_clusters() {
+        let graph = clustered(6, 10);
+        let (_, parent) = coarsen(&graph, 8);
+        for i in 0..graph.len() {
+            for j in (i + 1)..graph.len() {
+                if parent[i] == parent[j] {
+                    assert_eq!(i / 10, j / 10, "{} and {} merged across clusters", i, j);
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn test_hierarchy_reaches_coarsest_size() {
+        let graph = clustered(40, 16);
+        let hierarchy = Hierarchy::build(graph, 8, 50, 20);
+
+        assert!(hierarchy.depth() > 2);
+        assert!(hierarchy.len_at(hierarchy.depth() - 1) <= 50);
+
+        let membership = hierarchy.coarsest_membership();
+        let coarsest = hierarchy.len_at(hierarchy.depth() - 1);
+        assert_eq!(membership.len(), 640);
+        assert!(membership.iter().all(|&c| c < coarsest));
+    }
+
+    #[test]
+    fn test_edgeless_graph_stops_coarsening() {
+        let graph = SimilarityGraph::from_similarity(30, 4, 0.0, |_, _| 0.0);
+        let hierarchy = Hierarchy::build(graph, 4, 5, 10);
+        assert_eq!(hierarchy.depth(), 1);
+    }
+}
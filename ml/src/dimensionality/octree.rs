@@ -0,0 +1,267 @@
+//! Barnes–Hut octree for approximating all-pairs repulsion in the force layout.
+//!
+//! Distant clusters of nodes are collapsed into a single pseudo-node at their
+//! center of mass, so one repulsion pass costs O(n log n) instead of O(n²).
+
+/// Max points held by a leaf before it is split into octants.
+const LEAF_CAPACITY: usize = 8;
+
+/// Depth limit so coincident points cannot cause unbounded subdivision.
+const MAX_DEPTH: usize = 24;
+
+/// Softening term added to the squared distance, same as the exact repulsion.
+const SOFTENING: f32 = 0.01;
+
+struct OctreeNode {
+    center: [f32; 3],
+    half_size: f32,
+    mass: f32,
+    center_of_mass: [f32; 3],
+    children: Vec<usize>,
+    points: Vec<usize>,
+}
+
+impl OctreeNode {
+    fn contains(&self, p: [f32; 3]) -> bool {
+        (0..3).all(|d| (p[d] - self.center[d]).abs() <= self.half_size)
+    }
+}
+
+pub struct Octree {
+    nodes: Vec<OctreeNode>,
+}
+
+impl Octree {
+    /// Builds an octree over `positions`. Every node has unit mass.
+    pub fn build(positions: &[[f32; 3]]) -> Self {
+        let mut tree = Self { nodes: Vec::new() };
+        if positions.is_empty() {
+            return tree;
+        }
+
+        let mut min = [f32::MAX; 3];
+        let mut max = [f32::MIN; 3];
+        for p in positions {
+            for d in 0..3 {
+                min[d] = min[d].min(p[d]);
+                max[d] = max[d].max(p[d]);
+            }
+        }
+
+        let center = [
+            (min[0] + max[0]) * 0.5,
+            (min[1] + max[1]) * 0.5,
+            (min[2] + max[2]) * 0.5,
+        ];
+        let half_size = (0..3)
+            .map(|d| (max[d] - min[d]) * 0.5)
+            .fold(0.0f32, f32::max)
+            .max(1e-3)
+            * 1.0001;
+
+        let indices: Vec<usize> = (0..positions.len()).collect();
+        tree.build_node(positions, indices, center, half_size, 0);
+        tree
+    }
+
+    fn build_node(
+        &mut self,
+        positions: &[[f32; 3]],
+        indices: Vec<usize>,
+        center: [f32; 3],
+        half_size: f32,
+        depth: usize,
+    ) -> usize {
+        let mass = indices.len() as f32;
+        let mut center_of_mass = [0.0f32; 3];
+        for &i in &indices {
+            for d in 0..3 {
+                center_of_mass[d] += positions[i][d];
+            }
+        }
+        for d in 0..3 {
+            center_of_mass[d] /= mass;
+        }
+
+        let node_index = self.nodes.len();
+        self.nodes.push(OctreeNode {
+            center,
+            half_size,
+            mass,
+            center_of_mass,
+            children: Vec::new(),
+            points: Vec::new(),
+        });
+
+        if indices.len() <= LEAF_CAPACITY || depth >= MAX_DEPTH {
+            self.nodes[node_index].points = indices;
+            return node_index;
+        }
+
+        let mut octants: [Vec<usize>; 8] = Default::default();
+        for i in indices {
+            let p = positions[i];
+            let octant = (p[0] > center[0]) as usize
+                | ((p[1] > center[1]) as usize) << 1
+                | ((p[2] > center[2]) as usize) << 2;
+            octants[octant].push(i);
+        }
+
+        let child_half = half_size * 0.5;
+        let mut children = Vec::new();
+        for (octant, members) in octants.into_iter().enumerate() {
+            if members.is_empty() {
+                continue;
+            }
+            let child_center = [
+                center[0] + if octant & 1 != 0 { child_half } else { -child_half },
+                center[1] + if octant & 2 != 0 { child_half } else { -child_half },
+                center[2] + if octant & 4 != 0 { child_half } else { -child_half },
+            ];
+            children.push(self.build_node(positions, members, child_center, child_half, depth + 1));
+        }
+        self.nodes[node_index].children = children;
+
+        node_index
+    }
+
+    /// Approximate repulsion acting on node `index`.
+    ///
+    /// A cell is treated as one pseudo-node when `cell_width / distance < theta`
+    /// and it does not contain the node itself. `theta = 0` is exact.
+    pub fn repulsion(
+        &self,
+        index: usize,
+        positions: &[[f32; 3]],
+        strength: f32,
+        theta: f32,
+    ) -> [f32; 3] {
+        let mut force = [0.0f32; 3];
+        if self.nodes.is_empty() {
+            return force;
+        }
+
+        let p = positions[index];
+        let mut stack = vec![0usize];
+
+        while let Some(node_index) = stack.pop() {
+            let node = &self.nodes[node_index];
+
+            if node.children.is_empty() {
+                for &j in &node.points {
+                    if j != index {
+                        accumulate(&mut force, p, positions[j], strength);
+                    }
+                }
+                continue;
+            }
+
+            let distance = distance(p, node.center_of_mass);
+            let width = node.half_size * 2.0;
+            if !node.contains(p) && distance > 0.0 && width / distance < theta {
+                accumulate(&mut force, p, node.center_of_mass, strength * node.mass);
+            } else {
+                stack.extend_from_slice(&node.children);
+            }
+        }
+
+        force
+    }
+}
+
+fn distance(a: [f32; 3], b: [f32; 3]) -> f32 {
+    let dx = a[0] - b[0];
+    let dy = a[1] - b[1];
+    let dz = a[2] - b[2];
+    (dx * dx + dy * dy + dz * dz).sqrt()
+}
+
+/// Inverse-square push of `p` away from `source`, matching the exact layout loop.
+fn accumulate(force: &mut [f32; 3], p: [f32; 3], source: [f32; 3], strength: f32) {
+    let diff = [p[0] - source[0], p[1] - source[1], p[2] - source[2]];
+    let mag = (diff[0] * diff[0] + diff[1] * diff[1] + diff[2] * diff[2]).sqrt();
+    if mag <= 0.0001 {
+        return;
+    }
+    let magnitude = strength / (mag * mag + SOFTENING);
+    for d in 0..3 {
+        force[d] += diff[d] / mag * magnitude;
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Deterministic point cloud so accuracy bounds are reproducible.
+    fn point_cloud(n: usize, seed: u64) -> Vec<[f32; 3]> {
+        let mut state = seed;
+        let mut next = || {
+            state = state.wrapping_mul(6364136223846793005).wrapping_add(1442695040888963407);
+            ((state >> 33) as f32 / (1u64 << 31) as f32) * 10.0 - 5.0
+        };
+        (0..n).map(|_| [next(), next(), next()]).collect()
+    }
+
+    fn exact_repulsion(index: usize, positions: &[[f32; 3]], strength: f32) -> [f32; 3] {
+        let mut force = [0.0f32; 3];
+        for (j, &q) in positions.iter().enumerate() {
+            if j != index {
+                accumulate(&mut force, positions[index], q, strength);
+            }
+        }
+        force
+    }
+
+    fn norm(v: [f32; 3]) -> f32 {
+        (v[0] * v[0] + v[1] * v[1] + v[2] * v[2]).sqrt()
+    }
+
+    #[test]
+    fn test_theta_zero_matches_exact() {
+        let positions = point_cloud(300, 7);
+        let tree = Octree::build(&positions);
+        for i in (0..positions.len()).step_by(17) {
+            let exact = exact_repulsion(i, &positions, 10.0);
+            let approx = tree.repulsion(i, &positions, 10.0, 0.0);
+            let err = norm([approx[0] - exact[0], approx[1] - exact[1], approx[2] - exact[2]]);
+            assert!(err <= 1e-3 * norm(exact).max(1.0), "node {}: err {}", i, err);
+        }
+    }
+
+    #[test]
+    fn test_barnes_hut_accuracy_against_exact() {
+        let positions = point_cloud(2000, 42);
+        let tree = Octree::build(&positions);
+
+        let mut total_err = 0.0f32;
+        let mut total_mag = 0.0f32;
+        for i in (0..positions.len()).step_by(11) {
+            let exact = exact_repulsion(i, &positions, 10.0);
+            let approx = tree.repulsion(i, &positions, 10.0, 0.5);
+            total_err += norm([approx[0] - exact[0], approx[1] - exact[1], approx[2] - exact[2]]);
+            total_mag += norm(exact);
+        }
+
+        let relative = total_err / total_mag;
+        assert!(relative < 0.05, "mean relative error too high: {}", relative);
+    }
+
+    #[test]
+    fn test_coincident_points_do_not_recurse_forever() {
+        let positions = vec![[1.0, 1.0, 1.0]; 100];
+        let tree = Octree::build(&positions);
+        let force = tree.repulsion(0, &positions, 10.0, 0.5);
+        assert_eq!(force, [0.0, 0.0, 0.0]);
+    }
+
+    #[test]
+    fn test_empty_and_single() {
+        let tree = Octree::build(&[]);
+        assert!(tree.nodes.is_empty());
+
+        let positions = vec![[0.0, 0.0, 0.0]];
+        let tree = Octree::build(&positions);
+        assert_eq!(tree.repulsion(0, &positions, 10.0, 0.5), [0.0, 0.0, 0.0]);
+    }
+}
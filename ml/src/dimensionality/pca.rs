@@ -0,0 +1,344 @@
+//! Truncated PCA used to seed the 3D layout.
+//!
+//! The layout only needs the top 3 components, so instead of a full PCA fit the
+//! randomized range finder (Halko et al.) projects the centered block onto a few
+//! random directions, sharpens them with power iterations and solves a tiny
+//! eigenproblem. Centering is applied implicitly so the n×d block is never copied.
+
+use crate::error::ApiError;
+use linfa_reduction::Pca;
+use ndarray::{Array1, Array2, Axis};
+use ndarray_linalg::{Eigh, UPLO};
+use rand::rngs::StdRng;
+use rand::{Rng, SeedableRng};
+
+/// Extra random directions beyond the requested components.
+const OVERSAMPLING: usize = 5;
+
+/// Power iterations; two are enough for embedding spectra.
+const POWER_ITERATIONS: usize = 2;
+
+/// Fixed seed so layouts are reproducible across requests.
+const SEED: u64 = 0x0007_1a5e_ed00_0003;
+
+/// Projects the rows of `x` onto its top `components` principal axes using a
+/// randomized truncated SVD. Returns an n×components matrix.
+pub fn randomized_pca(x: &Array2<f32>, components: usize) -> Result<Array2<f32>, ApiError> {
+    let (n, d) = x.dim();
+    let sketch = (components + OVERSAMPLING).min(n).min(d);
+    if sketch == 0 {
+        return Ok(Array2::zeros((n, components)));
+    }
+
+    let mean = column_mean(x);
+
+    let mut rng = StdRng::seed_from_u64(SEED);
+    let omega = Array2::from_shape_fn((d, sketch), |_| rng.random_range(-1.0f32..1.0));
+
+    // Range finder with power iterations: Q spans the dominant column space of Xc
+    let mut q = centered_mul(x, &mean, &omega);
+    orthonormalize_columns(&mut q);
+    for _ in 0..POWER_ITERATIONS {
+        let mut z = centered_t_mul(x, &mean, &q);
+        orthonormalize_columns(&mut z);
+        q = centered_mul(x, &mean, &z);
+        orthonormalize_columns(&mut q);
+    }
+
+    // B = Qᵀ Xc is sketch×d; the eigenvectors of B Bᵀ give Xc's left singular
+    // vectors in the Q basis, so Xc V = Q W Σ without forming V
+    let b = q.t().dot(x) - outer(&q.sum_axis(Axis(0)), &mean);
+    let gram = b.dot(&b.t());
+    let (eigenvalues, eigenvectors) = gram
+        .eigh(UPLO::Lower)
+        .map_err(|e| ApiError::DimensionalityError(format!("Eigendecomposition failed: {}", e)))?;
+
+    let mut projected = Array2::<f32>::zeros((n, components));
+    for c in 0..components.min(sketch) {
+        // eigh returns ascending eigenvalues
+        let k = sketch - 1 - c;
+        let sigma = eigenvalues[k].max(0.0).sqrt();
+        let column = q.dot(&eigenvectors.column(k)) * sigma;
+        projected.column_mut(c).assign(&column);
+    }
+
+    fix_signs(&mut projected);
+    Ok(projected)
+}
+
+/// Reference projection through `linfa_reduction::Pca` (full fit in f64).
+pub fn linfa_pca(x: &Array2<f32>, components: usize) -> Result<Array2<f32>, ApiError> {
+    use linfa::traits::{Fit, Predict};
+    use linfa::DatasetBase;
+
+    let records = x.mapv(|v| v as f64);
+    let dataset = DatasetBase::from(records.clone());
+
+    let pca = Pca::params(components)
+        .fit(&dataset)
+        .map_err(|e| ApiError::InternalError(format!("PCA fitting failed: {}", e)))?;
+
+    let projected: Array2<f64> = pca.predict(&records);
+    let mut projected = projected.mapv(|v| v as f32);
+    fix_signs(&mut projected);
+    Ok(projected)
+}
+
+/// Streaming PCA over a Frequent Directions sketch (Liberty, 2013).
+///
+/// Rows are folded into a bounded `2·l × d` sketch as they arrive, so
+/// components can be refreshed after each batch of new concepts without
+/// keeping or refitting on the full history.
+pub struct IncrementalPca {
+    components: usize,
+    sketch_rows: usize,
+    count: usize,
+    mean: Array1<f32>,
+    sketch: Array2<f32>,
+    filled: usize,
+}
+
+impl IncrementalPca {
+    pub fn new(dim: usize, components: usize) -> Self {
+        let sketch_rows = components + OVERSAMPLING;
+        Self {
+            components,
+            sketch_rows,
+            count: 0,
+            mean: Array1::zeros(dim),
+            sketch: Array2::zeros((2 * sketch_rows, dim)),
+            filled: 0,
+        }
+    }
+
+    pub fn count(&self) -> usize {
+        self.count
+    }
+
+    /// Folds new rows into the running mean and the sketch.
+    pub fn partial_fit(&mut self, rows: &Array2<f32>) -> Result<(), ApiError> {
+        if rows.ncols() != self.mean.len() {
+            return Err(ApiError::DimensionalityError(format!(
+                "Expected {} dimensions, got {}",
+                self.mean.len(),
+                rows.ncols()
+            )));
+        }
+
+        for row in rows.rows() {
+            self.count += 1;
+            let weight = 1.0 / self.count as f32;
+            self.mean.zip_mut_with(&row, |m, &v| *m += (v - *m) * weight);
+
+            if self.filled == self.sketch.nrows() {
+                self.shrink()?;
+            }
+            self.sketch.row_mut(self.filled).assign(&row);
+            self.filled += 1;
+        }
+
+        Ok(())
+    }
+
+    /// Current principal axes as a components×d matrix.
+    pub fn components(&self) -> Result<Array2<f32>, ApiError> {
+        let d = self.mean.len();
+        if self.count < 2 {
+            return Ok(Array2::zeros((self.components, d)));
+        }
+
+        // Search space: the sketch rows plus the mean, orthonormalized
+        let mut basis_t = Array2::<f32>::zeros((d, self.filled + 1));
+        for (i, row) in self.sketch.rows().into_iter().take(self.filled).enumerate() {
+            basis_t.column_mut(i).assign(&row);
+        }
+        basis_t.column_mut(self.filled).assign(&self.mean);
+        orthonormalize_columns(&mut basis_t);
+
+        // Covariance restricted to the basis: Zᵀ (SᵀS / n - μμᵀ) Z
+        let projected_sketch = self.sketch.dot(&basis_t);
+        let projected_mean = self.mean.dot(&basis_t);
+        let covariance = projected_sketch.t().dot(&projected_sketch) / self.count as f32
+            - outer(&projected_mean, &projected_mean);
+        let (_, eigenvectors) = covariance
+            .eigh(UPLO::Lower)
+            .map_err(|e| ApiError::DimensionalityError(format!("Eigendecomposition failed: {}", e)))?;
+
+        let m = basis_t.ncols();
+        let mut axes = Array2::<f32>::zeros((self.components, d));
+        for c in 0..self.components.min(m) {
+            let axis = basis_t.dot(&eigenvectors.column(m - 1 - c));
+            axes.row_mut(c).assign(&axis);
+        }
+
+        // Same sign convention as the batch projection
+        let mut axes_t = axes.reversed_axes();
+        fix_signs(&mut axes_t);
+        Ok(axes_t.reversed_axes())
+    }
+
+    /// Projects `x` onto the current components.
+    pub fn transform(&self, x: &Array2<f32>) -> Result<Array2<f32>, ApiError> {
+        let axes = self.components()?;
+        Ok(centered_mul(x, &self.mean, &axes.t().to_owned()))
+    }
+
+    /// Frequent Directions shrink: keep the top `l - 1` directions of the
+    /// sketch, each reduced by the `l`-th largest squared singular value.
+    fn shrink(&mut self) -> Result<(), ApiError> {
+        let rows = self.sketch.nrows();
+        let gram = self.sketch.dot(&self.sketch.t());
+        let (eigenvalues, eigenvectors) = gram
+            .eigh(UPLO::Lower)
+            .map_err(|e| ApiError::DimensionalityError(format!("Eigendecomposition failed: {}", e)))?;
+
+        let delta = eigenvalues[rows - self.sketch_rows].max(0.0);
+        let mut shrunk = Array2::<f32>::zeros(self.sketch.dim());
+        let mut kept = 0;
+        for k in (0..rows).rev() {
+            let lambda = eigenvalues[k];
+            if lambda <= delta || kept + 1 >= self.sketch_rows {
+                break;
+            }
+            // uᵀS has norm σ; rescale it to sqrt(σ² - δ)
+            let scale = ((lambda - delta) / lambda).sqrt();
+            let direction = eigenvectors.column(k).dot(&self.sketch) * scale;
+            shrunk.row_mut(kept).assign(&direction);
+            kept += 1;
+        }
+
+        self.sketch = shrunk;
+        self.filled = kept;
+        Ok(())
+    }
+}
+
+fn column_mean(x: &Array2<f32>) -> Array1<f32> {
+    x.mean_axis(Axis(0)).unwrap_or_else(|| Array1::zeros(x.ncols()))
+}
+
+fn outer(a: &Array1<f32>, b: &Array1<f32>) -> Array2<f32> {
+    Array2::from_shape_fn((a.len(), b.len()), |(i, j)| a[i] * b[j])
+}
+
+/// (X - 1μᵀ) M without materializing the centered matrix.
+fn centered_mul(x: &Array2<f32>, mean: &Array1<f32>, m: &Array2<f32>) -> Array2<f32> {
+    let shift = mean.dot(m);
+    let mut product = x.dot(m);
+    for mut row in product.rows_mut() {
+        row -= &shift;
+    }
+    product
+}
+
+/// (X - 1μᵀ)ᵀ M without materializing the centered matrix.
+fn centered_t_mul(x: &Array2<f32>, mean: &Array1<f32>, m: &Array2<f32>) -> Array2<f32> {
+    x.t().dot(m) - outer(mean, &m.sum_axis(Axis(0)))
+}
+
+/// Modified Gram–Schmidt on the columns; degenerate columns become zero.
+fn orthonormalize_columns(m: &mut Array2<f32>) {
+    for j in 0..m.ncols() {
+        for i in 0..j {
+            let previous = m.column(i).to_owned();
+            let projection = previous.dot(&m.column(j));
+            m.column_mut(j).scaled_add(-projection, &previous);
+        }
+        let norm = m.column(j).dot(&m.column(j)).sqrt();
+        if norm > 1e-6 {
+            m.column_mut(j).mapv_inplace(|v| v / norm);
+        } else {
+            m.column_mut(j).fill(0.0);
+        }
+    }
+}
+
+/// Flips each column so its largest-magnitude entry is positive, making the
+/// arbitrary eigenvector sign deterministic.
+fn fix_signs(projected: &mut Array2<f32>) {
+    for mut column in projected.columns_mut() {
+        let pivot = column
+            .iter()
+            .copied()
+            .fold(0.0f32, |best, v| if v.abs() > best.abs() { v } else { best });
+        if pivot < 0.0 {
+            column.mapv_inplace(|v| -v);
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Rank-3 signal with decreasing variance plus small noise, in 64 dims.
+    fn low_rank_block(n: usize) -> Array2<f32> {
+        let d = 64;
+        let mut rng = StdRng::seed_from_u64(11);
+        let axes = Array2::from_shape_fn((3, d), |_| rng.random_range(-1.0f32..1.0));
+        Array2::from_shape_fn((n, d), |(i, j)| {
+            let t = i as f32 / n as f32;
+            let signal = 6.0 * (t * 7.0).sin() * axes[[0, j]]
+                + 3.0 * (t * 13.0).cos() * axes[[1, j]]
+                + 1.5 * (t * 29.0).sin() * axes[[2, j]];
+            signal + 0.01 * rng.random_range(-1.0f32..1.0) + 0.5
+        })
+    }
+
+    fn abs_correlation(a: ndarray::ArrayView1<f32>, b: ndarray::ArrayView1<f32>) -> f32 {
+        let a = &a - a.mean().unwrap();
+        let b = &b - b.mean().unwrap();
+        (a.dot(&b) / (a.dot(&a).sqrt() * b.dot(&b).sqrt())).abs()
+    }
+
+    #[test]
+    fn test_randomized_agrees_with_linfa() {
+        let x = low_rank_block(300);
+        let fast = randomized_pca(&x, 3).unwrap();
+        let reference = linfa_pca(&x, 3).unwrap();
+
+        assert_eq!(fast.dim(), (300, 3));
+        for c in 0..3 {
+            let r = abs_correlation(fast.column(c), reference.column(c));
+            assert!(r > 0.99, "component {} correlation {}", c, r);
+        }
+    }
+
+    #[test]
+    fn test_randomized_is_deterministic() {
+        let x = low_rank_block(120);
+        assert_eq!(randomized_pca(&x, 3).unwrap(), randomized_pca(&x, 3).unwrap());
+    }
+
+    #[test]
+    fn test_fewer_rows_than_components() {
+        let x = low_rank_block(2);
+        let projected = randomized_pca(&x, 3).unwrap();
+        assert_eq!(projected.dim(), (2, 3));
+        assert!(projected.iter().all(|v| v.is_finite()));
+    }
+
+    #[test]
+    fn test_incremental_tracks_batch_components() {
+        let x = low_rank_block(400);
+        let mut incremental = IncrementalPca::new(x.ncols(), 3);
+        for start in (0..400).step_by(50) {
+            let batch = x.slice(ndarray::s![start..start + 50, ..]).to_owned();
+            incremental.partial_fit(&batch).unwrap();
+        }
+        assert_eq!(incremental.count(), 400);
+
+        let streamed = incremental.transform(&x).unwrap();
+        let batch = randomized_pca(&x, 3).unwrap();
+        for c in 0..2 {
+            let r = abs_correlation(streamed.column(c), batch.column(c));
+            assert!(r > 0.95, "component {} correlation {}", c, r);
+        }
+    }
+
+    #[test]
+    fn test_incremental_rejects_wrong_width() {
+        let mut incremental = IncrementalPca::new(8, 3);
+        assert!(incremental.partial_fit(&Array2::zeros((2, 4))).is_err());
+    }
+}
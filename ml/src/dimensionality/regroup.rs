@@ -0,0 +1,358 @@
+//! Re-grouping a finished layout at a new merge threshold.
+//!
+//! The layout places merged groups; a `Regrouping` keeps the dendrogram of
+//! the concepts behind it together with each layout group's position and
+//! neighbours. Cutting at another threshold then only relabels concepts: new
+//! groups are placed at the mean position of their members, with pieces split
+//! off one layout group spread around it, so no embedding or layout work is
+//! repeated.
+
+use super::dendrogram::{Dendrogram, Merge};
+use super::{importance_score, ConceptGroup};
+use crate::data::lru::ByteLru;
+use crate::models::concepts::Concept;
+use std::collections::HashMap;
+use std::sync::{Arc, Mutex};
+
+const DEFAULT_STORE_BUDGET: usize = 128 * 1024 * 1024;
+
+/// Distance between the pieces of a split layout group and its position.
+const SPLIT_SPACING: f32 = 1.0;
+
+/// Golden angle, so successive split pieces do not line up.
+const GOLDEN_ANGLE: f32 = 2.399_963;
+
+pub struct Regrouping {
+    concepts: Vec<String>,
+    importances: Vec<f32>,
+    dendrogram: Dendrogram,
+    /// Lowest similarity recorded in the dendrogram; lower cuts are clamped to it.
+    floor: f32,
+    /// Layout group of each concept.
+    layout_group: Vec<usize>,
+    positions: Vec<[f32; 3]>,
+    /// Connections of each layout group with their similarities.
+    connections: Vec<Vec<(usize, f32)>>,
+}
+
+impl Regrouping {
+    /// `dendrogram` spans `concepts` and `groups` is the layout they were
+    /// merged into. Returns `None` if a concept is missing from `groups`.
+    pub fn new(
+        concepts: &[Concept],
+        dendrogram: Dendrogram,
+        floor: f32,
+        groups: &[ConceptGroup],
+    ) -> Option<Self> {
+        if dendrogram.len() != concepts.len() {
+            return None;
+        }
+
+        let group_of: HashMap<&str, usize> = groups
+            .iter()
+            .enumerate()
+            .flat_map(|(g, group)| group.concepts.iter().map(move |c| (c.as_str(), g)))
+            .collect();
+        let layout_group = concepts
+            .iter()
+            .map(|c| group_of.get(c.concept.as_str()).copied())
+            .collect::<Option<Vec<usize>>>()?;
+
+        Some(Self {
+            concepts: concepts.iter().map(|c| c.concept.clone()).collect(),
+            importances: concepts.iter().map(|c| c.importance).collect(),
+            dendrogram,
+            floor,
+            layout_group,
+            positions: groups
+                .iter()
+                .map(|g| [g.reduced_embedding[0], g.reduced_embedding[1], g.reduced_embedding[2]])
+                .collect(),
+            connections: groups
+                .iter()
+                .map(|g| {
+                    g.connections
+                        .iter()
+                        .enumerate()
+                        .map(|(k, &j)| (j, g.connection_weights.get(k).copied().unwrap_or(0.0)))
+                        .collect()
+                })
+                .collect(),
+        })
+    }
+
+    pub fn floor(&self) -> f32 {
+        self.floor
+    }
+
+    /// Approximate heap footprint, for byte-bounded caches.
+    pub fn estimated_bytes(&self) -> usize {
+        std::mem::size_of::<Self>()
+            + self
+                .concepts
+                .iter()
+                .map(|c| std::mem::size_of::<String>() + c.len())
+                .sum::<usize>()
+            + self.importances.len() * std::mem::size_of::<f32>()
+            + self.dendrogram.merges().len() * std::mem::size_of::<Merge>()
+            + self.layout_group.len() * std::mem::size_of::<usize>()
+            + self.positions.len() * std::mem::size_of::<[f32; 3]>()
+            + self
+                .connections
+                .iter()
+                .map(|c| {
+                    std::mem::size_of::<Vec<(usize, f32)>>()
+                        + c.len() * std::mem::size_of::<(usize, f32)>()
+                })
+                .sum::<usize>()
+    }
+
+    /// Concept groups merging every pair of concepts linked above `threshold`.
+    pub fn cut(&self, threshold: f32) -> Vec<ConceptGroup> {
+        let labels = self.dendrogram.cut(threshold.max(self.floor));
+        let group_count = labels.iter().max().map_or(0, |&l| l + 1);
+
+        let mut members: Vec<Vec<usize>> = vec![Vec::new(); group_count];
+        for (i, &label) in labels.iter().enumerate() {
+            members[label].push(i);
+        }
+
+        // New groups overlapping each layout group, in label order
+        let mut overlapping: Vec<Vec<usize>> = vec![Vec::new(); self.positions.len()];
+        for (label, indices) in members.iter().enumerate() {
+            for &i in indices {
+                let layout_group = self.layout_group[i];
+                if overlapping[layout_group].last() != Some(&label) {
+                    overlapping[layout_group].push(label);
+                }
+            }
+        }
+
+        members
+            .iter()
+            .enumerate()
+            .map(|(label, indices)| {
+                let mut layout_groups: Vec<usize> =
+                    indices.iter().map(|&i| self.layout_group[i]).collect();
+                layout_groups.sort_unstable();
+                layout_groups.dedup();
+
+                let mut links: Vec<(usize, f32)> = Vec::new();
+                for &g in &layout_groups {
+                    // Pieces of a split group stay linked to each other
+                    let siblings = overlapping[g].iter().map(|&other| (other, 1.0));
+                    let neighbours = self.connections[g].iter().flat_map(|&(n, weight)| {
+                        overlapping[n].iter().map(move |&other| (other, weight))
+                    });
+                    links.extend(siblings.chain(neighbours).filter(|&(other, _)| other != label));
+                }
+                // Keep the strongest link to each group
+                links.sort_unstable_by(|a, b| a.0.cmp(&b.0).then_with(|| b.1.total_cmp(&a.1)));
+                links.dedup_by_key(|&mut (other, _)| other);
+                let (connections, connection_weights): (Vec<usize>, Vec<f32>) =
+                    links.into_iter().unzip();
+
+                let importances: Vec<f32> = indices.iter().map(|&i| self.importances[i]).collect();
+
+                ConceptGroup {
+                    concepts: indices.iter().map(|&i| self.concepts[i].clone()).collect(),
+                    reduced_embedding: self.position(indices, &layout_groups, label, &overlapping).to_vec(),
+                    importance_score: importance_score(&importances, connections.len(), indices.len()),
+                    connections,
+                    connection_weights,
+                    group_id: label,
+                }
+            })
+            .collect()
+    }
+
+    fn position(
+        &self,
+        indices: &[usize],
+        layout_groups: &[usize],
+        label: usize,
+        overlapping: &[Vec<usize>],
+    ) -> [f32; 3] {
+        let mut mean = [0.0f32; 3];
+        for &i in indices {
+            let p = self.positions[self.layout_group[i]];
+            for k in 0..3 {
+                mean[k] += p[k];
+            }
+        }
+        for k in 0..3 {
+            mean[k] /= indices.len() as f32;
+        }
+
+        // A piece of a single split layout group would coincide with its siblings
+        if let [g] = layout_groups {
+            let rank = overlapping[*g].iter().position(|&l| l == label).unwrap_or(0);
+            if rank > 0 {
+                let angle = rank as f32 * GOLDEN_ANGLE;
+                let height = 1.0 - 2.0 * (rank as f32 + 0.5) / overlapping[*g].len() as f32;
+                let radius = (1.0 - height * height).sqrt();
+                mean[0] += SPLIT_SPACING * radius * angle.cos();
+                mean[1] += SPLIT_SPACING * radius * angle.sin();
+                mean[2] += SPLIT_SPACING * height;
+            }
+        }
+        mean
+    }
+}
+
+/// The latest regrouping of each user's map, keyed by user id. Least
+/// recently used users are evicted once the byte budget is exceeded.
+pub struct RegroupStore {
+    regroupings: Mutex<ByteLru<Arc<Regrouping>>>,
+}
+
+impl RegroupStore {
+    pub fn new(byte_budget: usize) -> Self {
+        Self {
+            regroupings: Mutex::new(ByteLru::new(byte_budget)),
+        }
+    }
+
+    /// Budget from `REGROUP_STORE_BYTES` (default 128 MiB, 0 disables).
+    pub fn from_env() -> Self {
+        let byte_budget = std::env::var("REGROUP_STORE_BYTES")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_STORE_BUDGET);
+        Self::new(byte_budget)
+    }
+
+    pub fn put(&self, user_id: &str, regrouping: Arc<Regrouping>) {
+        let bytes = regrouping.estimated_bytes();
+        self.lock().insert(user_id, regrouping, bytes);
+    }
+
+    pub fn remove(&self, user_id: &str) {
+        self.lock().remove(user_id);
+    }
+
+    pub fn get(&self, user_id: &str) -> Option<Arc<Regrouping>> {
+        self.lock().get(user_id).cloned()
+    }
+
+    pub fn len(&self) -> usize {
+        self.lock().len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.lock().is_empty()
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, ByteLru<Arc<Regrouping>>> {
+        self.regroupings.lock().unwrap_or_else(|e| e.into_inner())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::dimensionality::graph::SimilarityGraph;
+
+    fn concept(name: &str) -> Concept {
+        Concept {
+            concept: name.to_string(),
+            importance: 0.5,
+        }
+    }
+
+    /// Concepts a0..a2 and b0..b2 in two tight triples joined at 0.5, laid
+    /// out as two groups merged at 0.7.
+    fn regrouping() -> Regrouping {
+        let concepts: Vec<Concept> = ["a0", "a1", "a2", "b0", "b1", "b2"]
+            .iter()
+            .map(|name| concept(name))
+            .collect();
+        let graph = SimilarityGraph::from_similarity(6, 5, 0.0, |i, j| match (i / 3 == j / 3, i, j) {
+            (true, 0, 1) | (true, 3, 4) => 0.95,
+            (true, _, _) => 0.8,
+            (false, 2, 3) => 0.5,
+            _ => 0.0,
+        });
+        let groups = vec![
+            ConceptGroup {
+                concepts: vec!["a0".into(), "a1".into(), "a2".into()],
+                reduced_embedding: vec![-5.0, 0.0, 0.0],
+                connections: vec![1],
+                connection_weights: vec![0.5],
+                importance_score: 1.0,
+                group_id: 0,
+            },
+            ConceptGroup {
+                concepts: vec!["b0".into(), "b1".into(), "b2".into()],
+                reduced_embedding: vec![5.0, 0.0, 0.0],
+                connections: vec![0],
+                connection_weights: vec![0.5],
+                importance_score: 1.0,
+                group_id: 1,
+            },
+        ];
+        Regrouping::new(&concepts, Dendrogram::from_graph(&graph), 0.3, &groups).unwrap()
+    }
+
+    #[test]
+    fn test_cut_at_layout_threshold_reproduces_layout_groups() {
+        let groups = regrouping().cut(0.7);
+        assert_eq!(groups.len(), 2);
+        assert_eq!(groups[0].concepts, vec!["a0", "a1", "a2"]);
+        assert_eq!(groups[0].reduced_embedding, vec![-5.0, 0.0, 0.0]);
+        assert_eq!(groups[1].connections, vec![0]);
+    }
+
+    #[test]
+    fn test_lower_threshold_merges_at_mean_position() {
+        let groups = regrouping().cut(0.4);
+        assert_eq!(groups.len(), 1);
+        assert_eq!(groups[0].concepts.len(), 6);
+        assert_eq!(groups[0].reduced_embedding, vec![0.0, 0.0, 0.0]);
+        assert!(groups[0].connections.is_empty());
+    }
+
+    #[test]
+    fn test_higher_threshold_splits_around_layout_position() {
+        let groups = regrouping().cut(0.9);
+        let names: Vec<Vec<String>> = groups.iter().map(|g| g.concepts.clone()).collect();
+        assert_eq!(names, vec![vec!["a0", "a1"], vec!["a2"], vec!["b0", "b1"], vec!["b2"]]);
+
+        // The first piece keeps the layout position, its sibling is offset
+        assert_eq!(groups[0].reduced_embedding, vec![-5.0, 0.0, 0.0]);
+        assert_ne!(groups[1].reduced_embedding, groups[0].reduced_embedding);
+        // Siblings and pieces of the connected layout group are linked
+        assert_eq!(groups[0].connections, vec![1, 2, 3]);
+        assert_eq!(groups[0].connection_weights, vec![1.0, 0.5, 0.5]);
+    }
+
+    #[test]
+    fn test_cuts_below_floor_are_clamped() {
+        let regrouping = regrouping();
+        assert_eq!(regrouping.cut(0.0).len(), regrouping.cut(regrouping.floor()).len());
+    }
+
+    #[test]
+    fn test_store_evicts_least_recently_used_user() {
+        let bytes = regrouping().estimated_bytes();
+        let store = RegroupStore::new(bytes * 2);
+        store.put("a", Arc::new(regrouping()));
+        store.put("b", Arc::new(regrouping()));
+        assert!(store.get("a").is_some());
+
+        store.put("c", Arc::new(regrouping()));
+        assert!(store.get("b").is_none());
+        assert!(store.get("a").is_some());
+        assert_eq!(store.len(), 2);
+
+        let tiny = RegroupStore::new(bytes - 1);
+        tiny.put("a", Arc::new(regrouping()));
+        assert!(tiny.is_empty());
+    }
+
+    #[test]
+    fn test_missing_concept_is_rejected() {
+        let dendrogram = Dendrogram::from_graph(&SimilarityGraph::from_similarity(1, 1, 0.0, |_, _| 0.0));
+        assert!(Regrouping::new(&[concept("x")], dendrogram, 0.5, &[]).is_none());
+    }
+}
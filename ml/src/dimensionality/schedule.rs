@@ -0,0 +1,144 @@
+//! Active-set scheduling for the force-directed layout.
+//!
+//! Nodes that have moved less than a freeze speed for several consecutive
+//! steps are frozen: the physics step stops updating them, but they keep
+//! acting as sources of attraction and repulsion. A frozen node is woken when
+//! one of its graph neighbours moves by more than a wake distance in a step.
+
+use super::graph::SimilarityGraph;
+
+pub struct ActiveSet {
+    /// Nodes this run may move at all; pinned nodes are never woken.
+    eligible: Vec<bool>,
+    /// Consecutive steps each node has moved slower than `freeze_speed`.
+    calm_steps: Vec<usize>,
+    freeze_speed: f32,
+    freeze_after: usize,
+    wake_distance: f32,
+    pub freezes: usize,
+    pub wakes: usize,
+}
+
+impl ActiveSet {
+    /// `freeze_speed <= 0` disables freezing.
+    pub fn new(
+        active: &[bool],
+        freeze_speed: f32,
+        freeze_after: usize,
+        wake_distance: f32,
+    ) -> Self {
+        Self {
+            eligible: active.to_vec(),
+            calm_steps: vec![0; active.len()],
+            freeze_speed,
+            freeze_after: freeze_after.max(1),
+            wake_distance,
+            freezes: 0,
+            wakes: 0,
+        }
+    }
+
+    /// Freezes settled nodes and wakes frozen neighbours of moving ones,
+    /// given each node's squared displacement in the last step. Returns
+    /// whether `active` changed.
+    pub fn update(&mut self, displacement_sq: &[f32], active: &mut [bool], graph: &SimilarityGraph) -> bool {
+        if self.freeze_speed <= 0.0 {
+            return false;
+        }
+
+        let freeze_sq = self.freeze_speed * self.freeze_speed;
+        let wake_sq = self.wake_distance * self.wake_distance;
+        let mut changed = false;
+
+        for i in 0..active.len() {
+            if !active[i] {
+                continue;
+            }
+            if displacement_sq[i] < freeze_sq {
+                self.calm_steps[i] += 1;
+                if self.calm_steps[i] >= self.freeze_after {
+                    active[i] = false;
+                    self.freezes += 1;
+                    changed = true;
+                }
+            } else {
+                self.calm_steps[i] = 0;
+            }
+        }
+
+        for i in 0..active.len() {
+            if !(displacement_sq[i] > wake_sq) {
+                continue;
+            }
+            for (j, _) in graph.neighbors(i) {
+                if self.eligible[j] && !active[j] {
+                    active[j] = true;
+                    self.calm_steps[j] = 0;
+                    self.wakes += 1;
+                    changed = true;
+                }
+            }
+        }
+
+        changed
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn chain(n: usize) -> SimilarityGraph {
+        SimilarityGraph::from_similarity(n, 2, 0.0, |i, j| if j == i + 1 { 0.9 } else { 0.0 })
+    }
+
+    #[test]
+    fn test_freezes_after_consecutive_calm_steps() {
+        let graph = chain(3);
+        let mut active = vec![true; 3];
+        let mut set = ActiveSet::new(&active, 0.1, 2, 0.5);
+        let still = [0.0, 0.0, 0.0];
+
+        assert!(!set.update(&still, &mut active, &graph));
+        assert_eq!(active, vec![true; 3]);
+        assert!(set.update(&still, &mut active, &graph));
+        assert_eq!(active, vec![false; 3]);
+        assert_eq!(set.freezes, 3);
+    }
+
+    #[test]
+    fn test_movement_resets_calm_count() {
+        let graph = chain(2);
+        let mut active = vec![true; 2];
+        let mut set = ActiveSet::new(&active, 0.1, 2, 10.0);
+
+        set.update(&[0.0, 0.0], &mut active, &graph);
+        set.update(&[0.04, 0.0], &mut active, &graph);
+        assert_eq!(active, vec![true, false]);
+    }
+
+    #[test]
+    fn test_moving_neighbour_wakes_frozen_node_but_not_pinned_ones() {
+        let graph = chain(4);
+        let mut active = vec![true, true, true, false];
+        let mut set = ActiveSet::new(&active, 0.1, 1, 0.5);
+
+        set.update(&[0.0; 4], &mut active, &graph);
+        assert_eq!(active, vec![false; 4]);
+
+        // Node 2 moves: neighbour 1 wakes, pinned neighbour 3 does not
+        active[2] = true;
+        set.update(&[0.0, 0.0, 1.0, 0.0], &mut active, &graph);
+        assert_eq!(active, vec![false, true, true, false]);
+        assert_eq!(set.wakes, 1);
+    }
+
+    #[test]
+    fn test_zero_freeze_speed_disables_freezing() {
+        let graph = chain(2);
+        let mut active = vec![true; 2];
+        let mut set = ActiveSet::new(&active, 0.0, 1, 0.5);
+        assert!(!set.update(&[0.0, 0.0], &mut active, &graph));
+        assert_eq!(active, vec![true; 2]);
+    }
+}
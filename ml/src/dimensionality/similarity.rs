@@ -0,0 +1,148 @@
+//! Batched cosine similarity over L2-normalized embedding blocks.
+//!
+//! Embeddings are normalized once into a contiguous row-major `Array2`, so a
+//! cosine similarity is a plain dot product and a block of the Gram matrix is
+//! one GEMM (dispatched to OpenBLAS through ndarray's `blas` feature). Blocks
+//! are tiled so scratch memory stays at `TILE_ROWS²` floats regardless of n.
+
+use crate::error::ApiError;
+use ndarray::{s, Array1, Array2, ArrayView1};
+
+// ndarray-linalg links OpenBLAS, which provides the cblas symbols behind GEMM
+use ndarray_linalg as _;
+
+/// Rows per Gram matrix tile; 512² f32 is 1 MiB of scratch.
+pub const TILE_ROWS: usize = 512;
+
+/// Stacks `rows` into an n×d matrix with every row scaled to unit length.
+///
+/// Zero vectors stay zero, so their similarity to anything is 0.
+pub fn normalize_rows<'a, I>(rows: I) -> Result<Array2<f32>, ApiError>
+where
+    I: IntoIterator<Item = ArrayView1<'a, f32>>,
+{
+    let rows: Vec<ArrayView1<f32>> = rows.into_iter().collect();
+    let dim = rows.first().map_or(0, |row| row.len());
+
+    let mut matrix = Array2::<f32>::zeros((rows.len(), dim));
+    for (i, row) in rows.iter().enumerate() {
+        if row.len() != dim {
+            return Err(ApiError::DimensionalityError(format!(
+                "Embedding {} has {} dimensions, expected {}",
+                i,
+                row.len(),
+                dim
+            )));
+        }
+
+        let norm = row.dot(row).sqrt();
+        if norm > 0.0 {
+            for (dst, &src) in matrix.row_mut(i).iter_mut().zip(row.iter()) {
+                *dst = src / norm;
+            }
+        }
+    }
+
+    Ok(matrix)
+}
+
+/// Calls `visit(i, j, similarity)` for every pair `i < j` of a normalized matrix,
+/// computing the upper triangle of the Gram matrix one tile at a time.
+pub fn for_each_pair<F>(normalized: &Array2<f32>, mut visit: F)
+where
+    F: FnMut(usize, usize, f32),
+{
+    let n = normalized.nrows();
+
+    for row_start in (0..n).step_by(TILE_ROWS) {
+        let row_end = (row_start + TILE_ROWS).min(n);
+        let rows = normalized.slice(s![row_start..row_end, ..]);
+
+        for col_start in (row_start..n).step_by(TILE_ROWS) {
+            let col_end = (col_start + TILE_ROWS).min(n);
+            let cols = normalized.slice(s![col_start..col_end, ..]);
+            let block = rows.dot(&cols.t());
+
+            for (bi, block_row) in block.rows().into_iter().enumerate() {
+                let i = row_start + bi;
+                let first = if col_start == row_start { bi + 1 } else { 0 };
+                for (bj, &similarity) in block_row.iter().enumerate().skip(first) {
+                    visit(i, col_start + bj, similarity);
+                }
+            }
+        }
+    }
+}
+
+/// Cosine similarity of every row of a normalized matrix to `query` (one GEMV).
+///
+/// Returns zeros if `query` is a zero vector or its width does not match.
+pub fn similarities_to(query: ArrayView1<f32>, normalized: &Array2<f32>) -> Array1<f32> {
+    let norm = query.dot(&query).sqrt();
+    if query.len() != normalized.ncols() || norm == 0.0 {
+        return Array1::zeros(normalized.nrows());
+    }
+    normalized.dot(&query) / norm
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use ndarray::array;
+
+    fn reference_cosine(a: &[f32], b: &[f32]) -> f32 {
+        let dot: f32 = a.iter().zip(b.iter()).map(|(x, y)| x * y).sum();
+        let norm_a: f32 = a.iter().map(|x| x * x).sum::<f32>().sqrt();
+        let norm_b: f32 = b.iter().map(|x| x * x).sum::<f32>().sqrt();
+        if norm_a == 0.0 || norm_b == 0.0 {
+            return 0.0;
+        }
+        dot / (norm_a * norm_b)
+    }
+
+    #[test]
+    fn test_cosine_similarity_identical() {
+        let m = normalize_rows(vec![array![1.0, 0.0, 0.0].view()]).unwrap();
+        let sims = similarities_to(array![1.0, 0.0, 0.0].view(), &m);
+        assert!((sims[0] - 1.0).abs() < 0.001);
+    }
+
+    #[test]
+    fn test_cosine_similarity_orthogonal() {
+        let m = normalize_rows(vec![array![1.0, 0.0].view()]).unwrap();
+        let sims = similarities_to(array![0.0, 1.0].view(), &m);
+        assert!(sims[0].abs() < 0.001);
+    }
+
+    #[test]
+    fn test_zero_vector_and_width_mismatch_score_zero() {
+        let m = normalize_rows(vec![array![0.0, 0.0].view(), array![3.0, 4.0].view()]).unwrap();
+        assert_eq!(m.row(0).to_vec(), vec![0.0, 0.0]);
+        assert_eq!(similarities_to(array![1.0, 0.0, 0.0].view(), &m).to_vec(), vec![0.0, 0.0]);
+    }
+
+    #[test]
+    fn test_inconsistent_dimensions_rejected() {
+        let a = array![1.0, 0.0];
+        let b = array![1.0, 0.0, 0.0];
+        assert!(normalize_rows(vec![a.view(), b.view()]).is_err());
+    }
+
+    #[test]
+    fn test_tiled_pairs_match_reference() {
+        let n = TILE_ROWS + 37;
+        let rows: Vec<Array1<f32>> = (0..n)
+            .map(|i| Array1::from_shape_fn(8, |d| ((i * 7 + d * 13) % 11) as f32 - 5.0))
+            .collect();
+        let normalized = normalize_rows(rows.iter().map(|r| r.view())).unwrap();
+
+        let mut visited = 0usize;
+        for_each_pair(&normalized, |i, j, similarity| {
+            assert!(i < j);
+            let expected = reference_cosine(rows[i].as_slice().unwrap(), rows[j].as_slice().unwrap());
+            assert!((similarity - expected).abs() < 1e-4, "({}, {})", i, j);
+            visited += 1;
+        });
+        assert_eq!(visited, n * (n - 1) / 2);
+    }
+}
@@ -0,0 +1,206 @@
+//! Structure-of-arrays buffers and kernels for the physics step.
+//!
+//! Positions are stored as separate x/y/z columns so the all-pairs repulsion
+//! loop reads three contiguous streams. The inner loop works on fixed chunks
+//! of `LANES` floats with branch-free arithmetic, which the compiler turns
+//! into SIMD without target-specific code. Steps read from `front` and write
+//! into `back`, and the two are swapped afterwards, so no per-step copies of
+//! the layout are made.
+
+/// Floats processed per chunk of the repulsion kernel (one AVX register).
+pub const LANES: usize = 8;
+
+/// Added to the squared distance so coincident nodes do not blow up.
+const SOFTENING: f32 = 0.01;
+
+/// Below this separation a pair has no defined direction and exerts no force.
+const MIN_SEPARATION: f32 = 0.0001;
+
+#[derive(Debug, Clone, Default, PartialEq)]
+pub struct SoaPositions {
+    pub x: Vec<f32>,
+    pub y: Vec<f32>,
+    pub z: Vec<f32>,
+}
+
+impl SoaPositions {
+    pub fn from_aos(positions: &[[f32; 3]]) -> Self {
+        Self {
+            x: positions.iter().map(|p| p[0]).collect(),
+            y: positions.iter().map(|p| p[1]).collect(),
+            z: positions.iter().map(|p| p[2]).collect(),
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.x.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.x.is_empty()
+    }
+
+    pub fn get(&self, i: usize) -> [f32; 3] {
+        [self.x[i], self.y[i], self.z[i]]
+    }
+
+    /// Overwrites `out` with the positions in array-of-structs form.
+    pub fn write_aos(&self, out: &mut Vec<[f32; 3]>) {
+        out.clear();
+        out.extend((0..self.len()).map(|i| self.get(i)));
+    }
+}
+
+/// Double-buffered state for a run of physics steps.
+pub struct PhysicsBuffers {
+    /// Positions the current step reads.
+    pub front: SoaPositions,
+    /// Positions the current step writes; swapped with `front` afterwards.
+    pub back: SoaPositions,
+    /// Squared velocity of each node in the last step (0 for pinned nodes).
+    pub energy: Vec<f32>,
+    pub active: Vec<bool>,
+    /// Array-of-structs copy of `front` for the octree.
+    pub scratch: Vec<[f32; 3]>,
+}
+
+impl PhysicsBuffers {
+    pub fn new(positions: &[[f32; 3]], active_nodes: &[usize]) -> Self {
+        let front = SoaPositions::from_aos(positions);
+        let mut active = vec![false; positions.len()];
+        for &i in active_nodes {
+            active[i] = true;
+        }
+        Self {
+            back: front.clone(),
+            front,
+            energy: vec![0.0; positions.len()],
+            active,
+            scratch: Vec::with_capacity(positions.len()),
+        }
+    }
+
+    pub fn swap(&mut self) {
+        std::mem::swap(&mut self.front, &mut self.back);
+    }
+}
+
+/// Force on node `i` from `strength / (d² + softening)` repulsion by every
+/// other node, along the unit vector pointing away from it.
+pub fn exact_repulsion(positions: &SoaPositions, i: usize, strength: f32) -> [f32; 3] {
+    let (px, py, pz) = (positions.x[i], positions.y[i], positions.z[i]);
+
+    #[inline(always)]
+    fn pair_scale(d2: f32, strength: f32) -> f32 {
+        let distance = d2.sqrt();
+        // Node i itself has distance 0 and drops out here, so no index check
+        if distance > MIN_SEPARATION {
+            strength / ((d2 + SOFTENING) * distance)
+        } else {
+            0.0
+        }
+    }
+
+    let mut acc_x = [0.0f32; LANES];
+    let mut acc_y = [0.0f32; LANES];
+    let mut acc_z = [0.0f32; LANES];
+
+    let xs = positions.x.chunks_exact(LANES);
+    let ys = positions.y.chunks_exact(LANES);
+    let zs = positions.z.chunks_exact(LANES);
+    let (tail_x, tail_y, tail_z) = (xs.remainder(), ys.remainder(), zs.remainder());
+
+    for ((cx, cy), cz) in xs.zip(ys).zip(zs) {
+        for lane in 0..LANES {
+            let dx = px - cx[lane];
+            let dy = py - cy[lane];
+            let dz = pz - cz[lane];
+            let scale = pair_scale(dx * dx + dy * dy + dz * dz, strength);
+            acc_x[lane] += dx * scale;
+            acc_y[lane] += dy * scale;
+            acc_z[lane] += dz * scale;
+        }
+    }
+
+    let mut force = [
+        acc_x.iter().sum::<f32>(),
+        acc_y.iter().sum::<f32>(),
+        acc_z.iter().sum::<f32>(),
+    ];
+    for ((&x, &y), &z) in tail_x.iter().zip(tail_y).zip(tail_z) {
+        let (dx, dy, dz) = (px - x, py - y, pz - z);
+        let scale = pair_scale(dx * dx + dy * dy + dz * dz, strength);
+        force[0] += dx * scale;
+        force[1] += dy * scale;
+        force[2] += dz * scale;
+    }
+    force
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn scattered(n: usize) -> Vec<[f32; 3]> {
+        (0..n)
+            .map(|i| {
+                let t = i as f32;
+                [(t * 0.37).sin() * 5.0, (t * 0.11).cos() * 4.0, (t * 0.53).sin() * 3.0]
+            })
+            .collect()
+    }
+
+    fn reference_repulsion(positions: &[[f32; 3]], i: usize, strength: f32) -> [f32; 3] {
+        let mut force = [0.0f32; 3];
+        for (j, p) in positions.iter().enumerate() {
+            if i == j {
+                continue;
+            }
+            let d = [positions[i][0] - p[0], positions[i][1] - p[1], positions[i][2] - p[2]];
+            let distance = (d[0] * d[0] + d[1] * d[1] + d[2] * d[2]).sqrt();
+            if distance > MIN_SEPARATION {
+                let f = strength / (distance * distance + SOFTENING);
+                for k in 0..3 {
+                    force[k] += d[k] / distance * f;
+                }
+            }
+        }
+        force
+    }
+
+    #[test]
+    fn test_kernel_matches_scalar_reference_with_remainder() {
+        // 8 full chunks plus a 5-wide tail
+        let positions = scattered(LANES * 8 + 5);
+        let soa = SoaPositions::from_aos(&positions);
+        for i in [0, 7, 40, positions.len() - 1] {
+            let fast = exact_repulsion(&soa, i, 10.0);
+            let slow = reference_repulsion(&positions, i, 10.0);
+            for k in 0..3 {
+                let tolerance = 1e-4 * slow[k].abs().max(1.0);
+                assert!((fast[k] - slow[k]).abs() < tolerance, "node {} axis {}", i, k);
+            }
+        }
+    }
+
+    #[test]
+    fn test_coincident_nodes_exert_no_force() {
+        let soa = SoaPositions::from_aos(&[[1.0, 2.0, 3.0], [1.0, 2.0, 3.0]]);
+        assert_eq!(exact_repulsion(&soa, 0, 10.0), [0.0, 0.0, 0.0]);
+    }
+
+    #[test]
+    fn test_round_trip_and_swap() {
+        let positions = scattered(11);
+        let mut buffers = PhysicsBuffers::new(&positions, &[2, 5]);
+        assert_eq!(buffers.active.iter().filter(|&&a| a).count(), 2);
+
+        buffers.back.x[0] = 42.0;
+        buffers.swap();
+        assert_eq!(buffers.front.get(0)[0], 42.0);
+
+        let mut out = Vec::new();
+        buffers.back.write_aos(&mut out);
+        assert_eq!(out, positions);
+    }
+}
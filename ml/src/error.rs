@@ -36,6 +36,18 @@ pub enum ApiError {
 
     #[error("Scene not found: {0}")]
     SceneNotFound(String),
+
+    #[error("Layout workers are saturated, retry later")]
+    LayoutQueueFull,
+
+    #[error("Layout was cancelled")]
+    LayoutCancelled,
+
+    #[error("No layout to re-group for user: {0}")]
+    LayoutNotFound(String),
+
+    #[error("Invalid request: {0}")]
+    BadRequest(String),
 }
 
 #[derive(Serialize, Deserialize)]
@@ -52,6 +64,9 @@ impl ResponseError for ApiError {
             ApiError::UrlFetchError(_) => actix_web::http::StatusCode::UNPROCESSABLE_ENTITY,
             ApiError::ContentExtractionError(_) => actix_web::http::StatusCode::UNPROCESSABLE_ENTITY,
             ApiError::SceneNotFound(_) => actix_web::http::StatusCode::NOT_FOUND,
+            ApiError::LayoutNotFound(_) => actix_web::http::StatusCode::NOT_FOUND,
+            ApiError::LayoutQueueFull => actix_web::http::StatusCode::SERVICE_UNAVAILABLE,
+            ApiError::BadRequest(_) => actix_web::http::StatusCode::BAD_REQUEST,
             _ => actix_web::http::StatusCode::INTERNAL_SERVER_ERROR,
         };
         
@@ -93,4 +108,16 @@ mod tests {
         let msg = api_err.to_string();
         assert!(msg.contains("GPU not found"), "Expected error message to contain 'GPU not found', got: {}", msg);
     }
-}
\ No newline at end of file
+
+    #[test]
+    fn test_layout_queue_full_is_service_unavailable() {
+        let response = ApiError::LayoutQueueFull.error_response();
+        assert_eq!(response.status(), actix_web::http::StatusCode::SERVICE_UNAVAILABLE);
+    }
+
+    #[test]
+    fn test_bad_request_is_a_client_error() {
+        let response = ApiError::BadRequest("merge_threshold".into()).error_response();
+        assert_eq!(response.status(), actix_web::http::StatusCode::BAD_REQUEST);
+    }
+}
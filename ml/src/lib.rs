@@ -0,0 +1,5 @@
+pub mod controllers;
+pub mod data;
+pub mod dimensionality;
+pub mod error;
+pub mod models;
@@ -2,19 +2,21 @@ use actix_cors::Cors;
 use actix_web::{middleware::Logger, web, App, HttpResponse, HttpServer};
 use log::info;
 use std::sync::Arc;
-
-mod controllers;
-mod models;
-mod data;
-mod dimensionality;
-mod error;
-
-use crate::controllers::text_processing::{process_text, get_texts_by_concept, save_scene, get_scene, AppState};
-use crate::models::concepts::ConceptsModel;
-use crate::models::embeddings::EmbeddingModel;
-use crate::models::inference::{InferenceConfig, MistralRsLlm, MistralRsEmbedding};
-use crate::data::client::DatabaseClient;
-use crate::data::scraper::ArticleScraper;
+use std::time::Duration;
+
+use oort_ml_rust::controllers::text_processing::{process_text, regroup, get_texts_by_concept, get_layout_metrics, get_db_metrics, save_scene, get_scene, AppState};
+use oort_ml_rust::models::concepts::ConceptsModel;
+use oort_ml_rust::models::embeddings::EmbeddingModel;
+use oort_ml_rust::models::inference::{InferenceConfig, MistralRsLlm, MistralRsEmbedding};
+use oort_ml_rust::data::client::DatabaseClient;
+use oort_ml_rust::data::concept_cache::UserConceptCache;
+use oort_ml_rust::data::scene_cache::SceneCache;
+use oort_ml_rust::data::scraper::ArticleScraper;
+use oort_ml_rust::data::write_behind::WriteBehind;
+use oort_ml_rust::dimensionality::cache::LayoutCache;
+use oort_ml_rust::dimensionality::executor::LayoutPool;
+use oort_ml_rust::dimensionality::hnsw::IndexRegistry;
+use oort_ml_rust::dimensionality::regroup::RegroupStore;
 
 async fn health() -> HttpResponse {
     HttpResponse::Ok().body("ok")
@@ -78,7 +80,7 @@ async fn main() -> std::io::Result<()> {
 
     let concepts_model = Arc::new(ConceptsModel::new(
         llm_backend,
-        Arc::clone(&embedding_backend) as Arc<dyn crate::models::inference::EmbeddingBackend>,
+        Arc::clone(&embedding_backend) as Arc<dyn oort_ml_rust::models::inference::EmbeddingBackend>,
         config.llm_enrichment,
     ));
     let embedding_model = Arc::new(EmbeddingModel::new(embedding_backend));
@@ -90,15 +92,58 @@ async fn main() -> std::io::Result<()> {
             .expect("Failed to connect to database"),
     );
 
+    let health_interval = std::env::var("DB_HEALTH_INTERVAL_SECS")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(30u64);
+    if health_interval > 0 {
+        let db_client = Arc::clone(&db_client);
+        tokio::spawn(async move {
+            let mut interval = tokio::time::interval(Duration::from_secs(health_interval));
+            loop {
+                interval.tick().await;
+                db_client.probe_nodes(Duration::from_secs(2)).await;
+            }
+        });
+    }
+
     let scraper = Arc::new(ArticleScraper::new());
 
     preload_models(&concepts_model, &embedding_model).await;
 
+    let layout_pool = LayoutPool::from_env();
+    let layout_stats = layout_pool.stats();
+    info!(
+        "Layout pool: {} workers, queue capacity {}, {} physics threads",
+        layout_stats.workers, layout_stats.queue_capacity, layout_stats.physics_threads
+    );
+
+    let concept_cache = Arc::new(UserConceptCache::from_env());
+    let write_behind = Arc::new(WriteBehind::from_env(Arc::clone(&db_client), Arc::clone(&concept_cache)));
+    let write_stats = write_behind.stats();
+    info!(
+        "Write-behind queue: {} workers, capacity {}, spool {}",
+        write_stats.workers,
+        write_stats.capacity,
+        if write_stats.spooled { "on" } else { "off" }
+    );
+    let drain_timeout = std::env::var("WRITE_BEHIND_DRAIN_SECS")
+        .ok()
+        .and_then(|v| v.parse().ok())
+        .unwrap_or(30u64);
+
     let app_state = web::Data::new(AppState {
         concepts_model,
         embedding_model,
         db_client,
         scraper,
+        concept_indexes: Arc::new(IndexRegistry::from_env()),
+        layout_pool: Arc::new(layout_pool),
+        layout_cache: Arc::new(LayoutCache::from_env()),
+        regroupings: Arc::new(RegroupStore::from_env()),
+        concept_cache,
+        scene_cache: Arc::new(SceneCache::from_env()),
+        write_behind: Arc::clone(&write_behind),
     });
 
     HttpServer::new(move || {
@@ -113,12 +158,19 @@ async fn main() -> std::io::Result<()> {
             .wrap(cors)
             .app_data(app_state.clone())
             .route("/api/health", web::get().to(health))
+            .route("/api/metrics/layout", web::get().to(get_layout_metrics))
+            .route("/api/metrics/db", web::get().to(get_db_metrics))
             .route("/api/vectorize", web::post().to(process_text))
+            .route("/api/regroup", web::post().to(regroup))
             .route("/api/texts-by-concept", web::get().to(get_texts_by_concept))
             .route("/api/scenes", web::post().to(save_scene))
             .route("/api/scenes/{scene_id}", web::get().to(get_scene))
     })
     .bind((host, port))?
     .run()
-    .await
+    .await?;
+
+    // Writes queued by the last requests finish before exit or stay spooled
+    write_behind.shutdown(Duration::from_secs(drain_timeout)).await;
+    Ok(())
 }
@@ -1,8 +1,10 @@
+use crate::dimensionality::similarity;
 use crate::error::ApiError;
 use crate::models::concepts::nlp::CandidateKeyword;
 use crate::models::concepts::validation;
 use crate::models::inference::{EmbeddingBackend, GenerationParams, LlmBackend};
 use log::{debug, info, warn};
+use ndarray::ArrayView1;
 use regex::Regex;
 use serde::{Deserialize, Serialize};
 use std::collections::HashMap;
@@ -18,7 +20,7 @@ const MIN_EMBEDDING_SIMILARITY: f32 = 0.3;
 /// Max chars of source text to include in the LLM excerpt.
 const LLM_EXCERPT_CHARS: usize = 500;
 
-#[derive(Debug, Clone, Serialize, Deserialize)]
+#[derive(Debug, Clone, PartialEq, Serialize, Deserialize)]
 pub struct Concept {
     pub concept: String,
     pub importance: f32,
@@ -111,12 +113,22 @@ impl ConceptsModel {
                 ApiError::InternalError(format!("Embedding candidates failed: {}", e))
             })?;
 
+        // Score every candidate against the text in one matrix-vector product.
+        // Candidates embedded at another width score 0 instead of failing the request.
+        let matching: Vec<usize> = (0..candidate_embeddings.len())
+            .filter(|&i| candidate_embeddings[i].len() == text_embedding.len())
+            .collect();
+        let candidate_matrix = similarity::normalize_rows(
+            matching.iter().map(|&i| ArrayView1::from(candidate_embeddings[i].as_slice())),
+        )?;
+        let mut similarities = vec![0.0; candidate_embeddings.len()];
+        let scores = similarity::similarities_to(ArrayView1::from(text_embedding.as_slice()), &candidate_matrix);
+        for (&i, &score) in matching.iter().zip(scores.iter()) {
+            similarities[i] = score;
+        }
+
         let mut concepts = Vec::new();
-        for (i, candidate) in candidates.iter().enumerate() {
-            if i >= candidate_embeddings.len() {
-                break;
-            }
-            let similarity = cosine_similarity(&text_embedding, &candidate_embeddings[i]);
+        for (candidate, &similarity) in candidates.iter().zip(similarities.iter()) {
             if similarity >= MIN_EMBEDDING_SIMILARITY {
                 let blended_score = candidate.score * 0.5 + similarity * 0.5;
                 concepts.push(Concept {
@@ -379,20 +391,6 @@ Output ONLY valid JSON matching the required schema."#;
     }
 }
 
-/// Cosine similarity between two vectors.
-fn cosine_similarity(a: &[f32], b: &[f32]) -> f32 {
-    if a.len() != b.len() || a.is_empty() {
-        return 0.0;
-    }
-    let dot: f32 = a.iter().zip(b.iter()).map(|(x, y)| x * y).sum();
-    let norm_a: f32 = a.iter().map(|x| x * x).sum::<f32>().sqrt();
-    let norm_b: f32 = b.iter().map(|x| x * x).sum::<f32>().sqrt();
-    if norm_a == 0.0 || norm_b == 0.0 {
-        return 0.0;
-    }
-    dot / (norm_a * norm_b)
-}
-
 /// Truncates text to at most `max_chars`, respecting UTF-8 char boundaries.
 fn truncate_to_char_boundary(text: &str, max_chars: usize) -> &str {
     if text.len() <= max_chars {
@@ -409,6 +407,7 @@ fn truncate_to_char_boundary(text: &str, max_chars: usize) -> &str {
 mod tests {
     use super::*;
     use crate::models::inference::test_helpers::{MockEmbeddingBackend, MockLlmBackend};
+    use crate::models::inference::InferenceError;
 
     fn mock_embedding_backend() -> Arc<dyn EmbeddingBackend> {
         Arc::new(MockEmbeddingBackend {
@@ -451,6 +450,35 @@ mod tests {
         )
     }
 
+    /// Embeds phrases containing "legacy" at half the width of everything else.
+    struct MixedWidthEmbeddingBackend;
+
+    #[async_trait::async_trait]
+    impl EmbeddingBackend for MixedWidthEmbeddingBackend {
+        async fn embed(&self, _text: &str) -> Result<Vec<f32>, InferenceError> {
+            Ok(vec![0.5; 8])
+        }
+
+        async fn embed_batch(&self, texts: &[String]) -> Result<Vec<Vec<f32>>, InferenceError> {
+            Ok(texts
+                .iter()
+                .map(|t| if t.contains("legacy") { vec![0.5; 4] } else { vec![0.5; 8] })
+                .collect())
+        }
+
+        async fn warmup(&self) -> Result<(), InferenceError> {
+            Ok(())
+        }
+
+        fn model_id(&self) -> &str {
+            "mixed-width"
+        }
+
+        fn embedding_dim(&self) -> usize {
+            8
+        }
+    }
+
     fn sample_candidates() -> Vec<CandidateKeyword> {
         vec![
             CandidateKeyword {
@@ -464,6 +492,30 @@ mod tests {
         ]
     }
 
+    #[tokio::test]
+    async fn test_mismatched_candidate_width_scores_zero() {
+        let model = ConceptsModel::new(
+            Arc::new(MockLlmBackend {
+                response: String::new(),
+                should_fail: false,
+            }),
+            Arc::new(MixedWidthEmbeddingBackend),
+            false,
+        );
+        let mut candidates = sample_candidates();
+        candidates.push(CandidateKeyword {
+            phrase: "legacy vector".to_string(),
+            score: 0.9,
+        });
+
+        let concepts = model
+            .validate_candidates_with_embeddings(&candidates, "Machine learning uses neural networks.")
+            .await
+            .unwrap();
+        assert_eq!(concepts.len(), 2);
+        assert!(concepts.iter().all(|c| !c.concept.contains("legacy")));
+    }
+
     #[tokio::test]
     async fn test_generate_concepts_with_candidates() {
         let model = make_model(
@@ -685,20 +737,6 @@ mod tests {
         assert!(merged.len() <= MAX_CONCEPTS);
     }
 
-    #[test]
-    fn test_cosine_similarity_identical() {
-        let a = vec![1.0, 0.0, 0.0];
-        let b = vec![1.0, 0.0, 0.0];
-        assert!((cosine_similarity(&a, &b) - 1.0).abs() < 0.001);
-    }
-
-    #[test]
-    fn test_cosine_similarity_orthogonal() {
-        let a = vec![1.0, 0.0];
-        let b = vec![0.0, 1.0];
-        assert!(cosine_similarity(&a, &b).abs() < 0.001);
-    }
-
     #[test]
     fn test_truncate_to_char_boundary() {
         assert_eq!(truncate_to_char_boundary("hello", 10), "hello");
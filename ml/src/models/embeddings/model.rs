@@ -15,6 +15,11 @@ impl EmbeddingModel {
         Self { backend }
     }
 
+    /// Identifier of the underlying embedding model.
+    pub fn model_id(&self) -> &str {
+        self.backend.model_id()
+    }
+
     pub async fn get_batch_embeddings(&self, texts: &[String]) -> Result<Vec<Embedding>, ApiError> {
         let valid_texts: Vec<String> = texts
             .iter()